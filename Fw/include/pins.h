@@ -21,6 +21,14 @@
 #define SENSOR4 35
 #define SENSOR5 26  // NON BUTTON
 
+// ==== Danh sách kênh trả về trong STATUS ====
+// Board 8 / 16 kênh: chỉ cần mở rộng 2 danh sách này (tối đa 4 ADC, 16 sensor)
+#define ADC_PIN_LIST     ADC1, ADC2, ADC3
+#define SENSOR_PIN_LIST  SENSOR1, SENSOR2, SENSOR3, SENSOR4, SENSOR5
+
+// Sensor dùng bộ đếm xung phần cứng PCNT (tối đa 8 unit)
+#define PCNT_PIN_LIST    SENSOR1, SENSOR2, SENSOR3, SENSOR4
+
 // ==== Output ====
 #define RELAY1 15
 #define RELAY2 4
@@ -38,9 +46,10 @@
 #define WS2812_PIN 13
 #define NUMPIXELS 1
 
-// ==== RS232 ====
+// ==== RS232 / RS485 (UART2) ====
 #define RXD 23
 #define TXD 22
+#define RS485_DE_PIN SPARE2   // DE + /RE của transceiver nối chung (HIGH = phát)
 
 // ==== HASS ====
 //#define RXD0 DEFAULT
@@ -48,6 +57,6 @@
 
 // ==== SPARE ==== Gần như ko sử dụng
 #define SPARE1 12
-#define SPARE2 2     // Not yet use
+#define SPARE2 2     // RS485_DE_PIN
 
 #endif
@@ -1,345 +1,2194 @@
 #include <Arduino.h>
+#include <stdarg.h>
+#include <algorithm>
 #include <Wire.h>
 #include <Adafruit_GFX.h>
 #include <Adafruit_SSD1306.h>
 #include <Adafruit_ADS1X15.h>
 #include <Adafruit_NeoPixel.h>
+#include <driver/i2s.h>
+#include <driver/adc.h>
+#include <driver/pcnt.h>
+#include <soc/gpio_struct.h>
 
 #include "pins.h"
 
+// ===== Serial command =====
+#define CMD_LINE_MAX 600   // độ dài tối đa 1 dòng lệnh (không tính CR/LF), đủ cho RS485 TX 256 byte hex
+
 // ===== OLED SSD1306 128x64 =====
 #define SCREEN_WIDTH 128
 #define SCREEN_HEIGHT 64
 
-Adafruit_SSD1306 display(SCREEN_WIDTH, SCREEN_HEIGHT, &Wire, -1);
-bool OLED_OK = false;
+#define OLED_PAGES    (SCREEN_HEIGHT / 8)   // 1 page = 8 hàng pixel = 128 byte
+#define OLED_CHUNK    32                    // byte gửi mỗi lần loop rảnh (~1 ms @ 400 kHz)
+
+// I2C chung cho OLED + ADS1115: 400 kHz (fast mode), cả lúc vẽ lẫn sau đó
+#define I2C_CLOCK_HZ  400000
+
+Adafruit_SSD1306 display(SCREEN_WIDTH, SCREEN_HEIGHT, &Wire, -1, I2C_CLOCK_HZ, I2C_CLOCK_HZ);
+bool OLED_OK = false;
+
+// Nội dung 2 dòng trên OLED (buffer cố định, không dùng String)
+#define OLED_LINE_MAX 21
+char oled_l1[OLED_LINE_MAX + 1] = "ESP32 KIT";
+char oled_l2[OLED_LINE_MAX + 1] = "-READY-";
+
+// Mỗi dòng sở hữu 1 dải page riêng → vẽ lại 1 dòng không đụng dòng kia
+struct OledLine
+{
+  char*   text;
+  uint8_t y;           // vị trí con trỏ chữ
+  uint8_t page_first;  // dải page của dòng (kể cả phần chữ xuống dòng)
+  uint8_t page_last;
+};
+
+const OledLine OLED_LINES[] =
+{
+  { oled_l1, 5,  0, 4 },   // y 0..39
+  { oled_l2, 40, 5, 7 },   // y 40..63
+};
+const uint8_t OLED_LINE_COUNT = sizeof(OLED_LINES) / sizeof(OLED_LINES[0]);
+
+uint8_t oled_dirty_lines = 0;   // bit i = dòng i đổi text, chưa vẽ vào buffer
+uint8_t oled_dirty_pages = 0;   // bit p = page p trong buffer chưa gửi lên màn hình
+uint8_t oled_page = 0;          // page / cột đang gửi dở
+uint8_t oled_col  = 0;
+
+// ===== ADS1115 =====
+Adafruit_ADS1115 ads;
+bool ADS_OK = false;
+
+// Đọc nền A0..A3 xoay vòng (không block), lệnh ADS / READ chỉ lấy giá trị cache
+#define ADS_CHANNELS 4
+int16_t  ads_cache[ADS_CHANNELS] = { 0 };
+uint8_t  ads_ch       = 0;        // kênh đang chuyển đổi
+uint32_t ads_start_us = 0;        // lúc bắt đầu chuyển đổi
+uint32_t ads_conv_us  = 8000;     // thời gian 1 lần chuyển đổi theo data rate
+uint16_t ads_sps      = 128;
+const char* ads_gain_name = "1";
+
+// Stream ADS tự động (lệnh ADS STREAM <ms>), 0 = tắt
+uint32_t ads_stream_ms   = 0;
+uint32_t ads_stream_last = 0;
+
+// ===== WS2812 (1 LED) =====
+Adafruit_NeoPixel strip(NUMPIXELS, WS2812_PIN, NEO_GRB + NEO_KHZ800);
+
+// ===== Kênh đọc về trong STATUS (danh sách trong pins.h) =====
+const uint8_t ADC_PINS[]    = { ADC_PIN_LIST };
+const uint8_t SENSOR_PINS[] = { SENSOR_PIN_LIST };
+const uint8_t ADC_COUNT     = sizeof(ADC_PINS);
+const uint8_t SENSOR_COUNT  = sizeof(SENSOR_PINS);
+
+// Đủ cho 4 ADC (mean/min/max) + 16 sensor + 4 kênh ADS + timestamp
+#define STATUS_BUF_SIZE 208
+static_assert(ADC_COUNT <= 4 && SENSOR_COUNT <= 16, "STATUS_BUF_SIZE: tối đa 4 ADC, 16 sensor");
+
+// ===== Trạng thái output thực tế (trả về qua lệnh STATE) =====
+// bit0 = R1 / SIO1, bit1 = R2 / SIO2, ...
+uint16_t relay_mask = 0;
+uint16_t sio_mask   = 0;
+bool     led_on     = false;
+uint8_t  rgb_r = 0, rgb_g = 0, rgb_b = 0;
+
+// ===== Output xung có thời gian (non-blocking, chạy bằng millis) =====
+// Bật pin rồi trả về ngay; pulseUpdate() trong loop() sẽ tắt khi hết giờ.
+struct TimedPulse
+{
+  uint8_t  pin;
+  bool     active;
+  uint32_t start_ms;
+  uint32_t on_ms;
+};
+
+void pulseStart(TimedPulse& p, uint16_t on_ms)
+{
+  digitalWrite(p.pin, HIGH);
+  p.active   = true;
+  p.start_ms = millis();
+  p.on_ms    = on_ms;
+}
+
+void pulseUpdate(TimedPulse& p, uint32_t now)
+{
+  // (now - start) an toàn khi millis() tràn số
+  if (p.active && (uint32_t)(now - p.start_ms) >= p.on_ms)
+  {
+    digitalWrite(p.pin, LOW);
+    p.active = false;
+  }
+}
+
+// ===== Buzzer =====
+TimedPulse buzzer = { BUZZER_PIN, false, 0, 0 };
+
+void beep(uint16_t on_ms = 80) 
+{
+  pulseStart(buzzer, on_ms);   // không delay: lệnh tiếp theo được xử lý ngay
+}
+
+// ===== Update nội dung OLED =====
+// OL1/OL2 chỉ đánh dấu dòng bẩn rồi ACK ngay; vẽ + gửi I2C làm dần trong
+// loop() lúc không có byte serial chờ (oledUpdate), mỗi lần 1 đoạn OLED_CHUNK.
+void oledMarkLine(uint8_t i)
+{
+  oled_dirty_lines |= (1 << i);
+}
+
+// Đánh dấu page p cần gửi lại. Nếu p là page đang gửi dở thì gửi lại từ cột 0:
+// các cột 0..oled_col-1 đã gửi là dữ liệu cũ.
+void oledMarkPage(uint8_t p)
+{
+  oled_dirty_pages |= (1 << p);
+  if (p == oled_page) oled_col = 0;
+}
+
+// Vẽ 1 dòng vào framebuffer (chỉ CPU, không I2C)
+void oledDrawLine(uint8_t i)
+{
+  const OledLine& l = OLED_LINES[i];
+  uint8_t y0 = l.page_first * 8;
+  uint8_t h  = (l.page_last - l.page_first + 1) * 8;
+
+  display.fillRect(0, y0, SCREEN_WIDTH, h, SSD1306_BLACK);
+  display.setTextSize(2);
+  display.setTextColor(SSD1306_WHITE);
+  display.setCursor(0, l.y);
+  display.print(l.text);
+
+  for (uint8_t p = l.page_first; p <= l.page_last; p++)
+  {
+    oledMarkPage(p);
+  }
+}
+
+// Gửi 1 đoạn của page p, cột col.. (SSD1306 horizontal addressing)
+void oledSendChunk(uint8_t p, uint8_t col, uint8_t n)
+{
+  const uint8_t* fb = display.getBuffer() + (uint16_t)p * SCREEN_WIDTH + col;
+
+  Wire.beginTransmission(OLED);
+  Wire.write((uint8_t)0x00);                 // Co = 0, D/C = 0: dãy lệnh
+  Wire.write((uint8_t)SSD1306_PAGEADDR);
+  Wire.write(p);
+  Wire.write(p);
+  Wire.write((uint8_t)SSD1306_COLUMNADDR);
+  Wire.write(col);
+  Wire.write((uint8_t)(SCREEN_WIDTH - 1));
+  Wire.endTransmission();
+
+  Wire.beginTransmission(OLED);
+  Wire.write((uint8_t)0x40);                 // D/C = 1: dữ liệu GDDRAM
+  Wire.write(fb, n);
+  Wire.endTransmission();
+}
+
+void oledUpdate()
+{
+  if (!OLED_OK) return;
+
+  // Vẽ các dòng bẩn (nhanh, chỉ ghi RAM)
+  if (oled_dirty_lines)
+  {
+    for (uint8_t i = 0; i < OLED_LINE_COUNT; i++)
+    {
+      if (oled_dirty_lines & (1 << i)) oledDrawLine(i);
+    }
+    oled_dirty_lines = 0;
+  }
+
+  if (!oled_dirty_pages) return;
+
+  // Tìm page bẩn kế tiếp (page đang gửi dở bị vẽ lại thì oledMarkPage đã đưa oled_col về 0)
+  while (!(oled_dirty_pages & (1 << oled_page)))
+  {
+    oled_page = (oled_page + 1) % OLED_PAGES;
+    oled_col  = 0;
+  }
+
+  uint8_t n = std::min<uint8_t>(OLED_CHUNK, SCREEN_WIDTH - oled_col);
+  oledSendChunk(oled_page, oled_col, n);
+  oled_col += n;
+
+  if (oled_col >= SCREEN_WIDTH)
+  {
+    oled_dirty_pages &= ~(1 << oled_page);
+    oled_col = 0;
+  }
+}
+
+// Vẽ + gửi toàn màn hình ngay (chỉ dùng trong setup)
+void oledRender()
+{
+  if (!OLED_OK) return;
+
+  display.clearDisplay();
+  for (uint8_t i = 0; i < OLED_LINE_COUNT; i++)
+  {
+    oledDrawLine(i);
+  }
+  display.display();
+  oled_dirty_lines = 0;
+  oled_dirty_pages = 0;
+  oled_col = 0;
+}
+
+// ===== Khởi tạo IO =====
+void setupPins() 
+{
+  // Relay outputs
+  pinMode(RELAY1, OUTPUT);
+  pinMode(RELAY2, OUTPUT);
+  pinMode(RELAY3, OUTPUT);
+  pinMode(RELAY4, OUTPUT);
+
+  // Buzzer + spare outputs
+  pinMode(BUZZER_PIN, OUTPUT);
+  pinMode(SPARE1, OUTPUT);
+  pinMode(SPARE2, OUTPUT);    // = RS485_DE_PIN (LED on-board sáng khi đang phát RS485)
+
+
+    // ==== I/O SPARE ====
+  pinMode(SIO1, OUTPUT);
+  pinMode(SIO2, OUTPUT);
+  pinMode(SIO3, OUTPUT);
+  // pinMode(SIO4, OUTPUT);
+
+
+  // Đặt trạng thái mặc định
+  digitalWrite(RELAY1, LOW);
+  digitalWrite(RELAY2, LOW);
+  digitalWrite(RELAY3, LOW);
+  digitalWrite(RELAY4, LOW);
+  digitalWrite(BUZZER_PIN, LOW);
+
+  digitalWrite(SPARE1, LOW);
+  digitalWrite(RS485_DE_PIN, LOW);   // transceiver ở chế độ nhận
+
+  digitalWrite(SIO1, LOW);
+  digitalWrite(SIO2, LOW);
+  digitalWrite(SIO3, LOW);
+  //digitalWrite(SIO4, LOW);
+
+  // Digital inputs
+  for (uint8_t i = 0; i < SENSOR_COUNT; i++)
+  {
+    pinMode(SENSOR_PINS[i], INPUT);
+  }
+
+  // Analog: ADC_PINS dùng analogRead trực tiếp
+}
+
+// ===== Ghép frame vào 1 buffer rồi gửi 1 lần =====
+// Luôn chừa 2 byte cho CR/LF của frameSend()
+size_t frameAppend(char* buf, size_t pos, size_t cap, const char* fmt, ...)
+{
+  if (pos + 2 >= cap) return pos;
+  va_list ap;
+  va_start(ap, fmt);
+  // size = cap-1-pos: khi bị cắt, ký tự cuối ở cap-3 và NUL ở cap-2 (bị CR đè)
+  int n = vsnprintf(buf + pos, cap - 1 - pos, fmt, ap);
+  va_end(ap);
+  if (n < 0) return pos;
+  pos += n;
+  return (pos > cap - 2) ? cap - 2 : pos;   // bị cắt: giữ phần đã ghi, không gửi NUL
+}
+
+// Thêm CR/LF và ghi cả frame bằng 1 lần Serial.write (không bị tách gói USB)
+void frameSend(char* buf, size_t len)
+{
+  buf[len++] = '\r';
+  buf[len++] = '\n';
+  Serial.write((const uint8_t*)buf, len);
+}
+
+// ===== Gửi khối nhị phân (bulk) cho PC =====
+// Header 1 dòng text rồi đúng LEN byte dữ liệu thô:
+//   BIN;TYPE=CAP;...;LEN=<n>;CRC=<hex>;\r\n<n byte>
+// CRC: CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF) của phần dữ liệu.
+// Dữ liệu được đẩy dần theo availableForWrite() trong loop() để không block;
+// trong lúc gửi, loop() không xử lý lệnh mới và không gửi frame text nào khác.
+struct BulkTx
+{
+  const uint8_t* data;
+  size_t         len;
+  size_t         pos;
+  bool           active;
+};
+
+BulkTx bulk_tx = { NULL, 0, 0, false };
+
+uint16_t crc16Ccitt(const uint8_t* data, size_t len, uint16_t crc = 0xFFFF)
+{
+  for (size_t i = 0; i < len; i++)
+  {
+    crc ^= (uint16_t)data[i] << 8;
+    for (uint8_t b = 0; b < 8; b++)
+    {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+    }
+  }
+  return crc;
+}
+
+// fields: phần giữa "BIN;" và "LEN=", VD "TYPE=CAP;CH=1;"
+// data phải còn sống tới khi gửi xong (buffer tĩnh)
+void bulkStart(const char* fields, const uint8_t* data, size_t len)
+{
+  char buf[128];
+  size_t n = frameAppend(buf, 0, sizeof(buf), "BIN;%sLEN=%u;CRC=%04X;",
+                         fields, (unsigned)len, crc16Ccitt(data, len));
+  frameSend(buf, n);
+
+  bulk_tx.data   = data;
+  bulk_tx.len    = len;
+  bulk_tx.pos    = 0;
+  bulk_tx.active = (len > 0);
+}
+
+// Trả về true khi còn đang gửi
+bool bulkUpdate()
+{
+  if (!bulk_tx.active) return false;
+
+  size_t room = Serial.availableForWrite();
+  size_t left = bulk_tx.len - bulk_tx.pos;
+  if (room > left) room = left;
+  if (room > 0)
+  {
+    Serial.write(bulk_tx.data + bulk_tx.pos, room);
+    bulk_tx.pos += room;
+  }
+
+  bulk_tx.active = (bulk_tx.pos < bulk_tx.len);
+  return bulk_tx.active;
+}
+
+// ===== RS485 passthrough (UART2) =====
+// RX: byte trên bus được gom thành frame; frame kết thúc khi bus im lặng > gap
+//     (mặc định 3.5 ký tự như Modbus RTU, tối thiểu 1750 µs) hoặc đủ RS485_FRAME_MAX.
+//     Frame xếp hàng trong RS485_SLOTS slot rồi gửi lên PC bằng bulk:
+//       BIN;TYPE=RS485;t=<micros lúc thấy byte đầu>;[OVF=n;]LEN=n;CRC=xxxx; + n byte
+//     Trong lúc gửi bulk khác (CAP...) vẫn gom byte, frame chờ tới lượt.
+// TX: RS485 TX <hex> – bật DE, chép vào TX buffer UART2 rồi trả lời ngay; DE được
+//     hạ trong rs485TxUpdate() khi tới hạn byte cuối (tính theo baud), không chặn loop().
+// SNIFF: RS485 SNIFF ON – không cắt frame trong FW, mọi burst được ghi kèm thời gian
+//     và gửi gộp (xem sniffUpdate); PC tự ghép frame / đo khoảng lặng.
+#define RS485_BAUD_DEFAULT 9600
+#define RS485_RX_BUF       2048    // buffer driver UART2: giữ byte khi loop đang bận
+#define RS485_TX_BUF       512     // TX buffer UART2 (> FIFO 128 B): write() không chờ
+#define RS485_FRAME_MAX    256
+#define RS485_SLOTS        8
+
+struct Rs485Frame
+{
+  uint32_t t_us;
+  uint16_t len;
+  uint8_t  data[RS485_FRAME_MAX];
+};
+
+struct Rs485Format
+{
+  const char* name;
+  uint32_t    config;
+  uint8_t     bits;     // bit / ký tự trên dây (start + data + parity + stop)
+};
+
+const Rs485Format RS485_FORMATS[] =
+{
+  { "8N1", SERIAL_8N1, 10 },
+  { "8E1", SERIAL_8E1, 11 },
+  { "8O1", SERIAL_8O1, 11 },
+  { "8N2", SERIAL_8N2, 11 },
+};
+const uint8_t RS485_FORMAT_COUNT = sizeof(RS485_FORMATS) / sizeof(RS485_FORMATS[0]);
+
+Rs485Frame rs485_frames[RS485_SLOTS];
+uint8_t    rs485_tail     = 0;       // frame cũ nhất chờ gửi lên PC
+uint8_t    rs485_ready    = 0;       // số frame đã đủ; slot (tail + ready) đang gom byte
+bool       rs485_sending  = false;   // bulk hiện tại là frame ở tail
+uint32_t   rs485_last_us  = 0;       // lúc nhận byte gần nhất
+uint32_t   rs485_baud     = RS485_BAUD_DEFAULT;
+uint8_t    rs485_fmt      = 0;       // chỉ số trong RS485_FORMATS
+uint32_t   rs485_gap_cfg  = 0;       // 0 = tự tính theo baud
+uint32_t   rs485_gap_us   = 0;
+uint32_t   rs485_rx_bytes = 0;
+uint32_t   rs485_tx_bytes = 0;
+uint32_t   rs485_ovf      = 0;       // byte bị bỏ do hết slot
+bool       rs485_tx_busy  = false;   // DE đang bật, chờ byte cuối ra khỏi UART
+uint32_t   rs485_tx_end   = 0;       // micros() dự kiến bit stop cuối cùng
+
+void rs485Begin()
+{
+  // 1 ký tự ~ 11 bit (start + 8 data + parity + stop) → 3.5 ký tự = 38.5 bit
+  rs485_gap_us = rs485_gap_cfg ? rs485_gap_cfg : (uint32_t)(38500000ULL / rs485_baud);
+  if (rs485_gap_us < 1750) rs485_gap_us = 1750;
+
+  Serial2.end();
+  Serial2.setRxBufferSize(RS485_RX_BUF);
+  Serial2.setTxBufferSize(RS485_TX_BUF);
+  Serial2.begin(rs485_baud, RS485_FORMATS[rs485_fmt].config, RXD, TXD);
+  digitalWrite(RS485_DE_PIN, LOW);
+  rs485_tx_busy = false;
+}
+
+// Bắt đầu phát, không chờ (1200 baud x 256 byte ~ 2.1 s). false = TX buffer không đủ chỗ.
+bool rs485Write(const uint8_t* data, size_t len)
+{
+  if ((size_t)Serial2.availableForWrite() < len) return false;
+
+  uint32_t now = micros();
+  uint32_t dur = (uint32_t)((uint64_t)len * RS485_FORMATS[rs485_fmt].bits * 1000000ULL / rs485_baud);
+  // Đang phát dở: frame mới nối đuôi trong buffer, DE giữ nguyên tới hết frame sau
+  uint32_t start = (rs485_tx_busy && (int32_t)(rs485_tx_end - now) > 0) ? rs485_tx_end : now;
+
+  digitalWrite(RS485_DE_PIN, HIGH);
+  Serial2.write(data, len);
+  rs485_tx_end  = start + dur;
+  rs485_tx_busy = true;
+  rs485_tx_bytes += len;
+  return true;
+}
+
+// Tới hạn byte cuối → trả bus. flush() lúc này chỉ chờ phần lẻ còn lại (nếu hạn tính hơi sớm),
+// nên không bao giờ cắt bit stop cuối.
+void rs485TxUpdate()
+{
+  if (!rs485_tx_busy || (int32_t)(micros() - rs485_tx_end) < 0) return;
+  Serial2.flush();
+  digitalWrite(RS485_DE_PIN, LOW);
+  rs485_tx_busy = false;
+}
+
+// ----- Sniff: ghi mọi burst kèm thời gian, gửi gộp bằng bulk -----
+// Payload BIN;TYPE=SNIFF;BAUD=..;t=<micros lúc gửi>;[OVF=n;]LEN=..;CRC=..; là chuỗi bản ghi
+//   u32 t_us (LE, lúc lấy burst khỏi UART ≈ cuối byte cuối) + u16 len + len byte
+// 2 buffer luân phiên: 1 buffer đang gửi lên PC, buffer kia tiếp tục nhận.
+// Bus 115200 bão hòa ~11.5 KB/s → cần LINK 921600 để cổng USB theo kịp.
+#define SNIFF_BUF_SIZE  4096
+#define SNIFF_REC_HDR   6
+#define SNIFF_FLUSH_MS  20     // dữ liệu chờ tối đa 20 ms trước khi gửi
+#define SNIFF_IDLE_MS   250    // bus im lặng: vẫn gửi khối rỗng (có t=) để PC đóng frame cuối
+
+uint8_t  sniff_buf[2][SNIFF_BUF_SIZE];
+uint16_t sniff_len[2]     = { 0, 0 };
+uint8_t  sniff_fill       = 0;       // buffer đang nhận
+bool     sniff_on         = false;
+bool     sniff_sending    = false;   // buffer còn lại đang được bulk gửi
+uint32_t sniff_first_ms   = 0;       // lúc burst đầu tiên vào buffer đang nhận
+uint32_t sniff_last_flush = 0;
+
+void sniffReset()
+{
+  sniff_len[0] = sniff_len[1] = 0;
+  sniff_fill = 0;
+  sniff_sending = false;
+  sniff_last_flush = millis();
+}
+
+void sniffPoll()
+{
+  int avail = Serial2.available();
+  if (avail <= 0) return;
+
+  uint32_t t  = micros();
+  uint16_t& len = sniff_len[sniff_fill];
+  size_t room = SNIFF_BUF_SIZE - len;
+
+  if (room <= SNIFF_REC_HDR)
+  {
+    // Cả 2 buffer đầy (PC / cổng USB không theo kịp): bỏ byte nhưng vẫn đếm
+    for (; avail > 0; avail--)
+    {
+      Serial2.read();
+      rs485_ovf++;
+    }
+    return;
+  }
+
+  if (len == 0) sniff_first_ms = millis();
+  uint8_t* rec = sniff_buf[sniff_fill] + len;
+  uint16_t n = (uint16_t) Serial2.readBytes(rec + SNIFF_REC_HDR,
+                                            std::min<size_t>(avail, room - SNIFF_REC_HDR));
+  memcpy(rec, &t, 4);          // ESP32 little-endian
+  memcpy(rec + 4, &n, 2);
+  len += SNIFF_REC_HDR + n;
+  rs485_rx_bytes += n;
+}
+
+void sniffUpdate()
+{
+  sniffPoll();
+
+  if (sniff_sending)
+  {
+    if (bulk_tx.active) return;
+    sniff_len[sniff_fill ^ 1] = 0;
+    sniff_sending = false;
+  }
+  if (bulk_tx.active) return;
+
+  uint32_t now = millis();
+  uint16_t len = sniff_len[sniff_fill];
+  bool due  = len && ((uint32_t)(now - sniff_first_ms) >= SNIFF_FLUSH_MS || len > SNIFF_BUF_SIZE / 2);
+  bool idle = !len && (uint32_t)(now - sniff_last_flush) >= SNIFF_IDLE_MS;
+  if (!due && !idle) return;
+
+  char fields[64];
+  size_t n = frameAppend(fields, 0, sizeof(fields), "TYPE=SNIFF;BAUD=%lu;t=%lu;",
+                         (unsigned long)rs485_baud, (unsigned long)micros());
+  if (rs485_ovf)
+  {
+    n = frameAppend(fields, n, sizeof(fields), "OVF=%lu;", (unsigned long)rs485_ovf);
+  }
+
+  uint8_t full = sniff_fill;
+  sniff_fill ^= 1;                   // nhận tiếp vào buffer kia (đã gửi xong, rỗng)
+  bulkStart(fields, sniff_buf[full], len);
+  sniff_sending = (len > 0);
+  sniff_last_flush = now;
+}
+
+// Chỉ gom byte, không gửi gì lên PC → gọi được cả khi bulk đang chạy
+void rs485Poll()
+{
+  rs485TxUpdate();
+
+  if (sniff_on)
+  {
+    sniffPoll();
+    return;
+  }
+
+  uint32_t now = micros();
+  int avail = Serial2.available();
+
+  if (rs485_ready >= RS485_SLOTS)
+  {
+    // Hết slot (PC đọc không kịp): bỏ byte nhưng vẫn đếm
+    for (; avail > 0; avail--)
+    {
+      Serial2.read();
+      rs485_ovf++;
+    }
+    return;
+  }
+
+  Rs485Frame& f = rs485_frames[(rs485_tail + rs485_ready) % RS485_SLOTS];
+
+  if (avail > 0)
+  {
+    if (f.len == 0) f.t_us = now;
+    size_t n = std::min<size_t>(avail, RS485_FRAME_MAX - f.len);
+    n = Serial2.readBytes(f.data + f.len, n);
+    f.len += n;
+    rs485_rx_bytes += n;
+    rs485_last_us = now;
+    if (f.len >= RS485_FRAME_MAX) rs485_ready++;   // frame dài: cắt, phần sau sang slot mới
+    return;
+  }
+
+  if (f.len > 0 && (uint32_t)(now - rs485_last_us) > rs485_gap_us)
+  {
+    rs485_ready++;
+  }
+}
+
+void rs485Update()
+{
+  if (sniff_on)
+  {
+    rs485TxUpdate();
+    sniffUpdate();
+    return;
+  }
+
+  rs485Poll();
+
+  // Bulk của frame trước đã gửi xong → trả slot
+  if (rs485_sending)
+  {
+    if (bulk_tx.active) return;
+    rs485_frames[rs485_tail].len = 0;
+    rs485_tail = (rs485_tail + 1) % RS485_SLOTS;
+    rs485_ready--;
+    rs485_sending = false;
+  }
+
+  if (rs485_ready == 0 || bulk_tx.active) return;
+
+  const Rs485Frame& f = rs485_frames[rs485_tail];
+  char fields[48];
+  size_t n = frameAppend(fields, 0, sizeof(fields), "TYPE=RS485;t=%lu;", (unsigned long)f.t_us);
+  if (rs485_ovf)
+  {
+    n = frameAppend(fields, n, sizeof(fields), "OVF=%lu;", (unsigned long)rs485_ovf);
+  }
+  bulkStart(fields, f.data, f.len);
+  rs485_sending = true;
+}
+
+// ===== Lấy mẫu ADC nội theo timer phần cứng =====
+// Timer ISR chỉ đánh thức sampleTask (analogRead không gọi được trong ISR),
+// sampleTask đọc ADC_PINS và cộng dồn mean/min/max cho tới lần READ kế tiếp.
+#define SAMPLE_RATE_DEFAULT 1000   // Hz
+#define SAMPLE_RATE_MAX     5000   // Hz
+
+struct AdcAcc
+{
+  uint64_t sum;
+  uint16_t min;
+  uint16_t max;
+};
+
+AdcAcc       adc_acc[ADC_COUNT];
+uint32_t     adc_acc_n      = 0;
+int          adc_last[ADC_COUNT] = { 0 };   // giá trị ADC= gửi lần trước
+bool         cap_running    = false;        // CAP/TRIG đang giữ ADC1 qua I2S
+uint32_t     sample_rate_hz = 0;      // 0 = tắt, READ đọc analogRead trực tiếp
+hw_timer_t*  sample_timer   = NULL;
+TaskHandle_t sample_task    = NULL;
+portMUX_TYPE adc_acc_mux    = portMUX_INITIALIZER_UNLOCKED;
+
+// Gọi khi đang giữ adc_acc_mux
+void adcAccReset()
+{
+  for (uint8_t i = 0; i < ADC_COUNT; i++)
+  {
+    adc_acc[i].sum = 0;
+    adc_acc[i].min = 0xFFFF;
+    adc_acc[i].max = 0;
+  }
+  adc_acc_n = 0;
+}
+
+void IRAM_ATTR onSampleTimer()
+{
+  BaseType_t woken = pdFALSE;
+  vTaskNotifyGiveFromISR(sample_task, &woken);
+  if (woken) portYIELD_FROM_ISR();
+}
+
+void sampleTask(void* arg)
+{
+  uint16_t v[ADC_COUNT];
+  for (;;)
+  {
+    ulTaskNotifyTake(pdTRUE, portMAX_DELAY);
+
+    for (uint8_t i = 0; i < ADC_COUNT; i++)
+    {
+      v[i] = analogRead(ADC_PINS[i]);
+    }
+
+    portENTER_CRITICAL(&adc_acc_mux);
+    for (uint8_t i = 0; i < ADC_COUNT; i++)
+    {
+      adc_acc[i].sum += v[i];
+      if (v[i] < adc_acc[i].min) adc_acc[i].min = v[i];
+      if (v[i] > adc_acc[i].max) adc_acc[i].max = v[i];
+    }
+    adc_acc_n++;
+    portEXIT_CRITICAL(&adc_acc_mux);
+  }
+}
+
+void samplerSetRate(uint32_t hz)
+{
+  if (sample_timer == NULL)
+  {
+    sample_timer = timerBegin(0, 80, true);   // 80 MHz / 80 = tick 1 µs
+    timerAttachInterrupt(sample_timer, &onSampleTimer, true);
+  }
+  timerAlarmDisable(sample_timer);
+
+  portENTER_CRITICAL(&adc_acc_mux);
+  adcAccReset();
+  portEXIT_CRITICAL(&adc_acc_mux);
+
+  sample_rate_hz = hz;
+  if (hz == 0) return;
+
+  timerAlarmWrite(sample_timer, 1000000UL / hz, true);
+  timerAlarmEnable(sample_timer);
+}
+
+// ===== Sự kiện thay đổi Sensor (ngắt GPIO) =====
+// ISR chỉ ghi {sensor, mức, micros} vào hàng đợi vòng; loop() gửi
+//   EVT;S3=1;t=<micros>;
+// ngay khi có cạnh, không cần PC poll READ. Tràn hàng đợi → EVT;OVF=n;
+#define EVT_QUEUE_SIZE 64           // lũy thừa của 2
+
+struct SensorEvent
+{
+  uint8_t  idx;                     // 0 = S1
+  uint8_t  level;
+  uint32_t t_us;
+};
+
+SensorEvent  evt_queue[EVT_QUEUE_SIZE];
+volatile uint16_t evt_head = 0;     // ISR ghi
+volatile uint16_t evt_tail = 0;     // loop() đọc
+volatile uint32_t evt_overflow = 0;
+bool         evt_enabled = false;
+portMUX_TYPE evt_mux = portMUX_INITIALIZER_UNLOCKED;
+
+// Đọc mức GPIO trực tiếp từ thanh ghi (an toàn trong ISR)
+inline uint8_t IRAM_ATTR gpioFastRead(uint8_t pin)
+{
+  return pin < 32 ? (GPIO.in >> pin) & 1 : (GPIO.in1.val >> (pin - 32)) & 1;
+}
+
+void IRAM_ATTR onSensorEdge(void* arg)
+{
+  uint8_t idx = (uint8_t)(uintptr_t)arg;
+  uint32_t t = micros();
+
+  portENTER_CRITICAL_ISR(&evt_mux);
+  uint16_t next = (evt_head + 1) & (EVT_QUEUE_SIZE - 1);
+  if (next == evt_tail)
+  {
+    evt_overflow++;
+  }
+  else
+  {
+    evt_queue[evt_head].idx   = idx;
+    evt_queue[evt_head].level = gpioFastRead(SENSOR_PINS[idx]);
+    evt_queue[evt_head].t_us  = t;
+    evt_head = next;
+  }
+  portEXIT_CRITICAL_ISR(&evt_mux);
+}
+
+void sensorEventsEnable(bool on)
+{
+  for (uint8_t i = 0; i < SENSOR_COUNT; i++)
+  {
+    if (on) attachInterruptArg(SENSOR_PINS[i], onSensorEdge, (void*)(uintptr_t)i, CHANGE);
+    else    detachInterrupt(SENSOR_PINS[i]);
+  }
+
+  portENTER_CRITICAL(&evt_mux);
+  evt_head = evt_tail = 0;
+  evt_overflow = 0;
+  portEXIT_CRITICAL(&evt_mux);
+  evt_enabled = on;
+}
+
+// Gọi trong loop(): gửi các sự kiện đã có trong hàng đợi
+void sensorEventsUpdate()
+{
+  if (!evt_enabled) return;
+
+  while (evt_tail != evt_head)
+  {
+    SensorEvent e = evt_queue[evt_tail];
+    evt_tail = (evt_tail + 1) & (EVT_QUEUE_SIZE - 1);
+
+    char buf[40];
+    size_t n = frameAppend(buf, 0, sizeof(buf), "EVT;S%u=%u;t=%lu;",
+                           e.idx + 1, e.level, (unsigned long)e.t_us);
+    frameSend(buf, n);
+  }
+
+  if (evt_overflow)
+  {
+    portENTER_CRITICAL(&evt_mux);
+    uint32_t lost = evt_overflow;
+    evt_overflow = 0;
+    portEXIT_CRITICAL(&evt_mux);
+
+    char buf[32];
+    size_t n = frameAppend(buf, 0, sizeof(buf), "EVT;OVF=%lu;", (unsigned long)lost);
+    frameSend(buf, n);
+  }
+}
+
+// ===== Đếm xung / đo tần số bằng PCNT =====
+// Mỗi pin trong PCNT_PIN_LIST dùng 1 unit PCNT đếm cạnh lên (phần cứng,
+// không tốn CPU). Counter 16 bit: khi chạm CNT_H_LIM thì ISR cộng dồn sang
+// cnt_overflow và counter tự về 0. Tần số = số xung / cửa sổ cnt_gate_ms.
+#define CNT_H_LIM    30000
+#define CNT_FILTER   100            // bỏ xung < 100 chu kỳ APB (1.25 µs)
+
+const uint8_t CNT_PINS[]  = { PCNT_PIN_LIST };
+const uint8_t CNT_COUNT   = sizeof(CNT_PINS);
+static_assert(CNT_COUNT <= 8, "ESP32 chỉ có 8 unit PCNT");
+
+volatile uint32_t cnt_overflow[CNT_COUNT] = { 0 };
+uint32_t cnt_gate_start[CNT_COUNT] = { 0 };   // tổng số xung đầu cửa sổ
+float    cnt_freq[CNT_COUNT]       = { 0 };
+uint32_t cnt_gate_ms     = 1000;
+uint32_t cnt_gate_last   = 0;
+uint32_t cnt_stream_ms   = 0;                 // 0 = không stream
+uint32_t cnt_stream_last = 0;
+
+void IRAM_ATTR onPcntLimit(void* arg)
+{
+  cnt_overflow[(uintptr_t)arg] += CNT_H_LIM;
+}
+
+// Tổng số xung (32 bit) của kênh i
+uint32_t cntRead(uint8_t i)
+{
+  int16_t  v;
+  uint32_t ovf;
+  // Đọc lại nếu ISR tràn chen vào giữa 2 lần đọc
+  do
+  {
+    ovf = cnt_overflow[i];
+    pcnt_get_counter_value((pcnt_unit_t)i, &v);
+  } while (ovf != cnt_overflow[i]);
+  return ovf + (uint16_t)v;
+}
+
+void cntReset()
+{
+  for (uint8_t i = 0; i < CNT_COUNT; i++)
+  {
+    pcnt_unit_t u = (pcnt_unit_t)i;
+    pcnt_counter_pause(u);
+    pcnt_counter_clear(u);
+    cnt_overflow[i]   = 0;
+    cnt_gate_start[i] = 0;
+    cnt_freq[i]       = 0;
+    pcnt_counter_resume(u);
+  }
+  cnt_gate_last = millis();
+}
+
+void cntSetup()
+{
+  pcnt_isr_service_install(0);
+  for (uint8_t i = 0; i < CNT_COUNT; i++)
+  {
+    pcnt_unit_t u = (pcnt_unit_t)i;
+    pcnt_config_t cfg = {};
+    cfg.pulse_gpio_num = CNT_PINS[i];
+    cfg.ctrl_gpio_num  = PCNT_PIN_NOT_USED;
+    cfg.lctrl_mode     = PCNT_MODE_KEEP;
+    cfg.hctrl_mode     = PCNT_MODE_KEEP;
+    cfg.pos_mode       = PCNT_COUNT_INC;    // đếm cạnh lên
+    cfg.neg_mode       = PCNT_COUNT_DIS;
+    cfg.counter_h_lim  = CNT_H_LIM;
+    cfg.counter_l_lim  = 0;
+    cfg.unit           = u;
+    cfg.channel        = PCNT_CHANNEL_0;
+    pcnt_unit_config(&cfg);
+
+    pcnt_set_filter_value(u, CNT_FILTER);
+    pcnt_filter_enable(u);
+    pcnt_event_enable(u, PCNT_EVT_H_LIM);
+    pcnt_isr_handler_add(u, onPcntLimit, (void*)(uintptr_t)i);
+  }
+  cntReset();
+}
+
+// CNT;C=c1,c2,..;F=f1,f2,..;t=<micros>;   (F: Hz, cửa sổ cnt_gate_ms gần nhất)
+void sendCounters()
+{
+  char buf[160];
+  size_t n = frameAppend(buf, 0, sizeof(buf), "CNT;C=");
+  for (uint8_t i = 0; i < CNT_COUNT; i++)
+  {
+    n = frameAppend(buf, n, sizeof(buf), i ? ",%lu" : "%lu", (unsigned long)cntRead(i));
+  }
+  n = frameAppend(buf, n, sizeof(buf), ";F=");
+  for (uint8_t i = 0; i < CNT_COUNT; i++)
+  {
+    n = frameAppend(buf, n, sizeof(buf), i ? ",%.2f" : "%.2f", cnt_freq[i]);
+  }
+  n = frameAppend(buf, n, sizeof(buf), ";t=%lu;", (unsigned long)micros());
+  frameSend(buf, n);
+}
+
+// Gọi trong loop(): đóng cửa sổ đo tần số và stream CNT nếu bật
+void cntUpdate(uint32_t now)
+{
+  uint32_t elapsed = now - cnt_gate_last;
+  if (elapsed >= cnt_gate_ms)
+  {
+    for (uint8_t i = 0; i < CNT_COUNT; i++)
+    {
+      uint32_t total = cntRead(i);
+      cnt_freq[i] = (total - cnt_gate_start[i]) * 1000.0f / elapsed;
+      cnt_gate_start[i] = total;
+    }
+    cnt_gate_last = now;
+  }
+
+  if (cnt_stream_ms && (uint32_t)(now - cnt_stream_last) >= cnt_stream_ms)
+  {
+    cnt_stream_last = now;
+    sendCounters();
+  }
+}
+
+// ===== Gửi STATUS cho PC =====
+// ADC nội: mean/min/max của các mẫu theo timer từ lần READ trước
+//          (SAMPLE 0 hoặc chưa có mẫu → 1 lần analogRead, không có MIN/MAX/N)
+// Sensor đọc trực tiếp; ADS lấy từ cache (không chờ I2C)
+struct StatusSnapshot
+{
+  uint32_t t_us;              // thời điểm chốt mẫu, PC dùng làm trục thời gian
+  uint32_t count;             // số mẫu timer trong chu kỳ (0 = không có MIN/MAX)
+  int      adc[ADC_COUNT];
+  uint16_t min[ADC_COUNT];
+  uint16_t max[ADC_COUNT];
+  uint8_t  s[SENSOR_COUNT];
+  int16_t  ads[ADS_CHANNELS];
+};
+
+void takeStatus(StatusSnapshot& st)
+{
+  AdcAcc snap[ADC_COUNT];
+
+  st.t_us = micros();
+  portENTER_CRITICAL(&adc_acc_mux);
+  memcpy(snap, adc_acc, sizeof(snap));
+  st.count = adc_acc_n;
+  adcAccReset();
+  portEXIT_CRITICAL(&adc_acc_mux);
+
+  for (uint8_t i = 0; i < ADC_COUNT; i++)
+  {
+    // Đang CAP/TRIG (I2S giữ ADC1): dùng giá trị gần nhất, không analogRead
+    if (st.count)          adc_last[i] = (int)(snap[i].sum / st.count);
+    else if (!cap_running) adc_last[i] = analogRead(ADC_PINS[i]);
+    st.adc[i] = adc_last[i];
+    st.min[i] = snap[i].min;
+    st.max[i] = snap[i].max;
+  }
+  for (uint8_t i = 0; i < SENSOR_COUNT; i++)
+  {
+    st.s[i] = digitalRead(SENSOR_PINS[i]);
+  }
+  memcpy(st.ads, ads_cache, sizeof(st.ads));
+}
+
+// Frame đầy đủ (keyframe):
+//   STATUS;ADC=a1,a2,a3;MIN=..;MAX=..;N=n;S=s1,s2,s3,s4,s5;ADS=a0,a1,a2,a3;t=<micros>;
+// compact = true (lệnh READ M, cho board 8/16 kênh):
+//   S=... được thay bằng SM=001F;   (SM: bitmask hex, bit0 = S1)
+void sendStatusFull(const StatusSnapshot& st, bool compact)
+{
+  char buf[STATUS_BUF_SIZE];
+  size_t n = frameAppend(buf, 0, sizeof(buf), "STATUS;ADC=");
+
+  for (uint8_t i = 0; i < ADC_COUNT; i++)
+  {
+    n = frameAppend(buf, n, sizeof(buf), i ? ",%d" : "%d", st.adc[i]);
+  }
+  n = frameAppend(buf, n, sizeof(buf), ";");
+
+  if (st.count)
+  {
+    n = frameAppend(buf, n, sizeof(buf), "MIN=");
+    for (uint8_t i = 0; i < ADC_COUNT; i++)
+    {
+      n = frameAppend(buf, n, sizeof(buf), i ? ",%u" : "%u", st.min[i]);
+    }
+    n = frameAppend(buf, n, sizeof(buf), ";MAX=");
+    for (uint8_t i = 0; i < ADC_COUNT; i++)
+    {
+      n = frameAppend(buf, n, sizeof(buf), i ? ",%u" : "%u", st.max[i]);
+    }
+    n = frameAppend(buf, n, sizeof(buf), ";N=%lu;", (unsigned long)st.count);
+  }
+
+  if (compact)
+  {
+    uint16_t sm = 0;
+    for (uint8_t i = 0; i < SENSOR_COUNT; i++)
+    {
+      if (st.s[i]) sm |= (1 << i);
+    }
+    n = frameAppend(buf, n, sizeof(buf), "SM=%04X;", sm);
+  }
+  else
+  {
+    n = frameAppend(buf, n, sizeof(buf), "S=");
+    for (uint8_t i = 0; i < SENSOR_COUNT; i++)
+    {
+      n = frameAppend(buf, n, sizeof(buf), i ? ",%d" : "%d", st.s[i]);
+    }
+    n = frameAppend(buf, n, sizeof(buf), ";");
+  }
+
+  if (ADS_OK)
+  {
+    n = frameAppend(buf, n, sizeof(buf), "ADS=%d,%d,%d,%d;",
+                    st.ads[0], st.ads[1], st.ads[2], st.ads[3]);
+  }
+
+  n = frameAppend(buf, n, sizeof(buf), "t=%lu;", (unsigned long)st.t_us);
+  frameSend(buf, n);
+}
+
+// ===== STATUS dạng delta (lệnh DELTA) =====
+// Chỉ gửi kênh thay đổi so với lần gửi trước:
+//   DST;ADC1=2010;S3=1;ADS0=12345;t=<micros>;
+// ADC / ADS: |thay đổi| > delta_deadband; Sensor: mọi thay đổi.
+// Mỗi delta_key_ms gửi 1 frame STATUS đầy đủ (keyframe) để PC đồng bộ lại.
+bool     delta_on        = false;
+uint16_t delta_deadband  = 8;
+uint32_t delta_key_ms    = 2000;
+uint32_t delta_key_last  = 0;
+bool     delta_need_key  = true;
+int      sent_adc[ADC_COUNT];
+uint8_t  sent_s[SENSOR_COUNT];
+int16_t  sent_ads[ADS_CHANNELS];
+
+void rememberSent(const StatusSnapshot& st)
+{
+  memcpy(sent_adc, st.adc, sizeof(sent_adc));
+  memcpy(sent_s,   st.s,   sizeof(sent_s));
+  memcpy(sent_ads, st.ads, sizeof(sent_ads));
+}
+
+// Trả về false nếu không có gì thay đổi và không bắt buộc gửi
+bool sendStatusDelta(const StatusSnapshot& st, bool always)
+{
+  char buf[STATUS_BUF_SIZE];
+  size_t n = frameAppend(buf, 0, sizeof(buf), "DST;");
+  bool changed = false;
+
+  for (uint8_t i = 0; i < ADC_COUNT; i++)
+  {
+    if (abs(st.adc[i] - sent_adc[i]) > delta_deadband)
+    {
+      n = frameAppend(buf, n, sizeof(buf), "ADC%u=%d;", i + 1, st.adc[i]);
+      sent_adc[i] = st.adc[i];
+      changed = true;
+    }
+  }
+  for (uint8_t i = 0; i < SENSOR_COUNT; i++)
+  {
+    if (st.s[i] != sent_s[i])
+    {
+      n = frameAppend(buf, n, sizeof(buf), "S%u=%u;", i + 1, st.s[i]);
+      sent_s[i] = st.s[i];
+      changed = true;
+    }
+  }
+  if (ADS_OK)
+  {
+    for (uint8_t i = 0; i < ADS_CHANNELS; i++)
+    {
+      if (abs(st.ads[i] - sent_ads[i]) > delta_deadband)
+      {
+        n = frameAppend(buf, n, sizeof(buf), "ADS%u=%d;", i, st.ads[i]);
+        sent_ads[i] = st.ads[i];
+        changed = true;
+      }
+    }
+  }
+
+  if (!changed && !always) return false;
+
+  n = frameAppend(buf, n, sizeof(buf), "t=%lu;", (unsigned long)st.t_us);
+  frameSend(buf, n);
+  return true;
+}
+
+// always = true: trả lời READ (luôn có 1 frame); false: stream (bỏ nếu không đổi)
+void sendStatus(bool compact = false, bool always = true)
+{
+  StatusSnapshot st;
+  takeStatus(st);
+
+  uint32_t now = millis();
+  if (!delta_on || delta_need_key || (uint32_t)(now - delta_key_last) >= delta_key_ms)
+  {
+    sendStatusFull(st, compact);
+    rememberSent(st);
+    delta_key_last = now;
+    delta_need_key = false;
+    return;
+  }
+  sendStatusDelta(st, always);
+}
+
+// Stream STATUS (lệnh READ STREAM <ms>), 0 = tắt
+uint32_t status_stream_ms   = 0;
+uint32_t status_stream_last = 0;
+
+void statusStreamUpdate(uint32_t now)
+{
+  if (status_stream_ms == 0) return;
+  if (bulk_tx.active) return;   // đang giữa header BIN và payload (SNIFF/RS485/CAP): để kỳ sau
+  if ((uint32_t)(now - status_stream_last) < status_stream_ms) return;
+  status_stream_last = now;
+  sendStatus(false, false);
+}
+
+// ===== ADS1115: chuyển đổi nền xoay vòng A0..A3 =====
+const uint16_t ADS_MUX[ADS_CHANNELS] =
+{
+  ADS1X15_REG_CONFIG_MUX_SINGLE_0,
+  ADS1X15_REG_CONFIG_MUX_SINGLE_1,
+  ADS1X15_REG_CONFIG_MUX_SINGLE_2,
+  ADS1X15_REG_CONFIG_MUX_SINGLE_3,
+};
+
+struct AdsRate { uint16_t sps; uint16_t code; };
+const AdsRate ADS_RATES[] =
+{
+  { 8,   RATE_ADS1115_8SPS   }, { 16,  RATE_ADS1115_16SPS  },
+  { 32,  RATE_ADS1115_32SPS  }, { 64,  RATE_ADS1115_64SPS  },
+  { 128, RATE_ADS1115_128SPS }, { 250, RATE_ADS1115_250SPS },
+  { 475, RATE_ADS1115_475SPS }, { 860, RATE_ADS1115_860SPS },
+};
+
+struct AdsGain { const char* name; adsGain_t gain; };
+const AdsGain ADS_GAINS[] =
+{
+  { "2/3", GAIN_TWOTHIRDS },   // +/-6.144V
+  { "1",   GAIN_ONE       },   // +/-4.096V
+  { "2",   GAIN_TWO       },   // +/-2.048V
+  { "4",   GAIN_FOUR      },   // +/-1.024V
+  { "8",   GAIN_EIGHT     },   // +/-0.512V
+  { "16",  GAIN_SIXTEEN   },   // +/-0.256V
+};
+
+void adsStartConversion()
+{
+  ads.startADCReading(ADS_MUX[ads_ch], false);
+  ads_start_us = micros();
+}
+
+// Gọi trong loop(): chỉ hỏi I2C khi đã hết thời gian chuyển đổi dự kiến
+void adsUpdate()
+{
+  if (!ADS_OK) return;
+  if ((uint32_t)(micros() - ads_start_us) < ads_conv_us) return;
+  if (!ads.conversionComplete()) return;
+
+  ads_cache[ads_ch] = ads.getLastConversionResults();
+  ads_ch = (ads_ch + 1) % ADS_CHANNELS;
+  adsStartConversion();
+}
+
+bool adsSetRate(uint16_t sps)
+{
+  for (uint8_t i = 0; i < sizeof(ADS_RATES) / sizeof(ADS_RATES[0]); i++)
+  {
+    if (ADS_RATES[i].sps == sps)
+    {
+      ads.setDataRate(ADS_RATES[i].code);
+      ads_sps     = sps;
+      ads_conv_us = 1000000UL / sps + 200;   // + biên cho dao động RC nội
+      return true;
+    }
+  }
+  return false;
+}
+
+bool adsSetGain(const char* name)
+{
+  for (uint8_t i = 0; i < sizeof(ADS_GAINS) / sizeof(ADS_GAINS[0]); i++)
+  {
+    if (strcmp(ADS_GAINS[i].name, name) == 0)
+    {
+      ads.setGain(ADS_GAINS[i].gain);
+      ads_gain_name = ADS_GAINS[i].name;
+      return true;
+    }
+  }
+  return false;
+}
+
+// ===== Gửi giá trị ADS1115 A0..A3 (cache) cho PC =====
+// Format: ADS;A0=xxxx;A1=yyyy;A2=zzzz;A3=wwww;t=<micros>;
+void sendAds() 
+{
+  char buf[80];
+  size_t n = frameAppend(buf, 0, sizeof(buf), "ADS;");
+  for (uint8_t i = 0; i < ADS_CHANNELS; i++)
+  {
+    n = frameAppend(buf, n, sizeof(buf), "A%u=%d;", i, ads_cache[i]);
+  }
+  n = frameAppend(buf, n, sizeof(buf), "t=%lu;", (unsigned long)micros());
+  frameSend(buf, n);
+}
+
+// ===== Capture tốc độ cao: ADC built-in qua I2S + DMA =====
+// Chỉ ADC1 đi được qua I2S: ADC1 (GPIO32) / ADC2 (GPIO33) OK,
+// ADC3 (GPIO25) thuộc khối ADC2 của chip → không capture được.
+//
+// cap_buf là buffer vòng N mẫu. CAP: coi như trigger ngay mẫu đầu (PRE = 0).
+// TRIG: ghi vòng liên tục, khi tín hiệu cắt LEVEL theo cạnh đã chọn thì
+// lấy thêm N - PRE - 1 mẫu rồi "đóng băng" và gửi cả cửa sổ về PC.
+#define CAP_MAX_SAMPLES 8192        // 16 KB RAM
+#define CAP_RATE_MIN    1000        // Hz
+#define CAP_RATE_MAX    100000      // Hz
+#define CAP_CHUNK       256         // mẫu / lần đọc DMA (chẵn: giữ cặp mẫu)
+
+uint16_t cap_buf[CAP_MAX_SAMPLES];
+bool     cap_trig_mode = false;     // false = CAP, true = TRIG
+bool     cap_triggered = false;
+bool     cap_rising    = true;
+uint16_t cap_level     = 0;
+uint16_t cap_prev      = 0;
+uint8_t  cap_ch        = 0;         // 1..ADC_COUNT
+uint32_t cap_n         = 0;         // độ dài cửa sổ
+uint32_t cap_pre       = 0;         // số mẫu trước điểm trigger
+uint32_t cap_rate      = 0;
+uint32_t cap_head      = 0;         // vị trí ghi tiếp theo trong buffer vòng
+uint32_t cap_filled    = 0;
+uint32_t cap_post_left = 0;
+
+// GPIO → kênh ADC1 (-1 nếu pin không thuộc ADC1)
+int adc1ChannelForPin(uint8_t pin)
+{
+  switch (pin)
+  {
+    case 36: return ADC1_CHANNEL_0;
+    case 39: return ADC1_CHANNEL_3;
+    case 32: return ADC1_CHANNEL_4;
+    case 33: return ADC1_CHANNEL_5;
+    case 34: return ADC1_CHANNEL_6;
+    case 35: return ADC1_CHANNEL_7;
+    default: return -1;
+  }
+}
+
+const char* capBegin(uint8_t ch, uint32_t n, uint32_t rate)
+{
+  if (cap_running || bulk_tx.active)                return "BUSY";
+  if (ch < 1 || ch > ADC_COUNT)                     return "BAD_CH";
+  if (n < 1 || n > CAP_MAX_SAMPLES)                 return "BAD_N";
+  if (rate < CAP_RATE_MIN || rate > CAP_RATE_MAX)   return "BAD_RATE";
+
+  int adc_ch = adc1ChannelForPin(ADC_PINS[ch - 1]);
+  if (adc_ch < 0)                                   return "NOT_ADC1";
+
+  // I2S chiếm ADC1 → tạm dừng lấy mẫu theo timer, bật lại khi xong
+  timerAlarmDisable(sample_timer);
+
+  i2s_config_t cfg = {};
+  cfg.mode                 = (i2s_mode_t)(I2S_MODE_MASTER | I2S_MODE_RX | I2S_MODE_ADC_BUILT_IN);
+  cfg.sample_rate          = rate;
+  cfg.bits_per_sample      = I2S_BITS_PER_SAMPLE_16BIT;
+  cfg.channel_format       = I2S_CHANNEL_FMT_ONLY_LEFT;
+  cfg.communication_format = I2S_COMM_FORMAT_STAND_I2S;
+  cfg.intr_alloc_flags     = 0;
+  cfg.dma_buf_count        = 4;
+  cfg.dma_buf_len          = 512;
+  cfg.use_apll             = false;
+
+  if (i2s_driver_install(I2S_NUM_0, &cfg, 0, NULL) != ESP_OK)
+  {
+    samplerSetRate(sample_rate_hz);
+    return "I2S_FAIL";
+  }
+  i2s_set_adc_mode(ADC_UNIT_1, (adc1_channel_t)adc_ch);
+  adc1_config_channel_atten((adc1_channel_t)adc_ch, ADC_ATTEN_DB_11);
+  i2s_adc_enable(I2S_NUM_0);
+
+  cap_running   = true;
+  cap_ch        = ch;
+  cap_n         = n;
+  cap_rate      = rate;
+  cap_head      = 0;
+  cap_filled    = 0;
+  return NULL;
+}
+
+void capEnd()
+{
+  if (!cap_running) return;
+  i2s_adc_disable(I2S_NUM_0);
+  i2s_driver_uninstall(I2S_NUM_0);
+  cap_running = false;
+  samplerSetRate(sample_rate_hz);
+}
+
+const char* capStart(uint8_t ch, uint32_t n, uint32_t rate)
+{
+  const char* err = capBegin(ch, n, rate);
+  if (err) return err;
+  cap_trig_mode = false;
+  cap_triggered = true;
+  cap_pre       = 0;
+  cap_post_left = n;
+  return NULL;
+}
+
+const char* trigStart(uint8_t ch, uint16_t level, bool rising, uint8_t pre_pct,
+                      uint32_t n, uint32_t rate)
+{
+  if (pre_pct > 100) return "BAD_PRE";
+  const char* err = capBegin(ch, n, rate);
+  if (err) return err;
+  cap_trig_mode = true;
+  cap_triggered = false;
+  cap_level     = level;
+  cap_rising    = rising;
+  cap_pre       = (uint32_t)((uint64_t)n * pre_pct / 100);
+  if (cap_pre >= n) cap_pre = n - 1;   // luôn giữ mẫu trigger trong cửa sổ
+  cap_post_left = 0;
+  cap_prev      = rising ? 0xFFFF : 0;   // mẫu đầu không tạo cạnh giả
+  return NULL;
+}
+
+// Đưa 1 mẫu vào buffer vòng; trả về true khi cửa sổ đã đủ
+bool capPush(uint16_t v)
+{
+  cap_buf[cap_head] = v;
+  cap_head = (cap_head + 1 == cap_n) ? 0 : cap_head + 1;
+  if (cap_filled < cap_n) cap_filled++;
+
+  if (!cap_triggered)
+  {
+    bool edge = cap_rising ? (cap_prev < cap_level && v >= cap_level)
+                           : (cap_prev > cap_level && v <= cap_level);
+    cap_prev = v;
+    if (!edge || cap_filled < cap_pre + 1) return false;
+    cap_triggered = true;
+    cap_post_left = cap_n - cap_pre - 1;    // mẫu trigger đã nằm trong buffer
+    return cap_post_left == 0;
+  }
+
+  return --cap_post_left == 0;
+}
+
+// Gọi trong loop(): lấy dữ liệu DMA có sẵn (không chờ), đủ cửa sổ thì gửi bulk
+void capUpdate()
+{
+  if (!cap_running) return;
+
+  uint16_t chunk[CAP_CHUNK];
+  size_t got = 0;
+  i2s_read(I2S_NUM_0, chunk, sizeof(chunk), &got, 0);
+  size_t count = got / 2;
+
+  bool done = false;
+  for (size_t i = 0; i + 1 < count && !done; i += 2)
+  {
+    // I2S ADC trả từng cặp mẫu bị đảo thứ tự; 4 bit cao là số kênh
+    done = capPush(chunk[i + 1] & 0x0FFF);
+    if (!done) done = capPush(chunk[i] & 0x0FFF);
+  }
+  if (!done) return;
+
+  capEnd();
+
+  // Buffer vòng đã đầy: mẫu cũ nhất nằm ở cap_head → xoay về đầu mảng
+  std::rotate(cap_buf, cap_buf + cap_head, cap_buf + cap_n);
+
+  char fields[96];
+  if (cap_trig_mode)
+  {
+    snprintf(fields, sizeof(fields),
+             "TYPE=TRIG;CH=%u;N=%lu;RATE=%lu;PRE=%lu;LEVEL=%u;EDGE=%c;FMT=U16LE;",
+             cap_ch, (unsigned long)cap_n, (unsigned long)cap_rate,
+             (unsigned long)cap_pre, cap_level, cap_rising ? 'R' : 'F');
+  }
+  else
+  {
+    snprintf(fields, sizeof(fields), "TYPE=CAP;CH=%u;N=%lu;RATE=%lu;FMT=U16LE;",
+             cap_ch, (unsigned long)cap_n, (unsigned long)cap_rate);
+  }
+  bulkStart(fields, (const uint8_t*)cap_buf, cap_n * 2);
+}
+
+// Gọi trong loop(): đẩy frame ADS định kỳ khi bật ADS STREAM
+void adsStreamUpdate(uint32_t now)
+{
+  if (ads_stream_ms == 0) return;
+  if (bulk_tx.active) return;   // như statusStreamUpdate: không chen text vào payload bulk
+  if ((uint32_t)(now - ads_stream_last) < ads_stream_ms) return;
+  ads_stream_last = now;
+  sendAds();
+}
 
-// Nội dung 2 dòng trên OLED
-String oled_l1 = "ESP32 KIT";
-String oled_l2 = "-READY-";
+// ===== Điều khiển WS2812 =====
+void setRGB(uint8_t r, uint8_t g, uint8_t b) 
+{
+  strip.setPixelColor(0, strip.Color(r, g, b));  // NEO_GRB
+  strip.show();
+  rgb_r = r; rgb_g = g; rgb_b = b;
+}
 
-// ===== ADS1115 =====
-Adafruit_ADS1115 ads;
-bool ADS_OK = false;
+// ===== Gửi trạng thái output cho PC (1 frame, dạng bitmask hex) =====
+// Format: STATE;R=000F;SIO=05;LED=1;RGB=r,g,b;
+//   R   : bit0 = R1 ... bit15 = R16
+//   SIO : bit0 = SIO1 ... bit7 = SIO8
+void sendState()
+{
+  char buf[48];
+  size_t n = frameAppend(buf, 0, sizeof(buf), "STATE;R=%04X;SIO=%02X;LED=%d;RGB=%u,%u,%u;",
+                         relay_mask, sio_mask, led_on ? 1 : 0, rgb_r, rgb_g, rgb_b);
+  frameSend(buf, n);
+}
 
-// ===== WS2812 (1 LED) =====
-Adafruit_NeoPixel strip(NUMPIXELS, WS2812_PIN, NEO_GRB + NEO_KHZ800);
+// ===== Bảng output đánh số: R<n> / SIO<n> =====
+const uint8_t RELAY_PINS[] = { RELAY1, RELAY2, RELAY3, RELAY4 };
+const uint8_t SIO_PINS[]   = { SIO1, SIO2, SIO3 };   // SIO4 --> Option
 
-// ===== Buzzer =====
-void beep(uint16_t on_ms = 80) 
+struct OutputGroup
 {
-  digitalWrite(BUZZER_PIN, HIGH);
-  delay(on_ms);
-  digitalWrite(BUZZER_PIN, LOW);
-}
+  const char*    name;    // tiền tố lệnh, VD "R" → R1..R4
+  const uint8_t* pins;
+  uint8_t        count;
+  uint16_t*      mask;    // shadow state cho lệnh STATE
+};
 
-// ===== Update nội dung OLED (vẽ lại cả 2 dòng) =====
-void oledRender() 
+const OutputGroup OUTPUT_GROUPS[] =
 {
-  if (!OLED_OK) return;
+  { "R",   RELAY_PINS, sizeof(RELAY_PINS), &relay_mask },
+  { "SIO", SIO_PINS,   sizeof(SIO_PINS),   &sio_mask   },
+};
+const uint8_t OUTPUT_GROUP_COUNT = sizeof(OUTPUT_GROUPS) / sizeof(OUTPUT_GROUPS[0]);
 
-  display.clearDisplay();
-  display.setTextSize(2);
-  display.setTextColor(SSD1306_WHITE);
+// ===== Thống kê thời gian xử lý lệnh (lệnh PERF) =====
+uint32_t perf_count  = 0;
+uint32_t perf_last_us = 0;
+uint32_t perf_max_us = 0;
+uint64_t perf_sum_us = 0;
 
-  // Hàng 1
-  display.setCursor(0, 5);
-  display.println(oled_l1);
+// ===== Tiện ích parse (không cấp phát động) =====
+// Bỏ khoảng trắng 2 đầu, trả về con trỏ đầu chuỗi (sửa tại chỗ)
+char* trimInPlace(char* s)
+{
+  while (*s == ' ' || *s == '\t') s++;
+  char* e = s + strlen(s);
+  while (e > s && (e[-1] == ' ' || e[-1] == '\t')) e--;
+  *e = '\0';
+  return s;
+}
 
-  // Hàng 2
-  display.setCursor(0, 40);
-  display.println(oled_l2);
+void upperInPlace(char* s)
+{
+  for (; *s; s++) *s = toupper((unsigned char)*s);
+}
 
-  display.display();
+// "01 03 00 00" / "01030000" → byte; trả về số byte, -1 nếu sai định dạng / quá cap
+int parseHexBytes(const char* s, uint8_t* out, size_t cap)
+{
+  size_t n = 0;
+  int hi = -1;
+
+  for (; *s; s++)
+  {
+    if (*s == ' ') continue;
+    if (!isxdigit((unsigned char)*s)) return -1;
+    int v = isdigit((unsigned char)*s) ? *s - '0' : toupper((unsigned char)*s) - 'A' + 10;
+    if (hi < 0)
+    {
+      hi = v;
+      continue;
+    }
+    if (n >= cap) return -1;
+    out[n++] = (uint8_t)((hi << 4) | v);
+    hi = -1;
+  }
+  return (hi < 0) ? (int)n : -1;
 }
 
-// ===== Khởi tạo IO =====
-void setupPins() 
+// "ON" → 1, "OFF" → 0, khác → -1
+int parseOnOff(const char* arg)
 {
-  // Relay outputs
-  pinMode(RELAY1, OUTPUT);
-  pinMode(RELAY2, OUTPUT);
-  pinMode(RELAY3, OUTPUT);
-  pinMode(RELAY4, OUTPUT);
+  if (strcasecmp(arg, "ON") == 0)  return 1;
+  if (strcasecmp(arg, "OFF") == 0) return 0;
+  return -1;
+}
 
-  // Buzzer + spare outputs
-  pinMode(BUZZER_PIN, OUTPUT);
-  pinMode(SPARE1, OUTPUT);
-  pinMode(SPARE2, OUTPUT);    // LED on-board (LED ON/OFF)
+// ===== Các handler lệnh: args = phần sau khoảng trắng đầu tiên (đã trim) =====
+void cmdPing(char* args)  { Serial.println("PONG"); }
 
+void cmdInfo(char* args)  { Serial.println("KIT=ESP32;FW=1.17;"); }  // 1.17: RS485 SNIFF + LINK
 
-    // ==== I/O SPARE ====
-  pinMode(SIO1, OUTPUT);
-  pinMode(SIO2, OUTPUT);
-  pinMode(SIO3, OUTPUT);
-  // pinMode(SIO4, OUTPUT);
+void cmdBuz(char* args)
+{
+  beep(120);
+  Serial.println("OK;BUZ;");
+}
 
+// READ            → STATUS;ADC=..;S=s1,s2,..;
+// READ M          → STATUS;ADC=..;SM=<hex>;  (gọn hơn cho board 8/16 sensor)
+// READ STREAM <ms>→ tự gửi STATUS mỗi <ms>, 0 = tắt
+void cmdRead(char* args)
+{
+  if (strncasecmp(args, "STREAM", 6) == 0)
+  {
+    status_stream_ms = (uint32_t) strtol(args + 6, NULL, 10);
+    char buf[40];
+    size_t n = frameAppend(buf, 0, sizeof(buf), "OK;READ_STREAM=%lu;", (unsigned long)status_stream_ms);
+    frameSend(buf, n);
+    return;
+  }
+  sendStatus(strcasecmp(args, "M") == 0);
+}
 
-  // Đặt trạng thái mặc định
-  digitalWrite(RELAY1, LOW);
-  digitalWrite(RELAY2, LOW);
-  digitalWrite(RELAY3, LOW);
-  digitalWrite(RELAY4, LOW);
-  digitalWrite(BUZZER_PIN, LOW);
+// DELTA <deadband> <keyframe_ms> → chỉ gửi kênh thay đổi (DST;...), keyframe định kỳ
+// DELTA OFF                      → luôn gửi STATUS đầy đủ
+void cmdDelta(char* args)
+{
+  char buf[48];
+  size_t n;
 
-  digitalWrite(SPARE1, LOW);
-  // digitalWrite(SPARE2, LOW);
+  if (strcasecmp(args, "OFF") == 0)
+  {
+    delta_on = false;
+    n = frameAppend(buf, 0, sizeof(buf), "OK;DELTA=OFF;");
+    frameSend(buf, n);
+    return;
+  }
 
-  digitalWrite(SIO1, LOW);
-  digitalWrite(SIO2, LOW);
-  digitalWrite(SIO3, LOW);
-  //digitalWrite(SIO4, LOW);
+  char* end;
+  long band = strtol(args, &end, 10);
+  long key  = strtol(end, &end, 10);
+  if (end == args || band < 0 || band > 4095 || key < 100)
+  {
+    n = frameAppend(buf, 0, sizeof(buf), "ERR;BAD_DELTA;");
+  }
+  else
+  {
+    delta_deadband = (uint16_t)band;
+    delta_key_ms   = (uint32_t)key;
+    delta_on       = true;
+    delta_need_key = true;    // frame kế tiếp là keyframe
+    n = frameAppend(buf, 0, sizeof(buf), "OK;DELTA=%u,%lu;", delta_deadband, (unsigned long)delta_key_ms);
+  }
+  frameSend(buf, n);
+}
 
-  // Digital inputs
-  pinMode(SENSOR1, INPUT);
-  pinMode(SENSOR2, INPUT);
-  pinMode(SENSOR3, INPUT);
-  pinMode(SENSOR4, INPUT);
-  pinMode(SENSOR5, INPUT);
+// ADS              → ADS;A0=..;A1=..;A2=..;A3=..; (giá trị cache, trả về ngay)
+// ADS RATE <sps>   → 8/16/32/64/128/250/475/860
+// ADS GAIN <g>     → 2/3, 1, 2, 4, 8, 16
+// ADS STREAM <ms>  → tự gửi frame ADS mỗi <ms>, 0 = tắt
+void cmdAds(char* args)
+{
+  if (*args == '\0')
+  {
+    sendAds();
+    return;
+  }
+
+  char* val = strchr(args, ' ');
+  if (val == NULL)
+  {
+    Serial.println("ERR;BAD_ADS;");
+    return;
+  }
+  *val++ = '\0';
+  val = trimInPlace(val);
+  upperInPlace(args);
 
-  // Analog: ADC1, ADC2, ADC3 dùng analogRead trực tiếp
+  char buf[40];
+  size_t n;
+  if (strcmp(args, "RATE") == 0 && adsSetRate((uint16_t) strtol(val, NULL, 10)))
+  {
+    n = frameAppend(buf, 0, sizeof(buf), "OK;ADS_RATE=%u;", ads_sps);
+  }
+  else if (strcmp(args, "GAIN") == 0 && adsSetGain(val))
+  {
+    n = frameAppend(buf, 0, sizeof(buf), "OK;ADS_GAIN=%s;", ads_gain_name);
+  }
+  else if (strcmp(args, "STREAM") == 0)
+  {
+    ads_stream_ms = (uint32_t) strtol(val, NULL, 10);
+    n = frameAppend(buf, 0, sizeof(buf), "OK;ADS_STREAM=%lu;", (unsigned long)ads_stream_ms);
+  }
+  else
+  {
+    n = frameAppend(buf, 0, sizeof(buf), "ERR;BAD_ADS;");
+  }
+  frameSend(buf, n);
 }
 
-// ===== Gửi STATUS cho PC =====
-// CHỈ gửi ADC nội & Sensor, KHÔNG đọc ADS ở đây
-// Format: STATUS;ADC=a1,a2,a3;S=s1,s2,s3,s4,s5;
-void sendStatus() 
-{
-  int adc1 = analogRead(ADC1);
-  int adc2 = analogRead(ADC2);
-  int adc3 = analogRead(ADC3);
-
-  int s1 = digitalRead(SENSOR1);
-  int s2 = digitalRead(SENSOR2);
-  int s3 = digitalRead(SENSOR3);
-  int s4 = digitalRead(SENSOR4);
-  int s5 = digitalRead(SENSOR5);
-
-  Serial.print("STATUS;");
-  Serial.print("ADC=");
-  Serial.print(adc1); Serial.print(",");
-  Serial.print(adc2); Serial.print(",");
-  Serial.print(adc3);
-  Serial.print(";S=");
-  Serial.print(s1); Serial.print(",");
-  Serial.print(s2); Serial.print(",");
-  Serial.print(s3); Serial.print(",");
-  Serial.print(s4); Serial.print(",");
-  Serial.print(s5);
-  Serial.println(";");
+void cmdState(char* args) { sendState(); }    // trạng thái thật của output
+
+// --- LED test trên SPARE1 ---
+void cmdLed(char* args)
+{
+  int on = parseOnOff(args);
+  if (on < 0)
+  {
+    Serial.println("ERR;BAD_LED;");
+    return;
+  }
+  digitalWrite(SPARE1, on ? HIGH : LOW);
+  led_on = on;
+  Serial.println(on ? "OK;LED=ON;" : "OK;LED=OFF;");
 }
 
-// ===== Gửi giá trị ADS1115 A0/A1 cho PC =====
-// Format: ADS;A0=xxxx;A1=yyyy;
-void sendAds() 
+// --- WS2812: RGB R,G,B ---
+void cmdRgb(char* args)
 {
-  int16_t ads0 = 0;
-  int16_t ads1 = 0;
+  char* p1 = args;
+  char* p2 = strchr(p1, ',');
+  char* p3 = p2 ? strchr(p2 + 1, ',') : NULL;
 
-  if (ADS_OK) 
+  if (*p1 == '\0' || p2 == NULL || p3 == NULL)
   {
-    ads0 = ads.readADC_SingleEnded(0);   // kênh A0
-    ads1 = ads.readADC_SingleEnded(1);   // kênh A1
+    Serial.println("ERR;BAD_RGB;");
+    return;
   }
 
-  Serial.print("ADS;");
-  Serial.print("A0=");
-  Serial.print(ads0);
-  Serial.print(";A1=");
-  Serial.print(ads1);
-  Serial.println(";");
+  uint8_t r = (uint8_t) strtol(p1, NULL, 10);
+  uint8_t g = (uint8_t) strtol(p2 + 1, NULL, 10);
+  uint8_t b = (uint8_t) strtol(p3 + 1, NULL, 10);
+
+  setRGB(r, g, b);
+
+  char buf[32];
+  size_t n = frameAppend(buf, 0, sizeof(buf), "OK;RGB=%u,%u,%u;", r, g, b);
+  frameSend(buf, n);
 }
 
-// ===== Điều khiển WS2812 =====
-void setRGB(uint8_t r, uint8_t g, uint8_t b) 
+// --- OLED: Hàng 1 & Hàng 2 ---
+void setOledLine(uint8_t line, const char* text, const char* tag)
 {
-  strip.setPixelColor(0, strip.Color(r, g, b));  // NEO_GRB
-  strip.show();
+  char* dst = OLED_LINES[line].text;
+
+  if (*text == '\0')
+  {
+    Serial.print("ERR;BAD_"); Serial.print(tag); Serial.println(";");
+    return;
+  }
+  strncpy(dst, text, OLED_LINE_MAX);
+  dst[OLED_LINE_MAX] = '\0';
+  oledMarkLine(line);             // vẽ lúc loop rảnh, ACK không chờ I2C
+  Serial.print("OK;"); Serial.print(tag); Serial.println(";");
 }
 
-// ===== Xử lý 1 lệnh từ PC =====
-void handleCommand(const String& cmd_in) 
+void cmdOl1(char* args) { setOledLine(0, args, "OL1"); }
+void cmdOl2(char* args) { setOledLine(1, args, "OL2"); }
+
+// --- FB: ghi thẳng framebuffer OLED (binary) ---
+// FB <col> <page> <w> <pages> <crc>  rồi w*pages byte raw (tối đa 1024)
+//   Vùng chữ nhật cột col..col+w-1, page page..page+pages-1; mỗi byte = 8 pixel dọc
+//   (bit0 ở trên), thứ tự page trước, cột sau – đúng layout GDDRAM SSD1306.
+//   crc: CRC-16/CCITT-FALSE (hex) của phần dữ liệu.
+// → OK;FB=<len>;  |  ERR;BAD_FB;  |  ERR;FB_CRC;  |  ERR;FB_TIMEOUT;
+// Trong lúc nhận, byte serial không được hiểu là lệnh (xem loop()).
+#define FB_RX_TIMEOUT_MS 500
+// RX buffer của Serial (mặc định 256 B): đủ chứa cả khối FB tối đa + dòng lệnh,
+// vì loop() không đọc Serial khi đang gửi bulk (CAP / TRIG / RS485 / SNIFF)
+#define SERIAL_RX_BUF    2048
+
+struct FbRx
 {
-  String raw = cmd_in;
-  raw.trim();
+  uint8_t  col, page, w, pages;
+  uint16_t crc;
+  uint16_t len;
+  uint16_t pos;
+  uint32_t start_ms;
+  bool     skip_lf;   // header kết thúc bằng CR → bỏ LF đi kèm, không coi là dữ liệu
+  bool     active;
+};
 
-  String c = raw;
-  c.trim();
-  c.toUpperCase();
+FbRx    fb_rx = { 0, 0, 0, 0, 0, 0, 0, 0, false, false };
+char    cmd_eol = '\n';   // ký tự kết thúc dòng lệnh vừa xử lý (loop() ghi)
+uint8_t fb_rx_buf[SCREEN_WIDTH * OLED_PAGES];
 
-  if (c.length() == 0) return;
+void cmdFb(char* args)
+{
+  long v[4];
+  char* p = args;
+  char* end;
 
-  // --- Lệnh đơn giản ---
-  if (c == "PING") 
+  for (uint8_t i = 0; i < 4; i++)
   {
-    Serial.println("PONG");
-    return;
+    v[i] = strtol(p, &end, 10);
+    if (end == p) { Serial.println("ERR;BAD_FB;"); return; }
+    p = end;
   }
+  unsigned long crc = strtoul(p, &end, 16);
 
-  if (c == "INFO") 
+  if (end == p || v[0] < 0 || v[1] < 0 || v[2] < 1 || v[3] < 1 ||
+      v[0] + v[2] > SCREEN_WIDTH || v[1] + v[3] > OLED_PAGES || crc > 0xFFFF)
   {
-    Serial.println("KIT=ESP32;FW=1.4;");   // tăng version vì thêm lệnh ADS riêng
+    Serial.println("ERR;BAD_FB;");
     return;
   }
 
-  if (c == "BUZ") 
+  fb_rx.col      = (uint8_t)v[0];
+  fb_rx.page     = (uint8_t)v[1];
+  fb_rx.w        = (uint8_t)v[2];
+  fb_rx.pages    = (uint8_t)v[3];
+  fb_rx.crc      = (uint16_t)crc;
+  fb_rx.len      = fb_rx.w * fb_rx.pages;
+  fb_rx.pos      = 0;
+  fb_rx.start_ms = millis();
+  fb_rx.skip_lf  = (cmd_eol == '\r');
+  fb_rx.active   = true;
+}
+
+// Nhận byte raw đang có; đủ LEN thì kiểm CRC và chép vào framebuffer
+void fbReceive()
+{
+  if (fb_rx.skip_lf)
+  {
+    fb_rx.skip_lf = false;
+    if (Serial.peek() == '\n') Serial.read();
+    if (!Serial.available()) return;
+  }
+
+  size_t n = Serial.available();
+  size_t left = fb_rx.len - fb_rx.pos;
+  if (n > left) n = left;
+  n = Serial.readBytes(fb_rx_buf + fb_rx.pos, n);
+  fb_rx.pos += n;
+
+  if (fb_rx.pos < fb_rx.len) return;
+  fb_rx.active = false;
+
+  if (crc16Ccitt(fb_rx_buf, fb_rx.len) != fb_rx.crc)
   {
-    beep(120);
-    Serial.println("OK;BUZ;");
+    Serial.println("ERR;FB_CRC;");
     return;
   }
 
-  if (c == "READ") 
+  if (OLED_OK)
   {
-    // chỉ đọc ADC nội + Sensor
-    sendStatus();
-    return;
+    uint8_t* fb = display.getBuffer();
+    for (uint8_t pg = 0; pg < fb_rx.pages; pg++)
+    {
+      memcpy(fb + (uint16_t)(fb_rx.page + pg) * SCREEN_WIDTH + fb_rx.col,
+             fb_rx_buf + (uint16_t)pg * fb_rx.w, fb_rx.w);
+      oledMarkPage(fb_rx.page + pg);   // oledUpdate() gửi dần (page đang gửi dở → lại từ cột 0)
+    }
   }
 
-  if (c == "ADS") 
+  char buf[24];
+  size_t len = frameAppend(buf, 0, sizeof(buf), "OK;FB=%u;", fb_rx.len);
+  frameSend(buf, len);
+}
+
+// PC ngừng gửi giữa chừng → bỏ khối, quay lại nhận lệnh text
+void fbUpdate(uint32_t now)
+{
+  if (!fb_rx.active) return;
+  if ((uint32_t)(now - fb_rx.start_ms) < FB_RX_TIMEOUT_MS) return;
+  fb_rx.active = false;
+  Serial.println("ERR;FB_TIMEOUT;");
+}
+
+// --- RS485: passthrough qua UART2 ---
+// RS485                          → RS485;BAUD=..;FMT=8N1;GAP=<µs>;RX=..;TX=..;OVF=..;
+// RS485 CFG <baud> [fmt] [gap_us]→ OK;RS485=<baud>,<fmt>,<gap>;  (fmt: 8N1/8E1/8O1/8N2, gap 0 = auto)
+// RS485 TX <hex>                 → phát lên bus, OK;RS485_TX=<n>; (TX buffer đầy: ERR;RS485_BUSY;)
+// RS485 SNIFF ON|OFF             → chế độ phân tích bus (BIN;TYPE=SNIFF;...)
+// Dữ liệu nhận về: BIN;TYPE=RS485;... (xem rs485Update)
+void cmdRs485(char* args)
+{
+  char buf[96];
+  size_t n;
+
+  if (*args == '\0')
   {
-    // chỉ đọc ADS1115 khi PC yêu cầu
-    sendAds();
+    n = frameAppend(buf, 0, sizeof(buf), "RS485;BAUD=%lu;FMT=%s;GAP=%lu;RX=%lu;TX=%lu;OVF=%lu;SNIFF=%d;",
+                    (unsigned long)rs485_baud, RS485_FORMATS[rs485_fmt].name,
+                    (unsigned long)rs485_gap_us, (unsigned long)rs485_rx_bytes,
+                    (unsigned long)rs485_tx_bytes, (unsigned long)rs485_ovf, sniff_on);
+    frameSend(buf, n);
     return;
   }
 
-  // --- Relay R1..R4 ON/OFF ---
-  if (c.startsWith("R1 ")) 
+  char* val = strchr(args, ' ');
+  if (val != NULL)
   {
-    if (c.endsWith("ON"))  { digitalWrite(RELAY1, HIGH); Serial.println("OK;R1=ON;"); }
-    if (c.endsWith("OFF")) { digitalWrite(RELAY1, LOW);  Serial.println("OK;R1=OFF;"); }
-    return;
+    *val++ = '\0';
+    val = trimInPlace(val);
   }
-  if (c.startsWith("R2 ")) 
+  upperInPlace(args);
+
+  if (strcmp(args, "TX") == 0 && val != NULL)
   {
-    if (c.endsWith("ON"))  { digitalWrite(RELAY2, HIGH); Serial.println("OK;R2=ON;"); }
-    if (c.endsWith("OFF")) { digitalWrite(RELAY2, LOW);  Serial.println("OK;R2=OFF;"); }
+    static uint8_t tx[RS485_FRAME_MAX];
+    int len = parseHexBytes(val, tx, sizeof(tx));
+    if (len <= 0)
+    {
+      Serial.println("ERR;BAD_RS485_TX;");
+      return;
+    }
+    if (!rs485Write(tx, len))
+    {
+      Serial.println("ERR;RS485_BUSY;");
+      return;
+    }
+    n = frameAppend(buf, 0, sizeof(buf), "OK;RS485_TX=%d;", len);
+    frameSend(buf, n);
     return;
   }
-  if (c.startsWith("R3 ")) 
+
+  if (strcmp(args, "SNIFF") == 0 && val != NULL && parseOnOff(val) >= 0)
   {
-    if (c.endsWith("ON"))  { digitalWrite(RELAY3, HIGH); Serial.println("OK;R3=ON;"); }
-    if (c.endsWith("OFF")) { digitalWrite(RELAY3, LOW);  Serial.println("OK;R3=OFF;"); }
+    // Lệnh chỉ chạy khi không có bulk đang gửi → reset buffer an toàn
+    sniff_on = parseOnOff(val);
+    sniffReset();
+    for (uint8_t i = 0; i < RS485_SLOTS; i++) rs485_frames[i].len = 0;
+    rs485_tail = rs485_ready = 0;
+    rs485_sending = false;
+    n = frameAppend(buf, 0, sizeof(buf), "OK;RS485_SNIFF=%s;", sniff_on ? "ON" : "OFF");
+    frameSend(buf, n);
     return;
   }
-  if (c.startsWith("R4 ")) 
+
+  if (strcmp(args, "CFG") == 0 && val != NULL)
   {
-    if (c.endsWith("ON"))  { digitalWrite(RELAY4, HIGH); Serial.println("OK;R4=ON;"); }
-    if (c.endsWith("OFF")) { digitalWrite(RELAY4, LOW);  Serial.println("OK;R4=OFF;"); }
+    char* end;
+    long baud = strtol(val, &end, 10);
+    char* fmt = trimInPlace(end);
+    char* gap = strchr(fmt, ' ');
+    if (gap != NULL) *gap++ = '\0';
+
+    int fmt_idx = rs485_fmt;
+    if (*fmt)
+    {
+      fmt_idx = -1;
+      for (uint8_t i = 0; i < RS485_FORMAT_COUNT; i++)
+      {
+        if (strcasecmp(fmt, RS485_FORMATS[i].name) == 0) fmt_idx = i;
+      }
+    }
+    long gap_us = gap ? strtol(gap, NULL, 10) : (long)rs485_gap_cfg;
+
+    if (end == val || baud < 1200 || baud > 921600 || fmt_idx < 0 || gap_us < 0 || gap_us > 1000000)
+    {
+      Serial.println("ERR;BAD_RS485;");
+      return;
+    }
+    rs485_baud    = (uint32_t)baud;
+    rs485_fmt     = (uint8_t)fmt_idx;
+    rs485_gap_cfg = (uint32_t)gap_us;
+    rs485Begin();
+    n = frameAppend(buf, 0, sizeof(buf), "OK;RS485=%lu,%s,%lu;", (unsigned long)rs485_baud,
+                    RS485_FORMATS[rs485_fmt].name, (unsigned long)rs485_gap_us);
+    frameSend(buf, n);
     return;
   }
 
-  // --- I/O SPARE: SIO1..SIO4 ON/OFF ---
-  if (c.startsWith("SIO1 ")) 
+  Serial.println("ERR;BAD_RS485;");
+}
+
+// --- LINK <baud>: đổi tốc độ cổng USB (115200 / 230400 / 460800 / 921600) ---
+// OK;LINK=<baud>; được gửi ở tốc độ cũ, sau đó FW đổi ngay; PC đổi theo khi nhận OK.
+// Reset board → về lại 115200.
+void cmdLink(char* args)
+{
+  long baud = strtol(args, NULL, 10);
+  if (baud != 115200 && baud != 230400 && baud != 460800 && baud != 921600)
   {
-    if (c.endsWith("ON"))  { digitalWrite(SIO1, HIGH); Serial.println("OK;SIO1=ON;"); }
-    if (c.endsWith("OFF")) { digitalWrite(SIO1, LOW);  Serial.println("OK;SIO1=OFF;"); }
+    Serial.println("ERR;BAD_LINK;");
     return;
   }
-  if (c.startsWith("SIO2 ")) 
+  char buf[32];
+  size_t n = frameAppend(buf, 0, sizeof(buf), "OK;LINK=%ld;", baud);
+  frameSend(buf, n);
+  Serial.flush();                 // OK phải ra hết ở tốc độ cũ
+  Serial.updateBaudRate(baud);
+}
+
+// --- PERF: thời gian xử lý lệnh trong firmware (µs) ---
+// PERF       → PERF;N=..;LAST=..;AVG=..;MAX=..;
+// PERF RESET → xóa bộ đếm
+void cmdPerf(char* args)
+{
+  if (strcasecmp(args, "RESET") == 0)
   {
-    if (c.endsWith("ON"))  { digitalWrite(SIO2, HIGH); Serial.println("OK;SIO2=ON;"); }
-    if (c.endsWith("OFF")) { digitalWrite(SIO2, LOW);  Serial.println("OK;SIO2=OFF;"); }
+    perf_count = 0; perf_last_us = 0; perf_max_us = 0; perf_sum_us = 0;
+    Serial.println("OK;PERF=RESET;");
     return;
   }
-  if (c.startsWith("SIO3 ")) 
+
+  uint32_t avg = perf_count ? (uint32_t)(perf_sum_us / perf_count) : 0;
+  char buf[64];
+  size_t n = frameAppend(buf, 0, sizeof(buf), "PERF;N=%lu;LAST=%lu;AVG=%lu;MAX=%lu;",
+                         (unsigned long)perf_count, (unsigned long)perf_last_us,
+                         (unsigned long)avg, (unsigned long)perf_max_us);
+  frameSend(buf, n);
+}
+
+// --- SAMPLE: tần số lấy mẫu ADC nội theo timer ---
+// SAMPLE      → SAMPLE;RATE=1000;
+// SAMPLE <hz> → đổi tần số (0 = tắt, tối đa SAMPLE_RATE_MAX)
+void cmdSample(char* args)
+{
+  char buf[32];
+  size_t n;
+  if (*args == '\0')
+  {
+    n = frameAppend(buf, 0, sizeof(buf), "SAMPLE;RATE=%lu;", (unsigned long)sample_rate_hz);
+  }
+  else
+  {
+    long hz = strtol(args, NULL, 10);
+    if (hz < 0 || hz > SAMPLE_RATE_MAX)
+    {
+      n = frameAppend(buf, 0, sizeof(buf), "ERR;BAD_SAMPLE;");
+    }
+    else
+    {
+      // CAP / TRIG đang giữ ADC1 qua I2S: chỉ nhớ tần số, capEnd() bật lại timer
+      if (cap_running) sample_rate_hz = (uint32_t)hz;
+      else             samplerSetRate((uint32_t)hz);
+      n = frameAppend(buf, 0, sizeof(buf), "OK;SAMPLE=%ld;", hz);
+    }
+  }
+  frameSend(buf, n);
+}
+
+// --- CAP <ch> <n> <rate>: capture N mẫu ADC<ch> ở <rate> Hz ---
+// → OK;CAP=START;  rồi khi đủ mẫu: BIN;TYPE=CAP;CH=..;N=..;RATE=..;FMT=U16LE;LEN=..;CRC=..;
+void cmdCap(char* args)
+{
+  char* end;
+  long ch   = strtol(args, &end, 10);
+  long n    = strtol(end, &end, 10);
+  long rate = strtol(end, &end, 10);
+
+  // ch kiểm tra trên long: (uint8_t)257 sẽ thành kênh 1
+  const char* err = (ch < 1 || ch > ADC_COUNT) ? "BAD_CH"
+                  : capStart((uint8_t)ch, (uint32_t)n, (uint32_t)rate);
+  char buf[40];
+  size_t len = err ? frameAppend(buf, 0, sizeof(buf), "ERR;CAP_%s;", err)
+                   : frameAppend(buf, 0, sizeof(buf), "OK;CAP=START;");
+  frameSend(buf, len);
+}
+
+// --- TRIG <ch> <level> <R|F> <pre%> <n> <rate>: chờ cạnh rồi gửi cửa sổ N mẫu ---
+// → OK;TRIG=ARMED;  khi có cạnh: BIN;TYPE=TRIG;CH;N;RATE;PRE;LEVEL;EDGE;FMT=U16LE;LEN;CRC;
+//   PRE = chỉ số mẫu trigger trong cửa sổ
+// TRIG OFF → hủy chờ
+void cmdTrig(char* args)
+{
+  char buf[40];
+  size_t len;
+
+  if (strcasecmp(args, "OFF") == 0)
   {
-    if (c.endsWith("ON"))  { digitalWrite(SIO3, HIGH); Serial.println("OK;SIO3=ON;"); }
-    if (c.endsWith("OFF")) { digitalWrite(SIO3, LOW);  Serial.println("OK;SIO3=OFF;"); }
+    if (cap_running && cap_trig_mode) capEnd();
+    len = frameAppend(buf, 0, sizeof(buf), "OK;TRIG=OFF;");
+    frameSend(buf, len);
     return;
   }
 
-  // --- LED test trên SIO2 (GPIO2) ---
-  if (c == "LED ON") 
+  char* end;
+  long ch    = strtol(args, &end, 10);
+  long level = strtol(end, &end, 10);
+  while (*end == ' ') end++;
+  char edge  = toupper((unsigned char)*end);
+  if (*end) end++;
+  long pre   = strtol(end, &end, 10);
+  long n     = strtol(end, &end, 10);
+  long rate  = strtol(end, &end, 10);
+
+  // Kiểm tra trên giá trị long trước khi ép kiểu (VD: pre=300 → (uint8_t)44, ch=257 → 1)
+  const char* err = NULL;
+  if (ch < 1 || ch > ADC_COUNT)         err = "BAD_CH";
+  else if (edge != 'R' && edge != 'F')  err = "BAD_EDGE";
+  else if (level < 0 || level > 4095)   err = "BAD_LEVEL";
+  else if (pre < 0 || pre > 100)        err = "BAD_PRE";
+  else err = trigStart((uint8_t)ch, (uint16_t)level, edge == 'R', (uint8_t)pre,
+                       (uint32_t)n, (uint32_t)rate);
+
+  len = err ? frameAppend(buf, 0, sizeof(buf), "ERR;TRIG_%s;", err)
+            : frameAppend(buf, 0, sizeof(buf), "OK;TRIG=ARMED;");
+  frameSend(buf, len);
+}
+
+// --- EVT ON / EVT OFF: bật / tắt sự kiện thay đổi Sensor ---
+void cmdEvt(char* args)
+{
+  int on = parseOnOff(args);
+  if (on < 0)
   {
-    digitalWrite(SPARE1, HIGH);
-    Serial.println("OK;LED=ON;");
+    Serial.println("ERR;BAD_EVT;");
     return;
   }
-  if (c == "LED OFF") 
+  sensorEventsEnable(on);
+  Serial.println(on ? "OK;EVT=ON;" : "OK;EVT=OFF;");
+}
+
+// CNT             → CNT;C=..;F=..;t=..;
+// CNT RESET       → xóa bộ đếm
+// CNT GATE <ms>   → cửa sổ đo tần số (10..60000 ms)
+// CNT STREAM <ms> → tự gửi CNT mỗi <ms>, 0 = tắt
+void cmdCnt(char* args)
+{
+  if (*args == '\0')
   {
-    digitalWrite(SPARE1, LOW);
-    Serial.println("OK;LED=OFF;");
+    sendCounters();
     return;
   }
 
-  // --- WS2812: RGB R,G,B ---
-  if (c.startsWith("RGB")) 
+  char buf[40];
+  size_t n;
+  char* val = strchr(args, ' ');
+  if (val != NULL)
+  {
+    *val++ = '\0';
+    val = trimInPlace(val);
+  }
+  upperInPlace(args);
+  long v = val ? strtol(val, NULL, 10) : -1;
+
+  if (strcmp(args, "RESET") == 0)
   {
-    int spaceIndex = raw.indexOf(' ');
-    if (spaceIndex > 0 && spaceIndex < (int)raw.length() - 1) {
-      String params = raw.substring(spaceIndex + 1); // "R,G,B"
-      params.trim();
+    cntReset();
+    n = frameAppend(buf, 0, sizeof(buf), "OK;CNT=RESET;");
+  }
+  else if (strcmp(args, "GATE") == 0 && v >= 10 && v <= 60000)
+  {
+    cnt_gate_ms = (uint32_t)v;
+    n = frameAppend(buf, 0, sizeof(buf), "OK;CNT_GATE=%lu;", (unsigned long)cnt_gate_ms);
+  }
+  else if (strcmp(args, "STREAM") == 0 && v >= 0)
+  {
+    cnt_stream_ms = (uint32_t)v;
+    n = frameAppend(buf, 0, sizeof(buf), "OK;CNT_STREAM=%lu;", (unsigned long)cnt_stream_ms);
+  }
+  else
+  {
+    n = frameAppend(buf, 0, sizeof(buf), "ERR;BAD_CNT;");
+  }
+  frameSend(buf, n);
+}
+
+struct Command
+{
+  const char* name;
+  void (*handler)(char* args);
+};
 
-      int firstComma  = params.indexOf(',');
-      int secondComma = params.indexOf(',', firstComma + 1);
+const Command COMMANDS[] =
+{
+  { "PING",  cmdPing  },
+  { "INFO",  cmdInfo  },
+  { "BUZ",   cmdBuz   },
+  { "READ",  cmdRead  },
+  { "ADS",   cmdAds   },
+  { "STATE", cmdState },
+  { "LED",   cmdLed   },
+  { "RGB",   cmdRgb   },
+  { "OL1",   cmdOl1   },
+  { "OL2",   cmdOl2   },
+  { "PERF",  cmdPerf  },
+  { "SAMPLE", cmdSample },
+  { "CAP",   cmdCap   },
+  { "TRIG",  cmdTrig  },
+  { "EVT",   cmdEvt   },
+  { "CNT",   cmdCnt   },
+  { "DELTA", cmdDelta },
+  { "FB",    cmdFb    },
+  { "RS485", cmdRs485 },
+  { "LINK",  cmdLink  },
+};
+const uint8_t COMMAND_COUNT = sizeof(COMMANDS) / sizeof(COMMANDS[0]);
 
-      if (firstComma > 0 && secondComma > firstComma) {
-        uint8_t r = (uint8_t) params.substring(0, firstComma).toInt();
-        uint8_t g = (uint8_t) params.substring(firstComma + 1, secondComma).toInt();
-        uint8_t b = (uint8_t) params.substring(secondComma + 1).toInt();
+// --- R<n> / SIO<n> ON|OFF: tra bảng OUTPUT_GROUPS ---
+// Trả về false nếu verb không thuộc nhóm nào (để báo UNKNOWN_CMD)
+bool handleIndexedOutput(const char* verb, const char* args)
+{
+  for (uint8_t g = 0; g < OUTPUT_GROUP_COUNT; g++)
+  {
+    const OutputGroup& grp = OUTPUT_GROUPS[g];
+    size_t plen = strlen(grp.name);
+    if (strncmp(verb, grp.name, plen) != 0) continue;
 
-        setRGB(r, g, b);
+    const char* num = verb + plen;
+    if (*num == '\0') continue;
+    char* end;
+    long idx = strtol(num, &end, 10);
+    if (*end != '\0') continue;          // VD "RGB", "READ" không phải R<n>
+    if (idx < 1 || idx > grp.count) return false;
 
-        Serial.print("OK;RGB=");
-        Serial.print(r); Serial.print(",");
-        Serial.print(g); Serial.print(",");
-        Serial.print(b); Serial.println(";");
-        return;
-      }
+    int on = parseOnOff(args);
+    if (on < 0)
+    {
+      Serial.print("ERR;BAD_"); Serial.print(verb); Serial.println(";");
+      return true;
     }
-    Serial.println("ERR;BAD_RGB;");
-    return;
+
+    digitalWrite(grp.pins[idx - 1], on ? HIGH : LOW);
+    if (on) *grp.mask |=  (1 << (idx - 1));
+    else    *grp.mask &= ~(1 << (idx - 1));
+
+    char buf[24];
+    size_t n = frameAppend(buf, 0, sizeof(buf), "OK;%s=%s;", verb, on ? "ON" : "OFF");
+    frameSend(buf, n);
+    return true;
   }
+  return false;
+}
+
+// ===== Xử lý 1 lệnh từ PC =====
+// line: buffer cố định của loop(), được tách token tại chỗ
+void handleCommand(char* line)
+{
+  char* verb = trimInPlace(line);
+  if (*verb == '\0') return;
 
-  // --- OLED: Hàng 1 & Hàng 2 ---
-  if (c.startsWith("OL1 ")) 
+  // Tách verb / args tại khoảng trắng đầu tiên
+  char* args = strchr(verb, ' ');
+  if (args != NULL)
   {
-    int spaceIndex = raw.indexOf(' ');
-    if (spaceIndex > 0 && spaceIndex < (int)raw.length() - 1) 
-    {
-      String text = raw.substring(spaceIndex + 1);
-      text.trim();
-      oled_l1 = text;
-      oledRender();
-      Serial.println("OK;OL1;");
-    }
-    else
-    {
-      Serial.println("ERR;BAD_OL1;");
-    }
-    return;
+    *args++ = '\0';
+    args = trimInPlace(args);
+  }
+  else
+  {
+    args = verb + strlen(verb);   // chuỗi rỗng
   }
+  upperInPlace(verb);             // args giữ nguyên hoa/thường (text OLED)
 
-  if (c.startsWith("OL2 ")) 
+  for (uint8_t i = 0; i < COMMAND_COUNT; i++)
   {
-    int spaceIndex = raw.indexOf(' ');
-    if (spaceIndex > 0 && spaceIndex < (int)raw.length() - 1) {
-      String text = raw.substring(spaceIndex + 1);
-      text.trim();
-      oled_l2 = text;
-      oledRender();
-      Serial.println("OK;OL2;");
-    } else {
-      Serial.println("ERR;BAD_OL2;");
+    if (strcmp(verb, COMMANDS[i].name) == 0)
+    {
+      COMMANDS[i].handler(args);
+      return;
     }
-    return;
   }
 
+  if (handleIndexedOutput(verb, args)) return;
+
   // --- Lệnh không nhận diện được ---
   Serial.print("ERR;UNKNOWN_CMD=");
-  Serial.print(c);
+  Serial.print(verb);
+  if (*args) { Serial.print(" "); Serial.print(args); }
   Serial.println(";");
 }
 
+// Đo thời gian xử lý 1 lệnh (µs) cho lệnh PERF
+void runCommand(char* line)
+{
+  uint32_t t0 = micros();
+  handleCommand(line);
+  uint32_t dt = micros() - t0;
+
+  perf_count++;
+  perf_last_us = dt;
+  perf_sum_us += dt;
+  if (dt > perf_max_us) perf_max_us = dt;
+}
+
 // ===== Setup =====
 void setup() 
 {
+  Serial.setRxBufferSize(SERIAL_RX_BUF);   // phải gọi trước begin()
   Serial.begin(115200);
   setupPins();
 
+  // Lấy mẫu ADC nội theo timer (task riêng trên core 0, loop() chạy core 1)
+  xTaskCreatePinnedToCore(sampleTask, "adc_sample", 2048, NULL, 5, &sample_task, 0);
+  samplerSetRate(SAMPLE_RATE_DEFAULT);
+
+  // Đếm xung phần cứng trên PCNT_PIN_LIST
+  cntSetup();
+
+  // RS485 trên UART2 (RXD/TXD, DE theo pins.h)
+  rs485Begin();
+
   // I2C (SDA, SCL theo pins.h)
   Wire.begin(SDA_PIN, SCL_PIN);
+  Wire.setClock(I2C_CLOCK_HZ);
 
   // OLED
   if (!display.begin(SSD1306_SWITCHCAPVCC, OLED)) 
@@ -351,8 +2200,8 @@ void setup()
   else
   {
     OLED_OK = true;
-    oled_l1 = "ESP32 KIT";
-    oled_l2 = "READY";
+    strcpy(oled_l1, "ESP32 KIT");
+    strcpy(oled_l2, "READY");
     oledRender();
     Serial.println("OLED OK");
   }
@@ -363,6 +2212,8 @@ void setup()
     Serial.println("ERR;ADS_FAIL;");
   } else {
     ads.setGain(GAIN_ONE);        // +/-4.096V, 1 bit ~ 0.125mV
+    adsSetRate(ads_sps);
+    adsStartConversion();         // từ đây A0..A3 được đọc nền trong loop()
     Serial.println("ADS1115 OK");
   }
 
@@ -376,26 +2227,75 @@ void setup()
 }
 
 // ===== Loop =====
+// Không có delay(): loop chỉ xử lý byte serial đang có và các tác vụ
+// theo thời gian (buzzer, ADS, stream...) đã tới hạn, rồi quay lại ngay.
 void loop() 
 {
-  static String buffer;
+  // Đang gửi bulk: chưa đọc lệnh mới, chỉ chạy các tác vụ không gửi text
+  if (bulkUpdate())
+  {
+    pulseUpdate(buzzer, millis());
+    adsUpdate();
+    rs485Poll();
+    // Byte FB nằm chờ trong RX buffer do mình chưa đọc → không tính vào timeout
+    if (fb_rx.active) fb_rx.start_ms = millis();
+    return;
+  }
+
+  // Buffer dòng cố định: không cấp phát heap khi chạy lâu ngày
+  static char     line[CMD_LINE_MAX + 1];
+  static uint16_t len = 0;
+  static bool    overflow = false;
 
   while (Serial.available()) 
   {
+    // Đang nhận khối FB: byte là dữ liệu ảnh, không phải lệnh
+    if (fb_rx.active)
+    {
+      fbReceive();
+      continue;
+    }
+
     char ch = Serial.read();
     if (ch == '\n' || ch == '\r') 
     {
-      if (buffer.length() > 0) 
+      if (overflow)
+      {
+        Serial.println("ERR;LINE_TOO_LONG;");
+      }
+      else if (len > 0) 
       {
-        handleCommand(buffer);
-        buffer = "";
+        line[len] = '\0';
+        cmd_eol = ch;
+        runCommand(line);
       }
+      len = 0;
+      overflow = false;
+    }
+    else if (len < CMD_LINE_MAX)
+    {
+      line[len++] = ch;
     }
     else 
     {
-      buffer += ch;
+      overflow = true;   // bỏ cả dòng, báo lỗi khi gặp CR/LF
     }
   }
 
-  delay(5);
+  uint32_t now = millis();
+  pulseUpdate(buzzer, now);
+  adsUpdate();
+  sensorEventsUpdate();
+  cntUpdate(now);
+  fbUpdate(now);
+  statusStreamUpdate(now);
+  adsStreamUpdate(now);
+
+  // Tác vụ mở bulk chạy sau cùng: bulkStart() gửi header BIN ngay, payload đi ở các
+  // vòng sau (nhánh bulkUpdate ở đầu loop) → không dòng text nào được chen vào giữa
+  capUpdate();
+  rs485Update();     // frame RS485 / khối SNIFF: tự chờ nếu CAP vừa mở bulk
+
+  // OLED: chỉ khi không còn byte lệnh chờ → lệnh serial luôn được ưu tiên
+  if (!Serial.available()) oledUpdate();
 }
@@ -0,0 +1,362 @@
+"""
+Benchmark dashboard (parse / ingest / latency / plot), kết quả ra JSON để so giữa các bản
+(main.py → Ver4.py → ver5.py → ver8.py ...).
+
+    python bench.py                          # ver8, ghi bench_ver8_<ngày>.json
+    python bench.py --module main --quick
+    python bench.py --compare old.json new.json
+
+Đo:
+  parse_line      – dòng/s qua PSWKitWindow.parse_line (STATUS / DST / ADS / ACK / EVT)
+  ingest          – đọc file capture (serial_capture, nhanh nhất có thể) qua read_serial
+                    của cửa sổ: byte/s, dòng/s gồm cả parse + cập nhật UI
+  poll            – chỉ SerialManager.poll tách dòng / BIN (callback rỗng), nếu bản có SerialManager
+  click_to_wire   – btnBuz.click() → byte tới kit giả lập (kit_emulator, chỉ Linux)
+  status_to_label – kit gửi STATUS → labelADC1.setText (qua timer đọc serial thật)
+  plot_update     – thời gian 1 lần update_adc_plot + vẽ theo số điểm history
+
+Chạy với QT_QPA_PLATFORM=offscreen nếu chưa đặt; cần chạy từ thư mục repo (file .ui).
+"""
+import argparse
+import importlib
+import inspect
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import serial_capture
+
+
+PARSE_LINES = [
+    "STATUS;ADC=2048,1024,3000;MIN=2040,1020,2990;MAX=2056,1030,3010;N=100;"
+    "S=1,0,1,0,1;ADS=12000,-300,5,7;t=123456;",
+    "DST;ADC1=2100;S3=1;ADS0=12010;t=133456;",
+    "ADS;A0=12000;A1=-300;A2=5;A3=7;t=143456;",
+    "OK;R1=ON;",
+    "EVT;S2=1;t=153456;",
+]
+HISTORY_SIZES = (200, 1000, 10000, 100000)
+
+
+def _stats(samples_s) -> dict:
+    """ms: median / p95 / max / n."""
+    ms = sorted(s * 1000.0 for s in samples_s)
+    if not ms:
+        return {"n": 0}
+    return {
+        "n": len(ms),
+        "median_ms": round(statistics.median(ms), 3),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+def _pump(app, cond, timeout: float) -> bool:
+    """Chạy event loop Qt tới khi cond() đúng hoặc hết timeout."""
+    end = time.perf_counter() + timeout
+    while time.perf_counter() < end:
+        app.processEvents()
+        if cond():
+            return True
+        time.sleep(0.0002)
+    return False
+
+
+def _connect(win, port: str):
+    """Gắn transport cho cửa sổ, không qua toggle_connect (không bắt tay / Auto READ)."""
+    mgr = getattr(win, "serial_manager", None)
+    if mgr is not None:
+        ok, err = mgr.connect(port, 115200, timeout=0.1)
+        if not ok:
+            raise RuntimeError(err)
+        return mgr.ser
+    # Bản cũ (main.py / Ver4 / ver5): cửa sổ tự giữ self.ser
+    if port.startswith(serial_capture.REPLAY_PREFIX):
+        path, speed = serial_capture.parse_replay_port(port)
+        win.ser = serial_capture.ReplaySerial(path, speed)
+    else:
+        import serial
+        win.ser = serial.Serial(port, 115200, timeout=0.1)
+    return win.ser
+
+
+def _disconnect(win):
+    mgr = getattr(win, "serial_manager", None)
+    if mgr is not None:
+        mgr.disconnect()
+    elif getattr(win, "ser", None) is not None:
+        win.ser.close()
+        win.ser = None
+
+
+def _write_capture(path: str, lines: int):
+    """File capture tổng hợp: STATUS / ADS / EVT theo format FW, thêm 1 khối BIN mỗi 1000 dòng."""
+    import binascii
+
+    w = serial_capture.CaptureWriter(path)
+    block = bytes(range(256)) * 8
+    for i in range(lines):
+        head = PARSE_LINES[i % 3].rsplit("t=", 1)[0]        # bỏ t= mẫu, gắn t tăng dần
+        w.write(serial_capture.RX, f"{head}t={i * 10000};\r\n".encode())
+        if i % 1000 == 999:
+            crc = binascii.crc_hqx(block, 0xFFFF)
+            w.write(serial_capture.RX, f"BIN;TYPE=CAP;CH=1;N=1024;RATE=20000;FMT=U16LE;"
+                                       f"LEN={len(block)};CRC={crc:04X};\r\n".encode() + block)
+    w.close()
+
+
+# ----------------------------------------------------------------------
+# Các phép đo
+# ----------------------------------------------------------------------
+def bench_parse_line(app, win, n: int) -> dict:
+    t0 = time.perf_counter()
+    for i in range(n):
+        win.parse_line(PARSE_LINES[i % len(PARSE_LINES)])
+    dt = time.perf_counter() - t0
+    app.processEvents()
+    return {"lines": n, "lines_per_s": round(n / dt), "us_per_line": round(dt / n * 1e6, 2)}
+
+
+def bench_ingest(app, win, cap_path: str) -> dict:
+    rx = sum(len(d) for k, _, d in serial_capture.read_capture(cap_path) if k == serial_capture.RX)
+    ser = _connect(win, f"{serial_capture.REPLAY_PREFIX}{cap_path}@0")
+    t0 = time.perf_counter()
+    while not ser.finished:
+        win.read_serial()
+    dt = time.perf_counter() - t0
+    _disconnect(win)
+    app.processEvents()
+    return {"bytes": rx, "seconds": round(dt, 4), "mb_per_s": round(rx / dt / 1e6, 3)}
+
+
+def bench_poll(mod, cap_path: str) -> dict:
+    if not hasattr(mod, "SerialManager"):
+        return {"skipped": "module không có SerialManager"}
+    counts = [0, 0]
+
+    def on_line(_line):
+        counts[0] += 1
+
+    def on_bulk(_h, _p):
+        counts[1] += 1
+
+    mgr = mod.SerialManager(line_callback=on_line, bulk_callback=on_bulk)
+    ok, err = mgr.connect(f"{serial_capture.REPLAY_PREFIX}{cap_path}@0")
+    if not ok:
+        return {"skipped": err}
+    t0 = time.perf_counter()
+    while not mgr.ser.finished:
+        mgr.poll()
+    dt = time.perf_counter() - t0
+    rx = sum(len(d) for k, _, d in serial_capture.read_capture(cap_path) if k == serial_capture.RX)
+    mgr.disconnect()
+    return {"bytes": rx, "lines": counts[0], "bulk": counts[1],
+            "mb_per_s": round(rx / dt / 1e6, 3), "lines_per_s": round(counts[0] / dt)}
+
+
+def _probe_kit():
+    import kit_emulator
+
+    class ProbeKit(kit_emulator.KitEmulator):
+        """Kit giả lập ghi lại thời điểm nhận lệnh / gửi STATUS (time.perf_counter)."""
+
+        def __init__(self, *a, **kw):
+            super().__init__(*a, **kw)
+            self.rx_log = []
+            self.status_log = []
+
+        def handle_command(self, line):
+            self.rx_log.append((time.perf_counter(), line.strip()))
+            super().handle_command(line)
+
+        def send_status(self, compact=False, always=True):
+            self.status_log.append(time.perf_counter())
+            super().send_status(compact, always)
+
+    kit = ProbeKit("ESP32", wave="noise", seed=1)
+    return kit, kit_emulator.EmulatorHub([kit]).start()
+
+
+def bench_latency(app, win, n: int) -> dict:
+    if os.name != "posix":
+        return {"skipped": "kit_emulator cần pty (Linux)"}
+    kit, hub = _probe_kit()
+    out = {}
+    try:
+        _connect(win, kit.port)
+        win.timer.start()
+
+        # click → wire: chờ kit nhận BUZ, nghỉ > command_lock (120 ms) giữa 2 lần
+        lat = []
+        for _ in range(n):
+            seen = len(kit.rx_log)
+            t0 = time.perf_counter()
+            win.btnBuz.click()
+            if _pump(app, lambda: len(kit.rx_log) > seen, 1.0):
+                lat.append(kit.rx_log[seen][0] - t0)
+            _pump(app, lambda: False, 0.15)
+        out["click_to_wire"] = _stats(lat)
+
+        # STATUS → label: bọc labelADC1.setText để lấy thời điểm UI nhận giá trị
+        stamps = []
+        label = win.labelADC1
+        orig = label.setText
+
+        def stamped(text):
+            stamps.append(time.perf_counter())
+            orig(text)
+
+        label.setText = stamped
+        lat = []
+        for _ in range(n):
+            sent, shown = len(kit.status_log), len(stamps)
+            win.send_cmd("READ")
+            if _pump(app, lambda: len(stamps) > shown and len(kit.status_log) > sent, 1.0):
+                lat.append(stamps[shown] - kit.status_log[sent])
+            _pump(app, lambda: False, 0.15)
+        label.setText = orig
+        out["status_to_label"] = _stats(lat)
+        out["status_to_label"]["read_timer_ms"] = win.timer.interval()
+    finally:
+        win.timer.stop()
+        _disconnect(win)
+        hub.stop()
+    return out
+
+
+def _set_history(win, n: int):
+    """Đổ n điểm vào history của plot theo kiểu của từng bản dashboard."""
+    if hasattr(win, "history_len"):              # main.py / Ver4.py
+        win.history_len = n
+        win.adc_history = [2048] * n
+        return
+    win.max_points = n
+    for name in ("plot_t", "plot_data", "plot_min", "plot_max"):
+        if hasattr(win, name):
+            setattr(win, name, [i * 0.01 for i in range(n)] if name == "plot_t" else [2048] * n)
+
+
+def bench_plot(app, win, updates: int) -> dict:
+    takes_t = "t" in inspect.signature(win.update_adc_plot).parameters
+    out = {}
+    for n in HISTORY_SIZES:
+        _set_history(win, n)
+        samples = []
+        for i in range(updates):
+            v = 2048 + (i % 50)
+            t0 = time.perf_counter()
+            if takes_t:
+                win.update_adc_plot(n * 0.01 + i * 0.01, v)
+            else:
+                win.update_adc_plot(v)
+            app.processEvents()                  # gồm cả vẽ lại
+            samples.append(time.perf_counter() - t0)
+        out[str(n)] = _stats(samples)
+    _set_history(win, 200)
+    return out
+
+
+# ----------------------------------------------------------------------
+def run(module: str, quick: bool) -> dict:
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    mod = importlib.import_module(module)
+    win = mod.PSWKitWindow()
+    win.show()
+    app.processEvents()
+    # Vòng đo không chạy event loop → watchdog (ver8) sẽ lấy mẫu stack liên tục, làm lệch số đo
+    stall = getattr(win, "actionStall", None)
+    if stall is not None:
+        stall.setChecked(False)
+
+    n_parse = 5000 if quick else 50000
+    n_cap = 5000 if quick else 50000
+    n_lat = 10 if quick else 50
+    n_plot = 20 if quick else 100
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        cap = os.path.join(tmp, "bench.cap")
+        _write_capture(cap, n_cap)
+        for name, fn in (
+            ("parse_line", lambda: bench_parse_line(app, win, n_parse)),
+            ("ingest", lambda: bench_ingest(app, win, cap)),
+            ("poll", lambda: bench_poll(mod, cap)),
+            ("latency", lambda: bench_latency(app, win, n_lat)),
+            ("plot_update", lambda: bench_plot(app, win, n_plot)),
+        ):
+            try:
+                r = fn()
+            except Exception as e:
+                r = {"error": f"{type(e).__name__}: {e}"}
+            if name == "latency" and "skipped" not in r and "error" not in r:
+                results.update(r)
+            else:
+                results[name] = r
+            print(f"{name}: {json.dumps(r, ensure_ascii=False)}")
+
+    win.close()
+    return {
+        "module": module,
+        "quick": quick,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def _flatten(d: dict, prefix: str = "") -> dict:
+    out = {}
+    for k, v in d.items():
+        if isinstance(v, dict):
+            out.update(_flatten(v, f"{prefix}{k}."))
+        elif isinstance(v, (int, float)):
+            out[f"{prefix}{k}"] = v
+    return out
+
+
+def compare(old_path: str, new_path: str):
+    """In bảng so sánh chỉ số giữa 2 file kết quả (ratio = new / old)."""
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    a, b = _flatten(old["results"]), _flatten(new["results"])
+    print(f"{'metric':45s} {old['module']:>12s} {new['module']:>12s}  ratio")
+    for key in sorted(set(a) | set(b)):
+        va, vb = a.get(key), b.get(key)
+        ratio = f"{vb / va:6.2f}" if va and vb is not None else "     -"
+        print(f"{key:45s} {'-' if va is None else va:>12} {'-' if vb is None else vb:>12}  {ratio}")
+
+
+def _main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark dashboard PSW KIT")
+    ap.add_argument("--module", default="ver8", help="module dashboard (ver8, ver5, Ver4, main)")
+    ap.add_argument("--quick", action="store_true", help="ít vòng lặp hơn (CI / thử nhanh)")
+    ap.add_argument("--out", default=None, help="file JSON kết quả")
+    ap.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    a = ap.parse_args(argv)
+
+    if a.compare:
+        compare(*a.compare)
+        return 0
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    report = run(a.module, a.quick)
+    out = a.out or f"bench_{a.module}_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"→ {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -0,0 +1,733 @@
+"""
+Giả lập ESP32 KIT (Fw/src/main.cpp) trên pseudo-terminal Linux – test dashboard / benchmark
+không cần phần cứng. Mỗi kit là 1 pty; dashboard mở /dev/pts/N (hoặc symlink --link)
+như 1 cổng COM thật.
+
+Lệnh: PING, INFO, BUZ, READ [M | STREAM <ms>], DELTA, ADS [RATE|GAIN|STREAM], STATE,
+LED, RGB, OL1/OL2, FB, R<n>/SIO<n> ON|OFF, PERF, SAMPLE, CAP, EVT, CNT, LINK.
+Không giả lập: TRIG, RS485 (trả ERR;UNKNOWN_CMD=...; như FW cũ).
+
+Tín hiệu tổng hợp: ADC / ADS theo Waveform (sine / square / ramp / noise / const),
+sensor Sk là xung vuông chu kỳ sensor_period_ms * k. Lỗi bơm vào (Faults): trễ + jitter
+mỗi frame trả lời, bỏ frame, lật 1 byte, chèn dòng rác.
+
+Chỉ dùng thư viện chuẩn; nhiều kit chạy chung 1 thread (select), đủ cho 16+ kit / máy.
+Mỗi kit có symlink LINK_PREFIX<i> → pty; dashboard tự liệt kê các symlink này khi Refresh.
+
+    python kit_emulator.py --board B16M --count 16
+    python kit_emulator.py --latency 5 --jitter 2 --drop 0.01 --wave square
+"""
+import argparse
+import binascii
+import errno
+import heapq
+import math
+import os
+import random
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+import tty
+
+
+FW_VERSION = "1.17"
+
+# Khớp EMULATOR_PORT_GLOB trong ver8.py
+LINK_PREFIX = "/tmp/pswkit-kit"
+
+# tên board: (relay, SIO, ADC, sensor) – khớp update_relay_ui_for_board / update_sensor_ui_for_board
+BOARDS = {
+    "ESP32":       (4, 3, 3, 5),      # Fw/src/main.cpp + pins.h hiện tại
+    "ESP_IO_Ver2": (4, 3, 3, 5),
+    "ESP_IO_Ver3": (4, 3, 3, 5),
+    "A4S":         (4, 3, 3, 5),
+    "A8S":         (8, 6, 4, 8),
+    "KIT":         (8, 6, 4, 8),
+    "B8M":         (8, 6, 4, 8),
+    "B16M":        (16, 6, 4, 16),
+}
+
+CNT_COUNT = 4                 # PCNT trên S1..S4
+ADS_CHANNELS = 4
+ADS_RATES = (8, 16, 32, 64, 128, 250, 475, 860)
+ADS_GAINS = ("2/3", "1", "2", "4", "8", "16")
+SAMPLE_RATE_MAX = 5000
+CAP_MAX_SAMPLES = 8192
+CAP_RATE_MIN, CAP_RATE_MAX = 1000, 100000
+LINK_BAUDS = (115200, 230400, 460800, 921600)
+OLED_WIDTH, OLED_PAGES = 128, 8
+FB_RX_TIMEOUT_S = 0.5
+CMD_LINE_MAX = 600
+
+
+class Waveform:
+    """Giá trị tổng hợp theo thời gian t (giây); phase (0..1) lệch pha giữa các kênh."""
+    KINDS = ("sine", "square", "ramp", "noise", "const")
+
+    def __init__(self, kind: str = "sine", offset: float = 2048, amp: float = 1500,
+                 period_s: float = 2.0, noise: float = 4.0, rng=None):
+        if kind not in self.KINDS:
+            raise ValueError(f"waveform '{kind}' không hỗ trợ ({', '.join(self.KINDS)})")
+        self.kind = kind
+        self.offset = offset
+        self.amp = amp
+        self.period_s = period_s
+        self.noise = noise
+        self.rng = rng or random.Random()
+
+    def value(self, t: float, phase: float = 0.0) -> float:
+        x = (t / self.period_s + phase) % 1.0
+        if self.kind == "sine":
+            v = math.sin(2 * math.pi * x)
+        elif self.kind == "square":
+            v = 1.0 if x < 0.5 else -1.0
+        elif self.kind == "ramp":
+            v = 2 * x - 1
+        elif self.kind == "noise":
+            v = self.rng.uniform(-1, 1)
+        else:
+            v = 0.0
+        return self.offset + self.amp * v + (self.rng.gauss(0, self.noise) if self.noise else 0.0)
+
+
+class Faults:
+    """Lỗi bơm vào đường trả lời. Xác suất tính trên mỗi frame; garbage_per_s = số dòng rác / giây."""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, drop: float = 0.0,
+                 corrupt: float = 0.0, garbage_per_s: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.drop = drop
+        self.corrupt = corrupt
+        self.garbage_per_s = garbage_per_s
+
+
+class KitEmulator:
+    """1 kit giả lập trên 1 pty. on_readable() khi master fd có dữ liệu, tick() định kỳ."""
+
+    def __init__(self, board: str = "ESP32", wave: str = "sine", faults: Faults = None,
+                 sensor_period_ms: float = 500.0, seed: int = None, link: str = None):
+        if board not in BOARDS:
+            raise ValueError(f"board '{board}' không có ({', '.join(BOARDS)})")
+        self.board = board
+        self.relay_count, self.sio_count, self.adc_count, self.sensor_count = BOARDS[board]
+        self.faults = faults or Faults()
+        self.rng = random.Random(seed)
+        self.wave = Waveform(wave, rng=self.rng)
+        self.ads_wave = Waveform(wave, offset=0, amp=12000, period_s=3.0, noise=8.0, rng=self.rng)
+        self.sensor_period_s = sensor_period_ms / 1000.0
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)                 # không echo, không đổi \n → \r\n
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+        self.link = link
+        if link:
+            if os.path.islink(link):
+                os.unlink(link)
+            os.symlink(self.port, link)
+
+        self._t0 = time.monotonic()
+        self._rx = bytearray()
+        self._skip_lf = False
+        self._out = []                         # heap (due, seq, bytes)
+        self._seq = 0
+        self._last_due = 0.0
+        self.rx_bytes = 0
+        self.tx_bytes = 0
+        self.tx_dropped = 0                    # byte bỏ vì phía PC không đọc (buffer pty đầy)
+
+        # Trạng thái output
+        self.relay_mask = 0
+        self.sio_mask = 0
+        self.led_on = False
+        self.rgb = (0, 0, 0)
+        self.oled = ["", ""]
+        self.fb = bytearray(OLED_WIDTH * OLED_PAGES)
+        self._fb_rx = None                     # dict khi đang nhận FB
+
+        # Stream / chế độ
+        self.status_stream_s = 0.0
+        self.ads_stream_s = 0.0
+        self.cnt_stream_s = 0.0
+        self._next = {"status": 0.0, "ads": 0.0, "cnt": 0.0, "garbage": 0.0}
+        self.delta_on = False
+        self.delta_band = 8
+        self.delta_key_s = 2.0
+        self._delta_key_last = 0.0
+        self._delta_need_key = True
+        self._sent = None                      # (adc, s, ads) lần gửi trước
+        self.evt_on = False
+        self._last_s = self.sensors(0.0)
+        self.sample_hz = 0
+        self._last_take = 0.0
+        self.ads_sps = 128
+        self.ads_gain = "1"
+        self.cnt_gate_s = 1.0
+        self._cnt_reset = 0.0
+        self.perf = [0, 0, 0, 0]               # N, LAST, SUM, MAX (µs)
+
+    # ------------------------------------------------------------------
+    # Tín hiệu
+    # ------------------------------------------------------------------
+    def now(self) -> float:
+        return time.monotonic() - self._t0
+
+    def micros(self, t: float = None) -> int:
+        return int((self.now() if t is None else t) * 1e6) & 0xFFFFFFFF
+
+    def adc(self, t: float, ch: int) -> int:
+        return max(0, min(4095, int(self.wave.value(t, ch / max(1, self.adc_count)))))
+
+    def ads(self, t: float, ch: int) -> int:
+        return max(-32768, min(32767, int(self.ads_wave.value(t, ch / ADS_CHANNELS))))
+
+    def sensors(self, t: float) -> list:
+        return [1 if (t / (self.sensor_period_s * (i + 1))) % 1.0 < 0.5 else 0
+                for i in range(self.sensor_count)]
+
+    # ------------------------------------------------------------------
+    # I/O pty
+    # ------------------------------------------------------------------
+    def fileno(self) -> int:
+        return self.master
+
+    def close(self):
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        if self.link and os.path.islink(self.link):
+            os.unlink(self.link)
+
+    def on_readable(self):
+        try:
+            data = os.read(self.master, 4096)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EIO):
+                return
+            raise
+        self.rx_bytes += len(data)
+        self._rx += data
+        self._drain()
+
+    def _drain(self):
+        while self._rx:
+            if self._fb_rx is not None:
+                if self._skip_lf:
+                    self._skip_lf = False
+                    if self._rx[:1] == b"\n":
+                        del self._rx[:1]
+                        continue
+                need = self._fb_rx["len"] - len(self._fb_rx["data"])
+                self._fb_rx["data"] += self._rx[:need]
+                del self._rx[:need]
+                if len(self._fb_rx["data"]) == self._fb_rx["len"]:
+                    self._fb_done()
+                continue
+
+            if self._skip_lf:
+                self._skip_lf = False
+                if self._rx[:1] == b"\n":
+                    del self._rx[:1]
+                    continue
+
+            cr, lf = self._rx.find(b"\r"), self._rx.find(b"\n")
+            ends = [i for i in (cr, lf) if i >= 0]
+            if not ends:
+                if len(self._rx) > CMD_LINE_MAX:
+                    self._rx.clear()
+                    self.reply("ERR;LINE_TOO_LONG;")
+                return
+            idx = min(ends)
+            line = bytes(self._rx[:idx]).decode("utf-8", errors="ignore")
+            eol = self._rx[idx:idx + 1]
+            del self._rx[:idx + 1]
+            self._skip_lf = (eol == b"\r")
+
+            t_start = time.perf_counter()
+            self.handle_command(line)
+            dt = int((time.perf_counter() - t_start) * 1e6)
+            self.perf[0] += 1
+            self.perf[1] = dt
+            self.perf[2] += dt
+            self.perf[3] = max(self.perf[3], dt)
+
+    def reply(self, text: str):
+        self.send((text + "\r\n").encode("utf-8"))
+
+    def send(self, data: bytes):
+        """Đưa frame vào hàng đợi gửi, qua bộ bơm lỗi. Thứ tự frame luôn được giữ."""
+        f = self.faults
+        if f.drop and self.rng.random() < f.drop:
+            return
+        if f.corrupt and self.rng.random() < f.corrupt:
+            b = bytearray(data)
+            b[self.rng.randrange(len(b))] ^= 1 << self.rng.randrange(8)
+            data = bytes(b)
+        due = time.monotonic() + (f.latency_ms + self.rng.uniform(0, f.jitter_ms)) / 1000.0
+        due = max(due, self._last_due)
+        self._last_due = due
+        self._seq += 1
+        heapq.heappush(self._out, (due, self._seq, data))
+
+    def _flush_out(self, mono: float):
+        while self._out and self._out[0][0] <= mono:
+            _, _, data = heapq.heappop(self._out)
+            try:
+                n = os.write(self.master, data)
+            except BlockingIOError:
+                n = 0
+            except OSError:
+                n = 0
+            self.tx_bytes += n
+            self.tx_dropped += len(data) - n
+
+    def next_deadline(self) -> float:
+        """time.monotonic() của việc cần làm kế tiếp (cho timeout select)."""
+        t = [self._out[0][0]] if self._out else []
+        base = self._t0
+        for key, period in (("status", self.status_stream_s), ("ads", self.ads_stream_s),
+                            ("cnt", self.cnt_stream_s)):
+            if period:
+                t.append(base + self._next[key])
+        if self.evt_on:
+            t.append(time.monotonic() + 0.001)
+        if self.faults.garbage_per_s:
+            t.append(base + self._next["garbage"])
+        if self._fb_rx is not None:
+            t.append(self._fb_rx["start"] + FB_RX_TIMEOUT_S)
+        return min(t) if t else time.monotonic() + 0.1
+
+    # ------------------------------------------------------------------
+    # Việc định kỳ (loop() của FW)
+    # ------------------------------------------------------------------
+    def tick(self):
+        mono = time.monotonic()
+        t = mono - self._t0
+
+        if self._fb_rx is not None and mono - self._fb_rx["start"] >= FB_RX_TIMEOUT_S:
+            self._fb_rx = None
+            self.reply("ERR;FB_TIMEOUT;")
+
+        if self.evt_on:
+            s = self.sensors(t)
+            for i, (old, new) in enumerate(zip(self._last_s, s)):
+                if old != new:
+                    self.reply(f"EVT;S{i + 1}={new};t={self.micros(t)};")
+            self._last_s = s
+
+        if self.status_stream_s and t >= self._next["status"]:
+            self._next["status"] = t + self.status_stream_s
+            self.send_status(always=False)
+        if self.ads_stream_s and t >= self._next["ads"]:
+            self._next["ads"] = t + self.ads_stream_s
+            self.send_ads()
+        if self.cnt_stream_s and t >= self._next["cnt"]:
+            self._next["cnt"] = t + self.cnt_stream_s
+            self.send_counters()
+        if self.faults.garbage_per_s and t >= self._next["garbage"]:
+            self._next["garbage"] = t + self.rng.expovariate(self.faults.garbage_per_s)
+            junk = bytes(self.rng.randrange(32, 127) for _ in range(self.rng.randrange(1, 40)))
+            self.send(junk + b"\r\n")
+
+        self._flush_out(mono)
+
+    # ------------------------------------------------------------------
+    # Frame gửi PC
+    # ------------------------------------------------------------------
+    def take_status(self):
+        t = self.now()
+        adc = [self.adc(t, i) for i in range(self.adc_count)]
+        mins = maxs = None
+        n = 0
+        if self.sample_hz:
+            dt = t - self._last_take if self._last_take else 0.0
+            n = int(dt * self.sample_hz)
+            if n:
+                # Vài điểm trong chu kỳ thay cho n mẫu thật (đủ cho MIN/MAX/mean)
+                k = min(n, 32)
+                pts = [[self.adc(self._last_take + dt * (j + 1) / k, i) for j in range(k)]
+                       for i in range(self.adc_count)]
+                adc = [sum(p) // k for p in pts]
+                mins = [min(p) for p in pts]
+                maxs = [max(p) for p in pts]
+        self._last_take = t
+        ads = [self.ads(t, i) for i in range(ADS_CHANNELS)]
+        return t, adc, mins, maxs, n, self.sensors(t), ads
+
+    def send_status(self, compact: bool = False, always: bool = True):
+        t, adc, mins, maxs, n, s, ads = self.take_status()
+        if (not self.delta_on or self._delta_need_key or self._sent is None
+                or t - self._delta_key_last >= self.delta_key_s):
+            parts = ["STATUS", "ADC=" + ",".join(map(str, adc))]
+            if n:
+                parts += ["MIN=" + ",".join(map(str, mins)), "MAX=" + ",".join(map(str, maxs)), f"N={n}"]
+            if compact:
+                parts.append("SM=%04X" % sum(v << i for i, v in enumerate(s)))
+            else:
+                parts.append("S=" + ",".join(map(str, s)))
+            parts += ["ADS=" + ",".join(map(str, ads)), f"t={self.micros(t)}"]
+            self.reply(";".join(parts) + ";")
+            self._sent = (list(adc), list(s), list(ads))
+            self._delta_key_last = t
+            self._delta_need_key = False
+            return
+
+        sent_adc, sent_s, sent_ads = self._sent
+        parts = ["DST"]
+        for i, v in enumerate(adc):
+            if abs(v - sent_adc[i]) > self.delta_band:
+                parts.append(f"ADC{i + 1}={v}")
+                sent_adc[i] = v
+        for i, v in enumerate(s):
+            if v != sent_s[i]:
+                parts.append(f"S{i + 1}={v}")
+                sent_s[i] = v
+        for i, v in enumerate(ads):
+            if abs(v - sent_ads[i]) > self.delta_band:
+                parts.append(f"ADS{i}={v}")
+                sent_ads[i] = v
+        if len(parts) == 1 and not always:
+            return
+        parts.append(f"t={self.micros(t)}")
+        self.reply(";".join(parts) + ";")
+
+    def send_ads(self):
+        t = self.now()
+        vals = "".join(f"A{i}={self.ads(t, i)};" for i in range(ADS_CHANNELS))
+        self.reply(f"ADS;{vals}t={self.micros(t)};")
+
+    def send_counters(self):
+        t = self.now()
+        el = t - self._cnt_reset
+        periods = [self.sensor_period_s * (i + 1) for i in range(min(CNT_COUNT, self.sensor_count))]
+        counts = [int(el / p) for p in periods]
+        freqs = [1.0 / p if el >= self.cnt_gate_s else 0.0 for p in periods]
+        self.reply("CNT;C=" + ",".join(map(str, counts)) + ";F="
+                   + ",".join(f"{f:.2f}" for f in freqs) + f";t={self.micros(t)};")
+
+    def send_state(self):
+        self.reply("STATE;R=%04X;SIO=%02X;LED=%d;RGB=%u,%u,%u;"
+                   % (self.relay_mask, self.sio_mask, int(self.led_on), *self.rgb))
+
+    def send_bulk(self, fields: str, data: bytes):
+        crc = binascii.crc_hqx(data, 0xFFFF)
+        self.send(f"BIN;{fields}LEN={len(data)};CRC={crc:04X};\r\n".encode() + data)
+
+    # ------------------------------------------------------------------
+    # Lệnh (handleCommand của FW)
+    # ------------------------------------------------------------------
+    def handle_command(self, line: str):
+        line = line.strip(" \t")
+        if not line:
+            return
+        verb, _, args = line.partition(" ")
+        verb = verb.upper()
+        args = args.strip(" \t")
+
+        if verb in COMMANDS:
+            getattr(self, f"cmd_{verb.lower()}")(args)
+            return
+        if self._indexed_output(verb, args):
+            return
+        self.reply(f"ERR;UNKNOWN_CMD={verb}{' ' + args if args else ''};")
+
+    def _indexed_output(self, verb: str, args: str) -> bool:
+        for prefix, count, attr in (("R", self.relay_count, "relay_mask"),
+                                    ("SIO", self.sio_count, "sio_mask")):
+            num = verb[len(prefix):]
+            if not verb.startswith(prefix) or not num.isdigit():
+                continue
+            idx = int(num)
+            if idx < 1 or idx > count:
+                return False
+            on = args.upper()
+            if on not in ("ON", "OFF"):
+                self.reply(f"ERR;BAD_{verb};")
+                return True
+            mask = getattr(self, attr)
+            mask = mask | (1 << (idx - 1)) if on == "ON" else mask & ~(1 << (idx - 1))
+            setattr(self, attr, mask)
+            self.reply(f"OK;{verb}={on};")
+            return True
+        return False
+
+    def cmd_ping(self, args):
+        self.reply("PONG")
+
+    def cmd_info(self, args):
+        self.reply(f"KIT={self.board};FW={FW_VERSION};")
+
+    def cmd_buz(self, args):
+        self.reply("OK;BUZ;")
+
+    def cmd_read(self, args):
+        if args[:6].upper() == "STREAM":
+            ms = _int(args[6:])
+            self.status_stream_s = ms / 1000.0
+            self._next["status"] = self.now()
+            self.reply(f"OK;READ_STREAM={ms};")
+            return
+        self.send_status(compact=(args.upper() == "M"))
+
+    def cmd_delta(self, args):
+        if args.upper() == "OFF":
+            self.delta_on = False
+            self.reply("OK;DELTA=OFF;")
+            return
+        v = args.split()
+        if len(v) != 2 or not all(x.isdigit() for x in v) or int(v[0]) > 4095 or int(v[1]) < 100:
+            self.reply("ERR;BAD_DELTA;")
+            return
+        self.delta_band, key_ms = int(v[0]), int(v[1])
+        self.delta_key_s = key_ms / 1000.0
+        self.delta_on = True
+        self._delta_need_key = True
+        self.reply(f"OK;DELTA={self.delta_band},{key_ms};")
+
+    def cmd_ads(self, args):
+        if not args:
+            self.send_ads()
+            return
+        key, _, val = args.partition(" ")
+        key, val = key.upper(), val.strip()
+        if key == "RATE" and _int(val) in ADS_RATES:
+            self.ads_sps = _int(val)
+            self.reply(f"OK;ADS_RATE={self.ads_sps};")
+        elif key == "GAIN" and val in ADS_GAINS:
+            self.ads_gain = val
+            self.reply(f"OK;ADS_GAIN={val};")
+        elif key == "STREAM" and val:
+            ms = _int(val)
+            self.ads_stream_s = ms / 1000.0
+            self._next["ads"] = self.now()
+            self.reply(f"OK;ADS_STREAM={ms};")
+        else:
+            self.reply("ERR;BAD_ADS;")
+
+    def cmd_state(self, args):
+        self.send_state()
+
+    def cmd_led(self, args):
+        on = args.upper()
+        if on not in ("ON", "OFF"):
+            self.reply("ERR;BAD_LED;")
+            return
+        self.led_on = (on == "ON")
+        self.reply(f"OK;LED={on};")
+
+    def cmd_rgb(self, args):
+        p = args.split(",")
+        if not args or len(p) < 3:
+            self.reply("ERR;BAD_RGB;")
+            return
+        self.rgb = tuple(_int(x) & 0xFF for x in p[:3])
+        self.reply("OK;RGB=%u,%u,%u;" % self.rgb)
+
+    def _oled(self, line: int, args: str, tag: str):
+        if not args:
+            self.reply(f"ERR;BAD_{tag};")
+            return
+        self.oled[line] = args[:21]
+        self.reply(f"OK;{tag};")
+
+    def cmd_ol1(self, args):
+        self._oled(0, args, "OL1")
+
+    def cmd_ol2(self, args):
+        self._oled(1, args, "OL2")
+
+    def cmd_fb(self, args):
+        # Byte raw theo ngay sau dòng lệnh; \n của CRLF đã được _drain bỏ qua (_skip_lf)
+        v = args.split()
+        try:
+            col, page, w, pages = (int(x) for x in v[:4])
+            crc = int(v[4], 16)
+        except (ValueError, IndexError):
+            self.reply("ERR;BAD_FB;")
+            return
+        if (col < 0 or page < 0 or w < 1 or pages < 1 or col + w > OLED_WIDTH
+                or page + pages > OLED_PAGES or crc > 0xFFFF):
+            self.reply("ERR;BAD_FB;")
+            return
+        self._fb_rx = {"col": col, "page": page, "w": w, "pages": pages, "crc": crc,
+                       "len": w * pages, "data": bytearray(), "start": time.monotonic()}
+
+    def _fb_done(self):
+        rx, self._fb_rx = self._fb_rx, None
+        if binascii.crc_hqx(bytes(rx["data"]), 0xFFFF) != rx["crc"]:
+            self.reply("ERR;FB_CRC;")
+            return
+        for pg in range(rx["pages"]):
+            dst = (rx["page"] + pg) * OLED_WIDTH + rx["col"]
+            self.fb[dst:dst + rx["w"]] = rx["data"][pg * rx["w"]:(pg + 1) * rx["w"]]
+        self.reply(f"OK;FB={rx['len']};")
+
+    def cmd_perf(self, args):
+        if args.upper() == "RESET":
+            self.perf = [0, 0, 0, 0]
+            self.reply("OK;PERF=RESET;")
+            return
+        n, last, total, mx = self.perf
+        self.reply(f"PERF;N={n};LAST={last};AVG={total // n if n else 0};MAX={mx};")
+
+    def cmd_sample(self, args):
+        if not args:
+            self.reply(f"SAMPLE;RATE={self.sample_hz};")
+            return
+        hz = _int(args, -1)
+        if hz < 0 or hz > SAMPLE_RATE_MAX:
+            self.reply("ERR;BAD_SAMPLE;")
+            return
+        self.sample_hz = hz
+        self._last_take = self.now()
+        self.reply(f"OK;SAMPLE={hz};")
+
+    def cmd_cap(self, args):
+        v = [_int(x) for x in args.split()[:3]] + [0, 0, 0]
+        ch, n, rate = v[:3]
+        if ch < 1 or ch > self.adc_count:
+            err = "BAD_CH"
+        elif n < 1 or n > CAP_MAX_SAMPLES:
+            err = "BAD_N"
+        elif rate < CAP_RATE_MIN or rate > CAP_RATE_MAX:
+            err = "BAD_RATE"
+        else:
+            err = None
+        if err:
+            self.reply(f"ERR;CAP_{err};")
+            return
+        self.reply("OK;CAP=START;")
+        t0 = self.now()
+        samples = [self.adc(t0 + k / rate, ch - 1) for k in range(n)]
+        # FW gửi khi đủ mẫu: hẹn khối BIN sau đúng thời gian capture
+        self._last_due = max(self._last_due, time.monotonic() + n / rate)
+        self.send_bulk(f"TYPE=CAP;CH={ch};N={n};RATE={rate};FMT=U16LE;",
+                       struct.pack(f"<{n}H", *samples))
+
+    def cmd_evt(self, args):
+        on = args.upper()
+        if on not in ("ON", "OFF"):
+            self.reply("ERR;BAD_EVT;")
+            return
+        self.evt_on = (on == "ON")
+        self._last_s = self.sensors(self.now())
+        self.reply(f"OK;EVT={on};")
+
+    def cmd_cnt(self, args):
+        if not args:
+            self.send_counters()
+            return
+        key, _, val = args.partition(" ")
+        key, v = key.upper(), _int(val, -1)
+        if key == "RESET":
+            self._cnt_reset = self.now()
+            self.reply("OK;CNT=RESET;")
+        elif key == "GATE" and 10 <= v <= 60000:
+            self.cnt_gate_s = v / 1000.0
+            self.reply(f"OK;CNT_GATE={v};")
+        elif key == "STREAM" and v >= 0:
+            self.cnt_stream_s = v / 1000.0
+            self._next["cnt"] = self.now()
+            self.reply(f"OK;CNT_STREAM={v};")
+        else:
+            self.reply("ERR;BAD_CNT;")
+
+    def cmd_link(self, args):
+        # pty không có baud thật: chỉ trả lời như FW
+        baud = _int(args)
+        if baud not in LINK_BAUDS:
+            self.reply("ERR;BAD_LINK;")
+            return
+        self.reply(f"OK;LINK={baud};")
+
+
+COMMANDS = ("PING", "INFO", "BUZ", "READ", "DELTA", "ADS", "STATE", "LED", "RGB",
+            "OL1", "OL2", "FB", "PERF", "SAMPLE", "CAP", "EVT", "CNT", "LINK")
+
+
+def _int(s: str, default: int = 0) -> int:
+    try:
+        return int(s.strip())
+    except (ValueError, AttributeError):
+        return default
+
+
+class EmulatorHub:
+    """Chạy nhiều KitEmulator trong 1 thread (select trên master fd của tất cả kit)."""
+
+    def __init__(self, kits):
+        self.kits = list(kits)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run(self):
+        by_fd = {k.fileno(): k for k in self.kits}
+        while not self._stop.is_set():
+            deadline = min(k.next_deadline() for k in self.kits)
+            timeout = min(0.05, max(0.0, deadline - time.monotonic()))
+            readable, _, _ = select.select(list(by_fd), [], [], timeout)
+            for fd in readable:
+                by_fd[fd].on_readable()
+            for k in self.kits:
+                k.tick()
+
+    def start(self) -> "EmulatorHub":
+        self._thread = threading.Thread(target=self.run, name="kit-emulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for k in self.kits:
+            k.close()
+
+
+def _main(argv=None):
+    ap = argparse.ArgumentParser(description="Giả lập ESP32 KIT trên pty")
+    ap.add_argument("--board", default="ESP32", choices=sorted(BOARDS))
+    ap.add_argument("--count", type=int, default=1, help="số kit")
+    ap.add_argument("--wave", default="sine", choices=Waveform.KINDS)
+    ap.add_argument("--sensor-period", type=float, default=500.0, help="chu kỳ S1 (ms), Sk = k lần")
+    ap.add_argument("--latency", type=float, default=0.0, help="trễ trả lời (ms)")
+    ap.add_argument("--jitter", type=float, default=0.0, help="jitter thêm 0..N ms")
+    ap.add_argument("--drop", type=float, default=0.0, help="xác suất bỏ 1 frame")
+    ap.add_argument("--corrupt", type=float, default=0.0, help="xác suất lật 1 bit trong frame")
+    ap.add_argument("--garbage", type=float, default=0.0, help="số dòng rác / giây")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--link", default=LINK_PREFIX, help="symlink <link>0, <link>1, ... tới pty ('' = không tạo)")
+    a = ap.parse_args(argv)
+
+    faults = Faults(a.latency, a.jitter, a.drop, a.corrupt, a.garbage)
+    kits = [
+        KitEmulator(a.board, a.wave, faults, a.sensor_period,
+                    seed=None if a.seed is None else a.seed + i,
+                    link=f"{a.link}{i}" if a.link else None)
+        for i in range(a.count)
+    ]
+    for i, k in enumerate(kits):
+        print(f"kit {i}: {k.board} → {k.link or k.port}" + (f" ({k.port})" if k.link else ""))
+    sys.stdout.flush()
+
+    hub = EmulatorHub(kits)
+    # kill / timeout cũng dọn symlink như Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        hub.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        hub.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
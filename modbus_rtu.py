@@ -0,0 +1,423 @@
+"""
+Modbus RTU master chạy qua RS485 passthrough của kit (RS485 TX <hex> / BIN;TYPE=RS485;).
+
+Không phụ thuộc Qt / serial: master chỉ cần 1 hàm send(bytes) và được gọi
+feed(bytes) khi có dữ liệu RX, poll(now) định kỳ. Nhờ vậy dùng được cả với
+kit thật lẫn ModbusSlaveSim (slave giả lập chạy ngay trong dashboard).
+
+Chạy thử không cần phần cứng:
+    python modbus_rtu.py
+"""
+import json
+import struct
+import time
+
+
+# Hàm Modbus hỗ trợ cho poll (đọc) và ghi
+FUNC_READ_COILS = 1
+FUNC_READ_DISCRETE = 2
+FUNC_READ_HOLDING = 3
+FUNC_READ_INPUT = 4
+FUNC_WRITE_SINGLE = 6
+
+# Số thanh ghi tối đa / request (giới hạn chuẩn Modbus)
+MAX_READ_REGISTERS = 125
+MAX_READ_BITS = 2000
+
+# Số thanh ghi trống tối đa được đọc kèm khi gộp 2 vùng gần nhau:
+# đọc thừa vài thanh ghi vẫn rẻ hơn thêm 1 request (8 byte + 3.5 ký tự gap + thời gian slave)
+MERGE_MAX_GAP = 4
+
+# Kiểu dữ liệu → (số thanh ghi, định dạng struct big-endian)
+TYPES = {
+    "u16": (1, ">H"),
+    "i16": (1, ">h"),
+    "u32": (2, ">I"),
+    "i32": (2, ">i"),
+    "f32": (2, ">f"),
+}
+
+EXCEPTION_NAMES = {
+    1: "ILLEGAL FUNCTION",
+    2: "ILLEGAL DATA ADDRESS",
+    3: "ILLEGAL DATA VALUE",
+    4: "SLAVE DEVICE FAILURE",
+    6: "SLAVE DEVICE BUSY",
+}
+
+
+class ModbusError(Exception):
+    """Frame sai CRC / sai định dạng / slave trả exception."""
+
+
+def crc16_modbus(data: bytes) -> int:
+    """CRC-16/MODBUS (poly 0xA001 đảo bit, init 0xFFFF)."""
+    crc = 0xFFFF
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+def with_crc(pdu: bytes) -> bytes:
+    """Thêm CRC (byte thấp trước) vào cuối frame."""
+    return pdu + struct.pack("<H", crc16_modbus(pdu))
+
+
+def check_crc(frame: bytes) -> bool:
+    return len(frame) >= 4 and crc16_modbus(frame[:-2]) == struct.unpack("<H", frame[-2:])[0]
+
+
+def build_read(unit: int, func: int, addr: int, count: int) -> bytes:
+    return with_crc(struct.pack(">BBHH", unit, func, addr, count))
+
+
+def build_write_single(unit: int, addr: int, value: int) -> bytes:
+    return with_crc(struct.pack(">BBHH", unit, FUNC_WRITE_SINGLE, addr, value & 0xFFFF))
+
+
+def expected_length(request: bytes) -> int:
+    """Độ dài response bình thường cho request (để biết khi nào nhận đủ)."""
+    func = request[1]
+    if func in (FUNC_READ_HOLDING, FUNC_READ_INPUT):
+        count = struct.unpack(">H", request[4:6])[0]
+        return 5 + 2 * count
+    if func in (FUNC_READ_COILS, FUNC_READ_DISCRETE):
+        count = struct.unpack(">H", request[4:6])[0]
+        return 5 + (count + 7) // 8
+    return 8    # write single: echo lại request
+
+
+def parse_response(request: bytes, frame: bytes) -> list:
+    """
+    Kiểm tra response cho request, trả về list giá trị:
+    thanh ghi (u16) với hàm 3/4, bit (0/1) với hàm 1/2, [value] với hàm 6.
+    """
+    if not check_crc(frame):
+        raise ModbusError("CRC")
+    unit, func = request[0], request[1]
+    if frame[0] != unit:
+        raise ModbusError(f"unit {frame[0]} != {unit}")
+    if frame[1] == func | 0x80:
+        code = frame[2]
+        raise ModbusError(f"exception {code} ({EXCEPTION_NAMES.get(code, '?')})")
+    if frame[1] != func:
+        raise ModbusError(f"func {frame[1]} != {func}")
+
+    if func == FUNC_WRITE_SINGLE:
+        if frame[:6] != request[:6]:
+            raise ModbusError("write echo mismatch")
+        return [struct.unpack(">H", frame[4:6])[0]]
+
+    count = struct.unpack(">H", request[4:6])[0]
+    data = frame[3:-2]
+    if frame[2] != len(data):
+        raise ModbusError("byte count")
+    if func in (FUNC_READ_HOLDING, FUNC_READ_INPUT):
+        if len(data) != 2 * count:
+            raise ModbusError("byte count")
+        return list(struct.unpack(f">{count}H", data))
+    return [(data[i // 8] >> (i % 8)) & 1 for i in range(count)]
+
+
+# ----------------------------------------------------------------------
+# Register map
+# ----------------------------------------------------------------------
+class RegisterDef:
+    """
+    1 điểm dữ liệu trong register map.
+    value = raw (theo type) * scale; period_ms = chu kỳ poll mong muốn.
+    """
+
+    def __init__(self, name: str, unit: int, func: int, addr: int,
+                 type: str = "u16", scale: float = 1.0, period_ms: int = 1000):
+        if type not in TYPES:
+            raise ValueError(f"{name}: type '{type}' không hỗ trợ ({', '.join(TYPES)})")
+        if func not in (FUNC_READ_COILS, FUNC_READ_DISCRETE, FUNC_READ_HOLDING, FUNC_READ_INPUT):
+            raise ValueError(f"{name}: func {func} không phải hàm đọc (1/2/3/4)")
+        self.name = name
+        self.unit = unit
+        self.func = func
+        self.addr = addr
+        self.type = type
+        self.scale = scale
+        self.period_ms = period_ms
+
+        # Giá trị mới nhất (cập nhật bởi ModbusMaster)
+        self.value = None
+        self.raw = None
+        self.updated = None      # time.monotonic() lần đọc thành công gần nhất
+        self.errors = 0
+
+    @property
+    def is_bit(self) -> bool:
+        return self.func in (FUNC_READ_COILS, FUNC_READ_DISCRETE)
+
+    @property
+    def count(self) -> int:
+        """Số thanh ghi (hoặc bit) chiếm trong vùng địa chỉ."""
+        return 1 if self.is_bit else TYPES[self.type][0]
+
+    def decode(self, words: list):
+        """words: các thanh ghi / bit của riêng điểm này."""
+        if self.is_bit:
+            self.raw = words[0]
+        else:
+            n, fmt = TYPES[self.type]
+            self.raw = struct.unpack(fmt, struct.pack(f">{n}H", *words))[0]
+        self.value = self.raw * self.scale if self.scale != 1.0 else self.raw
+
+
+def demo_register_map() -> list:
+    """Map mẫu khớp với ModbusSlaveSim (unit 1) – dùng khi chưa nạp file."""
+    return [
+        RegisterDef("Voltage", 1, FUNC_READ_HOLDING, 0, "u16", 0.1, 100),
+        RegisterDef("Current", 1, FUNC_READ_HOLDING, 1, "u16", 0.1, 100),
+        RegisterDef("Power", 1, FUNC_READ_HOLDING, 2, "f32", 1.0, 100),
+        RegisterDef("Temp", 1, FUNC_READ_INPUT, 10, "i16", 0.1, 500),
+        RegisterDef("Status", 1, FUNC_READ_INPUT, 12, "u16", 1.0, 500),
+        RegisterDef("Relay", 1, FUNC_READ_COILS, 0, "u16", 1.0, 1000),
+    ]
+
+
+def load_register_map(path: str) -> list:
+    """
+    Đọc register map JSON:
+    [
+      {"name": "Voltage", "unit": 1, "func": 3, "addr": 0, "type": "u16", "scale": 0.1, "period_ms": 200},
+      ...
+    ]
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    return [RegisterDef(**item) for item in items]
+
+
+# ----------------------------------------------------------------------
+# Scheduler
+# ----------------------------------------------------------------------
+class PollBlock:
+    """1 request đọc liên tục [addr, addr + count) phục vụ nhiều RegisterDef cùng chu kỳ."""
+
+    def __init__(self, unit: int, func: int, period_ms: int, regs: list):
+        self.unit = unit
+        self.func = func
+        self.period_ms = period_ms
+        self.regs = regs
+        self.addr = min(r.addr for r in regs)
+        self.count = max(r.addr + r.count for r in regs) - self.addr
+        self.request = build_read(unit, func, self.addr, self.count)
+        self.next_due = 0.0
+
+    def apply(self, values: list, now: float):
+        for r in self.regs:
+            off = r.addr - self.addr
+            r.decode(values[off:off + r.count])
+            r.updated = now
+
+    def fail(self):
+        for r in self.regs:
+            r.errors += 1
+
+
+def build_poll_blocks(regs: list) -> list:
+    """
+    Gộp các điểm cùng (unit, hàm, chu kỳ) có địa chỉ liền kề / gần nhau
+    (trống <= MERGE_MAX_GAP) thành 1 request, không vượt giới hạn độ dài Modbus.
+    """
+    groups = {}
+    for r in regs:
+        groups.setdefault((r.unit, r.func, r.period_ms), []).append(r)
+
+    blocks = []
+    for (unit, func, period), items in sorted(groups.items()):
+        limit = MAX_READ_BITS if func in (FUNC_READ_COILS, FUNC_READ_DISCRETE) else MAX_READ_REGISTERS
+        items.sort(key=lambda r: r.addr)
+        current = [items[0]]
+        end = items[0].addr + items[0].count
+        for r in items[1:]:
+            new_end = max(end, r.addr + r.count)
+            if r.addr - end <= MERGE_MAX_GAP and new_end - current[0].addr <= limit:
+                current.append(r)
+                end = new_end
+            else:
+                blocks.append(PollBlock(unit, func, period, current))
+                current = [r]
+                end = r.addr + r.count
+        blocks.append(PollBlock(unit, func, period, current))
+    return blocks
+
+
+class ModbusMaster:
+    """
+    Master 1 giao dịch tại 1 thời điểm (bus RS485 half-duplex).
+    send(bytes): phát frame; on_update(): gọi sau mỗi lần đọc xong (cập nhật bảng).
+    Gọi poll(now) định kỳ (timer ~10 ms), feed(data) khi có RX.
+    """
+    TIMEOUT_S = 0.3
+    TURNAROUND_S = 0.005      # nghỉ giữa 2 request để slave kịp về chế độ nhận
+
+    def __init__(self, send, on_update=None):
+        self.send = send
+        self.on_update = on_update
+        self.blocks = []
+        self.writes = []          # request ghi chờ gửi (ưu tiên hơn poll)
+        self.pending = None       # (request, block hoặc None, t_sent)
+        self.rx = bytearray()
+        self.idle_since = 0.0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"req": 0, "ok": 0, "timeout": 0, "crc": 0, "exception": 0}
+
+    def set_registers(self, regs: list):
+        self.blocks = build_poll_blocks(regs)
+        self.pending = None
+        self.rx.clear()
+
+    def write_register(self, unit: int, addr: int, value: int):
+        self.writes.append(build_write_single(unit, addr, value))
+
+    def feed(self, data: bytes):
+        """Byte RX từ bus (có thể đến thành nhiều mảnh)."""
+        if self.pending is None:
+            return                     # không chờ gì: frame lạ / echo → bỏ
+        self.rx.extend(data)
+        request = self.pending[0]
+        exception = len(self.rx) >= 5 and self.rx[1] == request[1] | 0x80
+        if len(self.rx) < (5 if exception else expected_length(request)):
+            return
+        self._finish(bytes(self.rx))
+
+    def _finish(self, frame):
+        request, block, _ = self.pending
+        self.pending = None
+        self.rx.clear()
+        now = time.monotonic()
+        self.idle_since = now
+        if frame is None:
+            self.stats["timeout"] += 1
+            if block is not None:
+                block.fail()
+            return
+        try:
+            values = parse_response(request, frame)
+        except ModbusError as e:
+            self.stats["crc" if str(e) == "CRC" else "exception"] += 1
+            if block is not None:
+                block.fail()
+            return
+        self.stats["ok"] += 1
+        if block is not None:
+            block.apply(values, now)
+            if self.on_update is not None:
+                self.on_update()
+
+    def poll(self, now: float):
+        if self.pending is not None:
+            if now - self.pending[2] > self.TIMEOUT_S:
+                self._finish(None)
+            return
+        if now - self.idle_since < self.TURNAROUND_S:
+            return
+
+        if self.writes:
+            self._send(self.writes.pop(0), None, now)
+            return
+
+        # Block trễ hạn nhiều nhất trước; lịch tính từ hạn cũ để giữ đúng tần số
+        due = [b for b in self.blocks if b.next_due <= now]
+        if not due:
+            return
+        block = min(due, key=lambda b: b.next_due)
+        block.next_due = max(block.next_due + block.period_ms / 1000.0, now)
+        self._send(block.request, block, now)
+
+    def _send(self, request: bytes, block, now: float):
+        self.pending = (request, block, now)
+        self.rx.clear()
+        self.stats["req"] += 1
+        self.send(request)
+
+
+# ----------------------------------------------------------------------
+# Slave giả lập (test master không cần thiết bị thật)
+# ----------------------------------------------------------------------
+class ModbusSlaveSim:
+    """
+    Slave RTU trong bộ nhớ: holding / input register và coil / discrete input.
+    handle(frame) trả về response (hoặc None nếu frame không dành cho slave này).
+    Giá trị input register thay đổi theo thời gian để bảng live có gì để xem.
+    """
+
+    def __init__(self, unit: int = 1, size: int = 256):
+        self.unit = unit
+        self.holding = [0] * size
+        self.coils = [0] * size
+        self.size = size
+        self.t0 = time.monotonic()
+        # Giá trị khớp demo_register_map(): 230.1 V, 12.5 A, f32 12.5
+        self.holding[0:4] = [2301, 125, 0x4148, 0x0000]
+
+    def input_register(self, addr: int) -> int:
+        # Dạng răng cưa theo thời gian, lệch pha theo địa chỉ
+        t = time.monotonic() - self.t0
+        return int((t * 100 + addr * 37) % 1000)
+
+    def handle(self, frame: bytes):
+        if len(frame) < 8 or frame[0] != self.unit or not check_crc(frame):
+            return None
+        func = frame[1]
+        addr, arg = struct.unpack(">HH", frame[2:6])
+
+        if func == FUNC_WRITE_SINGLE:
+            if addr >= self.size:
+                return self._exception(func, 2)
+            self.holding[addr] = arg
+            return frame
+
+        if func not in (FUNC_READ_COILS, FUNC_READ_DISCRETE, FUNC_READ_HOLDING, FUNC_READ_INPUT):
+            return self._exception(func, 1)
+        if arg == 0 or addr + arg > self.size:
+            return self._exception(func, 2)
+
+        if func == FUNC_READ_HOLDING:
+            data = struct.pack(f">{arg}H", *self.holding[addr:addr + arg])
+        elif func == FUNC_READ_INPUT:
+            data = struct.pack(f">{arg}H", *(self.input_register(a) for a in range(addr, addr + arg)))
+        else:
+            bits = self.coils[addr:addr + arg]
+            data = bytes(
+                sum(bits[i + k] << k for k in range(8) if i + k < arg) for i in range(0, arg, 8)
+            )
+        return with_crc(struct.pack(">BBB", self.unit, func, len(data)) + data)
+
+    def _exception(self, func: int, code: int) -> bytes:
+        return with_crc(struct.pack(">BBB", self.unit, func | 0x80, code))
+
+
+if __name__ == "__main__":
+    # Master ↔ slave giả lập, in số request và giá trị cuối
+    sim = ModbusSlaveSim(unit=1)
+    regs = demo_register_map()
+
+    master = None
+
+    def loopback(frame: bytes):
+        reply = sim.handle(frame)
+        if reply is not None:
+            master.feed(reply)
+
+    master = ModbusMaster(loopback)
+    master.set_registers(regs)
+    print(f"{len(regs)} điểm → {len(master.blocks)} request / vòng poll")
+
+    end = time.monotonic() + 1.0
+    while time.monotonic() < end:
+        master.poll(time.monotonic())
+        time.sleep(0.001)
+
+    for r in regs:
+        print(f"  {r.name:8s} = {r.value}  (lỗi {r.errors})")
+    print(master.stats)
@@ -0,0 +1,215 @@
+"""
+Phân tích bus RS485 từ chế độ sniff của kit (RS485 SNIFF ON).
+
+FW gửi các khối BIN;TYPE=SNIFF;BAUD=<baud>;t=<micros>;[OVF=n;]LEN=..;CRC=..; mà payload là
+chuỗi bản ghi burst:
+    u32 t_us (little-endian)  – micros() lúc lấy burst khỏi UART (≈ cuối byte cuối)
+    u16 len
+    len byte dữ liệu
+
+SniffRing giữ burst trong bộ nhớ dạng nhị phân gọn (numpy, vòng tròn, kích thước cố định),
+ghép burst thành frame theo khoảng lặng 3.5 ký tự và giải mã Modbus RTU nếu CRC đúng.
+Không phụ thuộc Qt.
+"""
+import collections
+import struct
+
+import numpy as np
+
+import modbus_rtu
+
+
+RECORD_HEADER = struct.Struct("<IH")
+
+# 1 ký tự trên dây ~ 11 bit (start + 8 data + parity/stop + stop)
+BITS_PER_CHAR = 11
+
+
+def parse_sniff_payload(payload: bytes):
+    """Payload SNIFF → list (t_us, bytes). Bản ghi cụt ở cuối (không nên có) bị bỏ."""
+    bursts = []
+    pos = 0
+    while pos + RECORD_HEADER.size <= len(payload):
+        t_us, n = RECORD_HEADER.unpack_from(payload, pos)
+        pos += RECORD_HEADER.size
+        if pos + n > len(payload):
+            break
+        bursts.append((t_us, payload[pos:pos + n]))
+        pos += n
+    return bursts
+
+
+def describe_frame(data: bytes) -> str:
+    """Giải mã ngắn gọn 1 frame: Modbus RTU nếu CRC đúng, ngược lại RAW."""
+    if len(data) >= 4 and modbus_rtu.check_crc(data):
+        unit, func = data[0], data[1]
+        body = data[2:-2]
+        if func & 0x80 and len(body) == 1:
+            code = body[0]
+            return f"MB u{unit} fn{func & 0x7F} EXCEPTION {code} ({modbus_rtu.EXCEPTION_NAMES.get(code, '?')})"
+        if func in (1, 2, 3, 4, 5, 6, 15, 16) and len(body) == 4:
+            # Request đọc / ghi đơn, hoặc echo của ghi
+            addr, arg = struct.unpack(">HH", body)
+            kind = "read" if func <= 4 else "write"
+            return f"MB u{unit} fn{func} {kind} @{addr} {'n' if kind == 'read' else 'v'}={arg}"
+        if func in (3, 4) and body and body[0] == len(body) - 1 and body[0] % 2 == 0:
+            regs = struct.unpack(f">{body[0] // 2}H", body[1:])
+            shown = " ".join(str(v) for v in regs[:8]) + (" ..." if len(regs) > 8 else "")
+            return f"MB u{unit} fn{func} resp {len(regs)} reg: {shown}"
+        if func in (1, 2) and body and body[0] == len(body) - 1:
+            return f"MB u{unit} fn{func} resp {body[0]} byte bit"
+        return f"MB u{unit} fn{func} {len(body)} byte"
+    return "RAW"
+
+
+class SniffRing:
+    """
+    Ring nhị phân cố định: byte dữ liệu + chỉ mục burst (t cuối burst µs, offset, len).
+    Thời gian được nối liền (xử lý tràn micros() 32 bit) thành int64 µs.
+    """
+
+    def __init__(self, data_capacity: int = 4 * 1024 * 1024, burst_capacity: int = 256 * 1024):
+        self.data = np.zeros(data_capacity, dtype=np.uint8)
+        self.b_t = np.zeros(burst_capacity, dtype=np.int64)
+        self.b_off = np.zeros(burst_capacity, dtype=np.int64)   # offset tuyệt đối (chưa modulo)
+        self.b_len = np.zeros(burst_capacity, dtype=np.int32)
+        self.clear()
+
+    def clear(self):
+        self.data_total = 0          # tổng byte đã ghi (offset tuyệt đối)
+        self.burst_total = 0
+        self._last_raw = None
+        self._t_offset = 0
+
+    def unwrap(self, t_us: int) -> int:
+        if self._last_raw is not None and t_us < self._last_raw and self._last_raw - t_us > 0x80000000:
+            self._t_offset += 1 << 32
+        self._last_raw = t_us
+        return t_us + self._t_offset
+
+    def append(self, t_us: int, chunk: bytes) -> int:
+        """Ghi 1 burst, trả về thời điểm đã nối liền (µs)."""
+        t = self.unwrap(t_us)
+        n = len(chunk)
+        if n == 0:
+            return t
+        cap = len(self.data)
+        if n > cap:
+            chunk = chunk[-cap:]
+            n = cap
+        start = self.data_total % cap
+        first = min(n, cap - start)
+        self.data[start:start + first] = np.frombuffer(chunk[:first], dtype=np.uint8)
+        if first < n:
+            self.data[:n - first] = np.frombuffer(chunk[first:], dtype=np.uint8)
+
+        i = self.burst_total % len(self.b_t)
+        self.b_t[i] = t
+        self.b_off[i] = self.data_total
+        self.b_len[i] = n
+        self.data_total += n
+        self.burst_total += 1
+        return t
+
+    def bytes_at(self, off: int, n: int) -> bytes:
+        """Byte từ offset tuyệt đối (phải còn nằm trong ring)."""
+        cap = len(self.data)
+        start = off % cap
+        if start + n <= cap:
+            return self.data[start:start + n].tobytes()
+        return self.data[start:].tobytes() + self.data[:n - (cap - start)].tobytes()
+
+    def oldest_burst(self) -> int:
+        """Chỉ số burst cũ nhất còn đủ cả chỉ mục lẫn dữ liệu."""
+        first = max(0, self.burst_total - len(self.b_t))
+        min_off = self.data_total - len(self.data)
+        while first < self.burst_total and self.b_off[first % len(self.b_t)] < min_off:
+            first += 1
+        return first
+
+    def to_bytes(self) -> bytes:
+        """Toàn bộ ring còn lại dưới dạng payload SNIFF (lưu file, mở lại bằng parse_sniff_payload)."""
+        out = bytearray()
+        for k in range(self.oldest_burst(), self.burst_total):
+            i = k % len(self.b_t)
+            out += RECORD_HEADER.pack(int(self.b_t[i]) & 0xFFFFFFFF, int(self.b_len[i]))
+            out += self.bytes_at(int(self.b_off[i]), int(self.b_len[i]))
+        return bytes(out)
+
+
+class BusAnalyzer:
+    """
+    Ghép burst thành frame (khoảng lặng > 3.5 ký tự), đo khoảng cách giữa frame
+    và mức chiếm bus. Frame hoàn tất được đưa vào self.frames (list, caller lấy rồi xóa).
+    """
+
+    def __init__(self, baud: int = 9600):
+        self.ring = SniffRing()
+        self.frames = []                  # (t_start_us, t_end_us, gap_us, data)
+        self.set_baud(baud)
+        self.reset()
+
+    def set_baud(self, baud: int):
+        self.baud = baud
+        self.char_us = BITS_PER_CHAR * 1e6 / baud
+        self.gap_us = max(3.5 * self.char_us, 1750.0)
+
+    def reset(self):
+        self.ring.clear()
+        self.frames.clear()
+        self._cur = bytearray()
+        self._cur_start = None
+        self._cur_end = None
+        self._prev_end = None
+        self.overflow = 0
+        self.total_bytes = 0
+        self.total_frames = 0
+        self.now_us = None                # thời điểm FW mới nhất đã biết (µs, nối liền)
+        self._busy = collections.deque()  # (t_end_us, thời gian chiếm bus µs) trong cửa sổ đo
+
+    def feed_payload(self, payload: bytes, baud: int = None, ovf: int = 0, t_us: int = None):
+        """
+        1 khối SNIFF từ FW. t_us (trường t= của header) = lúc FW gửi khối:
+        dùng để đóng frame cuối khi bus đã im lặng.
+        """
+        if baud and baud != self.baud:
+            self.set_baud(baud)
+        self.overflow = max(self.overflow, ovf)
+        for t_burst, chunk in parse_sniff_payload(payload):
+            self._feed_burst(self.ring.append(t_burst, chunk), chunk)
+        if t_us is not None:
+            self.now_us = self.ring.unwrap(t_us)
+            self.flush_idle(self.now_us)
+
+    def _feed_burst(self, t_end: int, chunk: bytes):
+        # t là lúc burst rời UART ≈ cuối byte cuối → lùi lại để có đầu burst
+        t_start = t_end - len(chunk) * self.char_us
+        if self._cur and t_start - self._cur_end > self.gap_us:
+            self._close_frame()
+        if not self._cur:
+            self._cur_start = t_start
+        self._cur += chunk
+        self._cur_end = t_end
+        self.now_us = t_end if self.now_us is None else max(self.now_us, t_end)
+        self.total_bytes += len(chunk)
+        self._busy.append((t_end, len(chunk) * self.char_us))
+
+    def _close_frame(self):
+        gap = None if self._prev_end is None else self._cur_start - self._prev_end
+        self.frames.append((self._cur_start, self._cur_end, gap, bytes(self._cur)))
+        self.total_frames += 1
+        self._prev_end = self._cur_end
+        self._cur = bytearray()
+
+    def flush_idle(self, now_us: int):
+        """Frame cuối chưa đóng vì chưa có burst mới: đóng khi đã im lặng đủ lâu (theo t FW)."""
+        if self._cur and now_us - self._cur_end > self.gap_us:
+            self._close_frame()
+
+    def utilization(self, window_us: float = 1e6) -> float:
+        """Tỉ lệ thời gian bus có dữ liệu trong window_us tính tới now_us (0..1)."""
+        if self.now_us is None:
+            return 0.0
+        while self._busy and self._busy[0][0] < self.now_us - window_us:
+            self._busy.popleft()
+        return min(1.0, sum(d for _, d in self._busy) / window_us)
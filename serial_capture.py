@@ -0,0 +1,187 @@
+"""
+Ghi lại mọi byte trên link USB (cả 2 chiều, kèm thời gian monotonic) và phát lại.
+
+File .cap:
+    b"PSWCAP1\\n"
+    bản ghi: u8 dir (0 = RX kit→PC, 1 = TX PC→kit), u64 t_ns (từ lúc bắt đầu ghi), u32 len, data
+
+ReplaySerial là transport giả có cùng giao diện pyserial mà SerialManager dùng
+(is_open, in_waiting, read, readline, write, flush, close, baudrate): byte RX được nhả theo
+thời gian gốc (speed = 1, 2, ...) hoặc ngay lập tức (speed = 0, nhanh nhất có thể).
+TX khi phát lại bị bỏ qua (chỉ đếm). Không phụ thuộc Qt / pyserial.
+
+    python serial_capture.py info  <file.cap>
+    python serial_capture.py bench <file.cap>   # throughput SerialManager, nhanh nhất có thể
+"""
+import struct
+import sys
+import time
+
+
+MAGIC = b"PSWCAP1\n"
+RECORD = struct.Struct("<BQI")
+RX, TX = 0, 1
+
+# Cổng "replay:<file>[@speed]" trong SerialManager.connect
+REPLAY_PREFIX = "replay:"
+
+# Tối đa mỗi lần read() khi phát nhanh nhất, để mỗi lần poll vẫn ngắn
+FAST_READ_MAX = 64 * 1024
+
+
+class CaptureWriter:
+    """Ghi bản ghi vào file (buffer 64 KB của io, flush khi close / flush())."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, "wb", buffering=64 * 1024)
+        self._f.write(MAGIC)
+        self._t0 = time.monotonic_ns()
+        self.bytes = {RX: 0, TX: 0}
+
+    def write(self, direction: int, data: bytes):
+        if not data or self._f is None:
+            return
+        self._f.write(RECORD.pack(direction, time.monotonic_ns() - self._t0, len(data)))
+        self._f.write(data)
+        self.bytes[direction] += len(data)
+
+    def flush(self):
+        if self._f is not None:
+            self._f.flush()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+def read_capture(path: str):
+    """Duyệt file .cap → (dir, t_ns, data). Bản ghi cụt cuối file (app bị kill) bị bỏ."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: không phải file capture")
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                return
+            direction, t_ns, n = RECORD.unpack(head)
+            data = f.read(n)
+            if len(data) < n:
+                return
+            yield direction, t_ns, data
+
+
+def parse_replay_port(port: str):
+    """"replay:<file>[@speed]" → (file, speed). speed mặc định 1 (thời gian gốc)."""
+    spec = port[len(REPLAY_PREFIX):]
+    path, sep, speed = spec.rpartition("@")
+    if sep:
+        try:
+            return path, float(speed)
+        except ValueError:
+            pass
+    return spec, 1.0
+
+
+class ReplaySerial:
+    """Transport giả: đọc RX từ file .cap theo thời gian gốc / speed (0 = không chờ)."""
+
+    def __init__(self, path: str, speed: float = 1.0):
+        self.path = path
+        self.speed = speed
+        self.baudrate = 115200
+        self.is_open = True
+        self.tx_bytes = 0
+        self._records = (r for r in read_capture(path) if r[0] == RX)
+        self._next = next(self._records, None)
+        self._pending = bytearray()
+        self._t0 = time.monotonic_ns()
+
+    @property
+    def finished(self) -> bool:
+        return self._next is None and not self._pending
+
+    def _release(self):
+        if self.speed > 0:
+            now = (time.monotonic_ns() - self._t0) * self.speed
+            while self._next is not None and self._next[1] <= now:
+                self._pending += self._next[2]
+                self._next = next(self._records, None)
+        else:
+            while self._next is not None and len(self._pending) < FAST_READ_MAX:
+                self._pending += self._next[2]
+                self._next = next(self._records, None)
+
+    @property
+    def in_waiting(self) -> int:
+        if not self.is_open:
+            raise OSError("replay closed")
+        self._release()
+        return len(self._pending)
+
+    def read(self, n: int = 1) -> bytes:
+        data = bytes(self._pending[:n])
+        del self._pending[:n]
+        return data
+
+    def readline(self) -> bytes:
+        """Như pyserial: tới hết '\n', hoặc phần đang có (hết timeout) – cho dashboard bản cũ."""
+        self._release()
+        idx = self._pending.find(b"\n")
+        return self.read(len(self._pending) if idx < 0 else idx + 1)
+
+    def write(self, data: bytes) -> int:
+        self.tx_bytes += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+def _main(argv):
+    if len(argv) != 3 or argv[1] not in ("info", "bench"):
+        print(__doc__)
+        return 2
+    path = argv[2]
+
+    if argv[1] == "info":
+        n = {RX: 0, TX: 0}
+        size = {RX: 0, TX: 0}
+        t_end = 0
+        for direction, t_ns, data in read_capture(path):
+            n[direction] += 1
+            size[direction] += len(data)
+            t_end = t_ns
+        print(f"{path}: {t_end / 1e9:.3f} s")
+        print(f"  RX {size[RX]} byte / {n[RX]} bản ghi")
+        print(f"  TX {size[TX]} byte / {n[TX]} bản ghi")
+        return 0
+
+    # bench: cùng đường nhận với dashboard (SerialManager.poll → tách dòng / BIN)
+    from ver8 import SerialManager
+
+    counts = {"lines": 0, "bulk": 0}
+    mgr = SerialManager(
+        line_callback=lambda _line: counts.__setitem__("lines", counts["lines"] + 1),
+        bulk_callback=lambda _h, _p: counts.__setitem__("bulk", counts["bulk"] + 1),
+    )
+    ok, err = mgr.connect(f"{REPLAY_PREFIX}{path}@0")
+    if not ok:
+        print(err)
+        return 1
+    t0 = time.perf_counter()
+    while not mgr.ser.finished:
+        mgr.poll()
+    dt = time.perf_counter() - t0
+    rx = sum(len(d) for k, _, d in read_capture(path) if k == RX)
+    print(f"{rx} byte, {counts['lines']} dòng, {counts['bulk']} khối BIN trong {dt:.3f} s")
+    print(f"  {rx / dt / 1e6:.2f} MB/s, {counts['lines'] / dt:.0f} dòng/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv))
@@ -0,0 +1,140 @@
+"""
+Phát hiện event loop Qt bị treo (GUI thread không xử lý sự kiện) và ghi lại stack.
+
+Luồng GUI gọi beat() từ 1 QTimer ngắn (HEARTBEAT_S). Thread watchdog kiểm tra mỗi
+POLL_S: nếu nhịp cuối cũ hơn HEARTBEAT_S + threshold → GUI đang bị chặn. Trong lúc
+treo, watchdog lấy mẫu stack Python của GUI thread (sys._current_frames()) mỗi lần
+kiểm tra; khi có nhịp trở lại, 1 StallReport (thời lượng + stack gặp nhiều nhất)
+được đưa vào hàng đợi và ghi thêm vào file log (nếu có).
+
+Không phụ thuộc Qt: luồng GUI tự lấy báo cáo bằng pop_reports() (sau khi hết treo)
+để hiển thị — watchdog không bao giờ chạm vào widget.
+
+Lưu ý: nếu GUI thread giữ GIL suốt lúc treo (vòng lặp Python thuần / extension C
+không nhả GIL), watchdog chỉ chạy được khi GIL được nhả theo sys.getswitchinterval();
+thời lượng vẫn đúng vì được đo bằng nhịp, không phải bằng watchdog.
+"""
+import collections
+import os
+import sys
+import threading
+import time
+import traceback
+
+
+HEARTBEAT_S = 0.010      # chu kỳ QTimer gọi beat()
+POLL_S = 0.010           # chu kỳ kiểm tra / lấy mẫu stack khi đang treo
+MAX_REPORTS = 100        # báo cáo chờ GUI lấy; quá thì bỏ bản cũ nhất
+
+
+class StallReport:
+    """1 lần treo: bắt đầu (time.time()), thời lượng, stack + số mẫu rơi vào stack đó."""
+
+    def __init__(self, start: float, duration_s: float, stack: str, hits: int, samples: int):
+        self.start = start
+        self.duration_s = duration_s
+        self.stack = stack
+        self.hits = hits
+        self.samples = samples
+
+    @property
+    def where(self) -> str:
+        """Frame trong cùng dạng 'file.py:123 func' (cho log ngắn 1 dòng)."""
+        for line in reversed(self.stack.splitlines()):
+            line = line.strip()
+            if line.startswith('File "'):
+                path, _, rest = line[6:].partition('", line ')
+                lineno, _, func = rest.partition(", in ")
+                return f"{os.path.basename(path)}:{lineno} {func}"
+        return "?"
+
+    def format(self) -> str:
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.start))
+        return (f"{stamp} GUI stall {self.duration_s * 1000:.0f} ms "
+                f"({self.hits}/{self.samples} mẫu tại stack dưới)\n{self.stack}")
+
+
+class StallWatchdog:
+    """
+    Watchdog cho 1 thread (mặc định thread tạo ra nó = GUI thread).
+    threshold_s: độ trễ vượt quá chu kỳ nhịp thì tính là treo (VD: 0.05).
+    """
+
+    def __init__(self, threshold_s: float = 0.05, log_path: str = None):
+        self.threshold_s = threshold_s
+        self.log_path = log_path
+        self.stalls = 0
+        self.worst_s = 0.0
+        self._ident = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._reports = collections.deque(maxlen=MAX_REPORTS)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def active(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="stall-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def beat(self):
+        """Gọi từ GUI thread (QTimer HEARTBEAT_S)."""
+        self._last_beat = time.monotonic()
+
+    def pop_reports(self) -> list:
+        """Lấy các lần treo đã kết thúc (gọi từ GUI thread)."""
+        out = []
+        while self._reports:
+            out.append(self._reports.popleft())
+        return out
+
+    def _sample(self) -> str:
+        frame = sys._current_frames().get(self._ident)
+        if frame is None:
+            return ""
+        return "".join(traceback.format_stack(frame))
+
+    def _watch(self):
+        limit = HEARTBEAT_S + self.threshold_s
+        stall_beat = None          # nhịp cuối trước khi treo (None = không treo)
+        stacks = collections.Counter()
+        while not self._stop.wait(POLL_S):
+            last = self._last_beat
+            if stall_beat is None:
+                if time.monotonic() - last > limit:
+                    stall_beat = last
+                    stacks.clear()
+                    stacks[self._sample()] += 1
+            elif last != stall_beat:
+                # GUI chạy lại: thời lượng = khoảng giữa 2 nhịp trừ chu kỳ nhịp
+                self._report(stall_beat, last - stall_beat - HEARTBEAT_S, stacks)
+                stall_beat = None
+            else:
+                stacks[self._sample()] += 1
+
+    def _report(self, beat: float, duration_s: float, stacks: collections.Counter):
+        stack, hits = stacks.most_common(1)[0]
+        start = time.time() - (time.monotonic() - beat)
+        report = StallReport(start, duration_s, stack, hits, sum(stacks.values()))
+        self.stalls += 1
+        self.worst_s = max(self.worst_s, duration_s)
+        self._reports.append(report)
+        if self.log_path:
+            try:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(report.format() + "\n")
+            except OSError:
+                pass
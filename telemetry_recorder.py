@@ -0,0 +1,421 @@
+"""
+Ghi telemetry (STATUS / DST / ADS đã giải mã) xuống đĩa dạng cột, chạy cả ca.
+
+Bố cục 1 phiên ghi:
+    <root>/<session>/session.json          schema + thông tin phiên
+    <root>/<session>/seg_00000/<col>.npy   1 file .npy / cột / segment
+    <root>/<session>/seg_00001/...
+
+Mỗi file .npy có header cố định HEADER_SIZE byte, số dòng trong header được
+ghi lại tại chỗ sau mỗi lần fsync → file luôn mở được bằng np.load(mmap_mode="r"),
+kể cả khi app bị kill giữa chừng (mất tối đa FSYNC_S giây cuối).
+
+Luồng UI chỉ chép 1 dòng vào chunk numpy cấp sẵn (append); chunk đầy / flush()
+được đẩy qua hàng đợi có giới hạn cho thread ghi. Hàng đợi đầy → bỏ chunk và
+đếm dropped, không bao giờ chặn UI. RAM cố định: QUEUE_CHUNKS * CHUNK_ROWS dòng.
+
+RecordedSession mở lại phiên bằng memmap để xem / cắt lát mà không đọc cả file.
+MinMaxPyramid: min/max nhiều mức (mỗi mức gộp LOD_FACTOR khối mức dưới) để vẽ
+hàng triệu mẫu với số điểm ~ bề rộng plot, lưu cạnh phiên (lod_<cột>.npz).
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+HEADER_SIZE = 128            # magic + version + len + dict, đệm space tới bội số 64
+CHUNK_ROWS = 1024
+QUEUE_CHUNKS = 64
+FSYNC_S = 2.0
+
+LOD_FACTOR = 8               # mức k gộp LOD_FACTOR**k dòng
+LOD_BUILD_ROWS = 1 << 20     # đọc memmap theo khối khi dựng mức 1 (bội số LOD_FACTOR)
+
+
+def npy_header(dtype: np.dtype, rows: int) -> bytes:
+    """Header .npy v1.0 dài đúng HEADER_SIZE byte (ghi đè tại chỗ khi số dòng tăng)."""
+    d = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+        np.lib.format.dtype_to_descr(dtype), rows)
+    pad = HEADER_SIZE - 10 - len(d) - 1
+    if pad < 0:
+        raise ValueError("npy header quá dài")
+    body = (d + " " * pad + "\n").encode("latin1")
+    return b"\x93NUMPY\x01\x00" + len(body).to_bytes(2, "little") + body
+
+
+def list_segments(session_dir: str) -> list:
+    """Các thư mục seg_xxxxx của 1 phiên, theo thứ tự ghi."""
+    return sorted(
+        os.path.join(session_dir, d) for d in os.listdir(session_dir)
+        if d.startswith("seg_") and os.path.isdir(os.path.join(session_dir, d))
+    )
+
+
+class _Segment:
+    """1 segment đang ghi: 1 file mở sẵn / cột."""
+
+    def __init__(self, path: str, schema):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.schema = schema
+        self.rows = 0            # đã ghi vào file
+        self.rows_synced = 0     # đã fsync + ghi vào header
+        self.bytes = 0
+        self.created = time.monotonic()
+        self.files = {}
+        for name, dtype in schema:
+            f = open(os.path.join(path, f"{name}.npy"), "wb+")
+            f.write(npy_header(np.dtype(dtype), 0))
+            self.files[name] = f
+
+    def write(self, chunk: np.ndarray):
+        for name, _ in self.schema:
+            self.files[name].write(np.ascontiguousarray(chunk[name]).tobytes())
+        self.rows += len(chunk)
+        self.bytes += chunk.nbytes
+
+    def sync(self):
+        """Dữ liệu xuống đĩa trước, header (số dòng) sau → header không bao giờ vượt dữ liệu."""
+        if self.rows == self.rows_synced:
+            return
+        for f in self.files.values():
+            f.flush()
+            os.fsync(f.fileno())
+        for name, dtype in self.schema:
+            f = self.files[name]
+            f.seek(0)
+            f.write(npy_header(np.dtype(dtype), self.rows))
+            f.seek(0, os.SEEK_END)
+            f.flush()
+            os.fsync(f.fileno())
+        self.rows_synced = self.rows
+
+    def close(self):
+        self.sync()
+        for f in self.files.values():
+            f.close()
+
+
+class TelemetryRecorder:
+    """
+    schema: list (tên cột, dtype numpy), VD [("t", "f8"), ("adc1", "i4"), ...].
+    start() → append(row) từ luồng UI → flush() định kỳ → stop().
+    """
+
+    def __init__(self, schema, rotate_bytes: int = 64 * 1024 * 1024, rotate_s: float = 15 * 60):
+        self.schema = [(name, np.dtype(dt).str) for name, dt in schema]
+        self.dtype = np.dtype(self.schema)
+        self.rotate_bytes = rotate_bytes
+        self.rotate_s = rotate_s
+
+        self.session_dir = None
+        self._queue = None
+        self._thread = None
+        self._chunk = None
+        self._n = 0
+        self.rows = 0            # dòng đã nhận từ UI
+        self.dropped = 0         # dòng bị bỏ do hàng đợi đầy
+        self.segments = 0
+        self.error = None        # lỗi của thread ghi (đĩa đầy...)
+
+    @property
+    def active(self) -> bool:
+        return self._thread is not None
+
+    def start(self, root: str, session: str = None, info: dict = None) -> str:
+        if self.active:
+            self.stop()
+        session = session or time.strftime("%Y%m%d_%H%M%S")
+        self.session_dir = os.path.join(root, session)
+        os.makedirs(self.session_dir, exist_ok=True)
+        with open(os.path.join(self.session_dir, "session.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "columns": [{"name": n, "dtype": d} for n, d in self.schema],
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                # Mốc đổi time.monotonic() (cột thời gian tăng dần, VD host_t) → giờ thực
+                "clock": {"wall": time.time(), "monotonic": time.monotonic()},
+                "info": info or {},
+            }, f, indent=2)
+
+        self.rows = self.dropped = self.segments = 0
+        self.error = None
+        self._queue = queue.Queue(maxsize=QUEUE_CHUNKS)
+        self._chunk = np.zeros(CHUNK_ROWS, dtype=self.dtype)
+        self._n = 0
+        self._thread = threading.Thread(target=self._writer, name="telemetry-writer", daemon=True)
+        self._thread.start()
+        return self.session_dir
+
+    def append(self, row: tuple):
+        """1 dòng theo đúng thứ tự schema. Gọi từ luồng UI, không I/O."""
+        if self._chunk is None:
+            return
+        self._chunk[self._n] = row
+        self._n += 1
+        self.rows += 1
+        if self._n == CHUNK_ROWS:
+            self.flush()
+
+    def flush(self):
+        """Đẩy chunk hiện tại (kể cả chưa đầy) cho thread ghi."""
+        if self._chunk is None or self._n == 0:
+            return
+        chunk = self._chunk[:self._n]
+        try:
+            self._queue.put_nowait(chunk)
+        except queue.Full:
+            self.dropped += self._n
+        # Chunk cũ thuộc về thread ghi → cấp chunk mới
+        self._chunk = np.zeros(CHUNK_ROWS, dtype=self.dtype)
+        self._n = 0
+
+    def stop(self):
+        if not self.active:
+            return
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._chunk = None
+
+    def _writer(self):
+        seg = None
+        last_sync = time.monotonic()
+        try:
+            while True:
+                try:
+                    chunk = self._queue.get(timeout=FSYNC_S)
+                except queue.Empty:
+                    chunk = ...
+                if chunk is None:
+                    break
+
+                now = time.monotonic()
+                if chunk is not ...:
+                    if seg is None or seg.bytes >= self.rotate_bytes or now - seg.created >= self.rotate_s:
+                        if seg is not None:
+                            seg.close()
+                        seg = _Segment(os.path.join(self.session_dir, f"seg_{self.segments:05d}"), self.schema)
+                        self.segments += 1
+                    seg.write(chunk)
+
+                if seg is not None and now - last_sync >= FSYNC_S:
+                    seg.sync()
+                    last_sync = now
+        except Exception as e:
+            self.error = str(e)
+            # Xả hàng đợi để UI không bị đầy mãi; dữ liệu từ đây tính là dropped
+            while True:
+                chunk = self._queue.get()
+                if chunk is None:
+                    break
+                self.dropped += len(chunk)
+        finally:
+            if seg is not None:
+                try:
+                    seg.close()
+                except Exception:
+                    pass
+
+
+class RecordedSession:
+    """
+    Mở 1 phiên đã ghi bằng memmap: chỉ đọc header .npy, dữ liệu được OS nạp theo trang
+    khi cắt lát → mở phiên nhiều GB gần như tức thì, RAM không tăng theo kích thước phiên.
+    Số dòng mỗi segment = cột ngắn nhất (phiên bị ngắt giữa chừng vẫn mở được).
+    """
+
+    def __init__(self, session_dir: str):
+        self.session_dir = session_dir
+        with open(os.path.join(session_dir, "session.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.columns = [c["name"] for c in self.meta["columns"]]
+
+        self.segments = []       # list dict {tên cột: memmap}
+        lengths = []
+        for seg_dir in list_segments(session_dir):
+            try:
+                cols = {
+                    name: np.load(os.path.join(seg_dir, f"{name}.npy"), mmap_mode="r")
+                    for name in self.columns
+                }
+            except (OSError, ValueError):
+                continue         # segment hỏng / header chưa kịp ghi
+            n = min(len(c) for c in cols.values())
+            if n:
+                self.segments.append(cols)
+                lengths.append(n)
+        self.lengths = lengths
+        self.starts = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        self.rows = int(self.starts[-1])
+        self._pyramids = {}
+        self._pyramid_thread = None
+        self.pyramid_error = None    # lỗi của thread dựng pyramid (start_pyramids)
+
+    def column(self, name: str, i0: int = 0, i1: int = None, step: int = 1) -> np.ndarray:
+        """Cột `name`, dòng [i0, i1) bước `step`, ghép qua ranh giới segment (chỉ copy phần cần)."""
+        i1 = self.rows if i1 is None else min(i1, self.rows)
+        i0 = max(0, i0)
+        parts = []
+        for k, n in enumerate(self.lengths):
+            s0 = int(self.starts[k])
+            if s0 + n <= i0 or s0 >= i1:
+                continue
+            # chỉ số toàn cục đầu tiên trong segment cùng pha với i0
+            first = max(i0, s0)
+            first += (-(first - i0)) % step
+            if first >= min(i1, s0 + n):
+                continue
+            parts.append(self.segments[k][name][first - s0:min(i1, s0 + n) - s0:step])
+        if not parts:
+            return np.zeros(0, dtype=self.segments[0][name].dtype if self.segments else "f8")
+        return np.concatenate(parts)
+
+    def wall_time(self, mono: float) -> float:
+        """time.monotonic() lúc ghi → time.time() theo mốc trong session.json (phiên cũ: giữ nguyên)."""
+        clock = self.meta.get("clock")
+        if not clock:
+            return mono
+        return clock["wall"] + (mono - clock["monotonic"])
+
+    def search(self, name: str, value: float) -> int:
+        """Chỉ số dòng đầu tiên có cột (tăng dần, VD host_t) >= value; tìm nhị phân trên memmap."""
+        for k, n in enumerate(self.lengths):
+            col = self.segments[k][name]
+            if value <= col[n - 1] or k == len(self.lengths) - 1:
+                return int(self.starts[k]) + int(np.searchsorted(col[:n], value))
+        return 0
+
+    def pyramid(self, name: str, time_col: str = "host_t", build: bool = True) -> "MinMaxPyramid":
+        """
+        Pyramid min/max của cột `name` (dựng 1 lần, nạp lại từ lod_<name>.npz nếu khớp số dòng).
+        build=False: chỉ nạp từ file, chưa có thì trả None (không đọc cả cột).
+        """
+        if name not in self._pyramids:
+            pyr = (MinMaxPyramid.open(self, name, time_col) if build
+                   else MinMaxPyramid.load(self, name, time_col))
+            if pyr is None:
+                return None
+            self._pyramids[name] = pyr
+        return self._pyramids[name]
+
+    def start_pyramids(self, names, time_col: str = "host_t"):
+        """Dựng pyramid các cột còn thiếu trong thread nền; UI xem trước bằng strided()."""
+        missing = [n for n in names if self.pyramid(n, time_col, build=False) is None]
+        if not missing:
+            return
+
+        def build():
+            try:
+                for name in missing:
+                    self.pyramid(name, time_col)
+            except (OSError, ValueError) as e:
+                self.pyramid_error = e
+
+        self._pyramid_thread = threading.Thread(target=build, name="lod-builder", daemon=True)
+        self._pyramid_thread.start()
+
+    @property
+    def pyramids_building(self) -> bool:
+        return self._pyramid_thread is not None and self._pyramid_thread.is_alive()
+
+    def strided(self, name: str, i0: int, i1: int, max_points: int, time_col: str = "host_t"):
+        """Xem trước khi chưa có pyramid: lấy ~max_points dòng cách đều (có thể sót đỉnh)."""
+        step = max(1, (i1 - i0) // max_points)
+        return self.column(time_col, i0, i1, step), self.column(name, i0, i1, step)
+
+
+class MinMaxPyramid:
+    """
+    Mức 0 = dữ liệu gốc (memmap). Mức k >= 1: mỗi khối LOD_FACTOR**k dòng giữ
+    (t dòng đầu khối, min, max). query() chọn mức thô nhất mà vẫn đủ ~max_points khối
+    trong khoảng đang xem → vẽ đúng đỉnh / đáy dù mỗi pixel chứa hàng nghìn mẫu.
+    """
+
+    def __init__(self, session: RecordedSession, name: str, time_col: str, levels):
+        self.session = session
+        self.name = name
+        self.time_col = time_col
+        self.levels = levels     # list (t, mn, mx), levels[0] = mức 1
+
+    @classmethod
+    def load(cls, session: RecordedSession, name: str, time_col: str = "host_t"):
+        """Nạp lod_<name>.npz nếu khớp số dòng / LOD_FACTOR, không thì None."""
+        path = os.path.join(session.session_dir, f"lod_{name}.npz")
+        try:
+            with np.load(path) as z:
+                if int(z["rows"]) == session.rows and int(z["factor"]) == LOD_FACTOR:
+                    n = int(z["levels"])
+                    levels = [(z[f"t{k}"], z[f"mn{k}"], z[f"mx{k}"]) for k in range(n)]
+                    return cls(session, name, time_col, levels)
+        except (OSError, KeyError, ValueError):
+            pass
+        return None
+
+    @classmethod
+    def open(cls, session: RecordedSession, name: str, time_col: str = "host_t") -> "MinMaxPyramid":
+        pyr = cls.load(session, name, time_col)
+        if pyr is not None:
+            return pyr
+
+        pyr = cls(session, name, time_col, cls._build(session, name, time_col))
+        try:
+            pyr.save(os.path.join(session.session_dir, f"lod_{name}.npz"))
+        except OSError:
+            pass                 # thư mục chỉ đọc: vẫn dùng bản trong RAM
+        return pyr
+
+    @staticmethod
+    def _build(session: RecordedSession, name: str, time_col: str):
+        # Mức 1 từ dữ liệu gốc, đọc từng khối để không nạp cả cột vào RAM
+        ts, mns, mxs = [], [], []
+        for i in range(0, session.rows, LOD_BUILD_ROWS):
+            v = session.column(name, i, i + LOD_BUILD_ROWS)
+            idx = np.arange(0, len(v), LOD_FACTOR)
+            ts.append(session.column(time_col, i, i + LOD_BUILD_ROWS, LOD_FACTOR))
+            mns.append(np.minimum.reduceat(v, idx))
+            mxs.append(np.maximum.reduceat(v, idx))
+        if not ts:
+            return []
+        levels = [(np.concatenate(ts), np.concatenate(mns), np.concatenate(mxs))]
+
+        # Mức trên gộp từ mức dưới cho tới khi còn 1 khối
+        while len(levels[-1][0]) > 1:
+            t, mn, mx = levels[-1]
+            idx = np.arange(0, len(t), LOD_FACTOR)
+            levels.append((t[::LOD_FACTOR], np.minimum.reduceat(mn, idx), np.maximum.reduceat(mx, idx)))
+        return levels
+
+    def save(self, path: str):
+        """Ghi file tạm rồi os.replace → không bao giờ để lại lod_*.npz dở dang."""
+        arrays = {"rows": np.int64(self.session.rows), "factor": np.int64(LOD_FACTOR),
+                  "levels": np.int64(len(self.levels))}
+        for k, (t, mn, mx) in enumerate(self.levels):
+            arrays[f"t{k}"], arrays[f"mn{k}"], arrays[f"mx{k}"] = t, mn, mx
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+
+    def query(self, i0: int, i1: int, max_points: int):
+        """
+        Dòng [i0, i1) → (t, lo, hi, level). Mức 0: lo is hi (giá trị gốc);
+        mức k: min / max từng khối LOD_FACTOR**k dòng phủ khoảng đó.
+        """
+        level = 0
+        n = i1 - i0
+        while level < len(self.levels) and n > max_points:
+            level += 1
+            n //= LOD_FACTOR
+        if level == 0:
+            v = self.session.column(self.name, i0, i1)
+            return self.session.column(self.time_col, i0, i1), v, v, 0
+
+        size = LOD_FACTOR ** level
+        b0, b1 = i0 // size, -(-i1 // size)
+        t, mn, mx = self.levels[level - 1]
+        return t[b0:b1], mn[b0:b1], mx[b0:b1], level
@@ -1,16 +1,58 @@
+import binascii
+import collections
+import glob
 import os
 import sys
+import time
 
+import numpy as np
 import serial
 import serial.tools.list_ports
 
 from PyQt5 import uic
-from PyQt5.QtCore import QTimer
-from PyQt5.QtGui import QIcon
-from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QSlider, QMessageBox,  QGraphicsOpacityEffect
+from PyQt5.QtCore import QEvent, QPoint, Qt, QTimer
+from PyQt5.QtGui import QColor, QFont, QIcon, QImage, QPainter, QPen, QPixmap, QTextCursor
+from PyQt5.QtWidgets import (
+    QApplication, QMainWindow, QVBoxLayout, QSlider, QMessageBox, QGraphicsOpacityEffect,
+    QInputDialog, QPlainTextEdit, QWidget, QGridLayout, QLabel, QHBoxLayout, QLineEdit,
+    QPushButton, QFileDialog, QComboBox, QCheckBox, QTableWidget, QTableWidgetItem,
+    QHeaderView,
+)
 
 import pyqtgraph as pg
 
+import modbus_rtu
+import rs485_sniffer
+import serial_capture
+import stall_watchdog
+import telemetry_recorder
+
+
+# Kit giả lập trên pty (kit_emulator.py, Linux): symlink /tmp/pswkit-kit0, 1, ...
+EMULATOR_PORT_GLOB = "/tmp/pswkit-kit*"
+
+# GUI thread không xử lý event loop quá ngưỡng này → ghi stack (stall_watchdog.py)
+STALL_THRESHOLD_MS = 50
+STALL_LOG = os.path.join(os.path.expanduser("~"), "PSWKit_stalls.log")
+
+# Thời gian chờ ACK (OK;R1=ON; ...) trước khi coi như mất và đồng bộ lại bằng STATE
+ACK_TIMEOUT_MS = 500
+
+# OLED SSD1306 trên kit: 128x64, 1 bpp, 8 page x 128 cột (1 byte = 8 pixel dọc)
+OLED_WIDTH = 128
+OLED_HEIGHT = 64
+OLED_PAGES = OLED_HEIGHT // 8
+
+# Cột ghi telemetry (model STATUS sau mỗi STATUS / DST / ADS). Kênh chưa có = 0.
+# kind: 0 = STATUS (keyframe), 1 = DST, 2 = ADS
+TELEMETRY_SCHEMA = (
+    [("t", "f8"), ("host_t", "f8"), ("kind", "u1")]
+    + [(f"adc{i}", "i4") for i in range(1, 5)]
+    + [("s", "u2")]
+    + [(f"ads{i}", "i4") for i in range(4)]
+)
+REC_STATUS, REC_DST, REC_ADS = 0, 1, 2
+
 
 def resource_path(relative_path: str) -> str:
     """
@@ -27,6 +69,77 @@ def resource_path(relative_path: str) -> str:
     return os.path.join(base_path, relative_path)
 
 
+class DeviceClock:
+    """
+    Đổi timestamp micros() 32 bit của FW (t=...) thành giây liên tục:
+    xử lý tràn số sau ~71 phút và FW reset (t nhảy lùi) mà không làm gãy trục thời gian.
+    """
+    WRAP = 1 << 32
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._last_raw = None
+        self._offset = 0      # µs cộng thêm vào t thô (trừ mốc frame đầu tiên)
+
+    def seconds(self, t_us: int) -> float:
+        if self._last_raw is None:
+            # Frame đầu tiên sau connect là t = 0
+            self._offset = -t_us
+        elif t_us < self._last_raw:
+            if self._last_raw > 0xC0000000 and t_us < 0x40000000:
+                # micros() tràn số
+                self._offset += self.WRAP
+            else:
+                # FW khởi động lại: nối tiếp ngay sau mẫu trước
+                self._offset += self._last_raw - t_us
+        self._last_raw = t_us
+        return (t_us + self._offset) / 1e6
+
+
+def parse_fields(line: str) -> dict:
+    """
+    Tách frame dạng "TAG;K1=V1;K2=V2;" thành dict {"K1": "V1", "K2": "V2"}.
+    Phần không có dấu '=' (VD tên frame) được bỏ qua.
+    """
+    fields = {}
+    for p in line.split(";"):
+        if "=" in p:
+            k, v = p.split("=", 1)
+            fields[k] = v
+    return fields
+
+
+def qimage_to_fb(img: QImage) -> np.ndarray:
+    """
+    QImage 128x64 → framebuffer SSD1306 dạng mảng (8 page, 128 cột) uint8.
+    Pixel sáng (>= 128) = điểm bật; bit0 của mỗi byte là hàng trên cùng của page.
+    """
+    img = img.convertToFormat(QImage.Format_Grayscale8)
+    ptr = img.constBits()
+    ptr.setsize(img.byteCount())
+    gray = np.frombuffer(ptr, np.uint8).reshape(OLED_HEIGHT, img.bytesPerLine())[:, :OLED_WIDTH]
+
+    bits = (gray >= 128).reshape(OLED_PAGES, 8, OLED_WIDTH).transpose(0, 2, 1)
+    return np.packbits(bits, axis=-1, bitorder="little")[:, :, 0]
+
+
+def fb_dirty_rect(old, new: np.ndarray):
+    """
+    Vùng chữ nhật nhỏ nhất (page, col, pages, w) chứa mọi byte khác nhau.
+    old = None (chưa biết màn hình đang hiện gì) → cả màn hình; không đổi → None.
+    """
+    if old is None:
+        return 0, 0, OLED_PAGES, OLED_WIDTH
+    diff = old != new
+    if not diff.any():
+        return None
+    pages = np.flatnonzero(diff.any(axis=1))
+    cols = np.flatnonzero(diff.any(axis=0))
+    return int(pages[0]), int(cols[0]), int(pages[-1] - pages[0] + 1), int(cols[-1] - cols[0] + 1)
+
+
 class PSWKitWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -59,8 +172,73 @@ class PSWKitWindow(QMainWindow):
         # Khóa để tránh spam lệnh liên tục
         self.command_lock = False
 
+        # Thời gian xử lý lệnh trong firmware (µs), cập nhật từ PERF;...
+        self.fw_perf = {}
+
+        # ACK đang chờ từ firmware, VD: {"R1=ON": 1}
+        # Hết ACK_TIMEOUT_MS mà chưa nhận → gửi STATE để đồng bộ lại
+        self.pending_acks = {}
+
+        # Performance HUD: bộ đếm luôn chạy, nhãn chỉ cập nhật khi bật (Tools → Performance HUD)
+        self.hud_handle_s = 0.0          # tổng thời gian handle_serial_line (log + parse)
+        self.hud_handled = 0
+        self.hud_paints = 0              # số lần vẽ lại plot (Paint của viewport)
+        self.hud_status_batch = 0        # STATUS / DST trong 1 lần read_serial
+        self.hud_coalesced = 0           # STATUS / DST bị frame sau đè trong cùng lần read_serial
+        self.hud_last = None
+
         # Serial manager (tách logic Serial khỏi UI)
-        self.serial_manager = SerialManager(line_callback=self.handle_serial_line)
+        self.serial_manager = SerialManager(
+            line_callback=self.handle_serial_line,
+            bulk_callback=self.handle_serial_bulk,
+        )
+
+        # Cửa sổ plot cho capture tốc độ cao (CAP), tạo khi cần
+        self.capture_plot = None
+        self.capture_curve = None
+        self.capture_trig_line = None
+        self.capture_level_line = None
+        self.last_cap_args = "1 4096 20000"
+        self.last_trig_args = "1 2000 F 20 4096 20000"
+
+        # Log sự kiện Sensor (EVT;S3=1;t=..;) – cửa sổ riêng, mở từ menu Tools
+        self.event_log = QPlainTextEdit()
+        self.event_log.setReadOnly(True)
+        self.event_log.setMaximumBlockCount(5000)   # giới hạn bộ nhớ khi chạy lâu
+        self.event_log.setWindowTitle("Sensor Events")
+        self.event_log.setWindowIcon(QIcon(resource_path("psw.ico")))
+        self.event_log.resize(420, 500)
+        # micros() của cạnh trước theo từng sensor → độ rộng xung
+        self.evt_last_t = {}
+
+        # Bộ đếm xung / tần số (CNT;...) – stream khi cửa sổ đang mở
+        self.counter_panel = CounterPanel(on_visible=self.set_counter_stream)
+
+        # Trạng thái STATUS gần nhất: keyframe STATUS; ghi đè, DST; chỉ sửa kênh thay đổi
+        self.status_model = {"ADC": [], "S": [], "ADS": []}
+        self.delta_args = None           # "8 2000" khi đang bật DELTA, None = tắt
+
+        # Vẽ OLED bằng QImage rồi gửi FB (chỉ vùng byte thay đổi)
+        self.oled_composer = OledComposer(on_frame=self.send_oled_fb)
+        self.oled_fb = None              # framebuffer board đang hiện, None = không biết
+
+        # RS485 qua UART2 của kit: RX về bằng BIN;TYPE=RS485;..., TX bằng RS485 TX <hex>
+        self.rs485_console = Rs485Console(on_send=self.send_rs485, on_config=self.configure_rs485)
+
+        # Modbus RTU master chạy trên RS485 passthrough (hoặc slave giả lập)
+        self.modbus_panel = ModbusPanel(send_rs485=self.send_rs485)
+
+        # Phân tích bus RS485 (RS485 SNIFF ON); cổng USB chuyển lên SNIFF_LINK_BAUD khi chạy
+        self.sniffer_panel = SnifferPanel(on_run=self.set_rs485_sniff)
+        self.link_baud = 115200
+        self.sniff_after_link = False
+
+        # Ghi telemetry xuống đĩa (thread riêng, file .npy theo cột, xoay segment)
+        self.recorder = telemetry_recorder.TelemetryRecorder(TELEMETRY_SCHEMA)
+        self.rec_root = os.path.join(os.path.expanduser("~"), "PSWKit_records")
+        self.rec_timer = QTimer()
+        self.rec_timer.setInterval(1000)           # đẩy chunk + cập nhật status bar mỗi 1 s
+        self.rec_timer.timeout.connect(self.recorder_tick)
 
         # ===== Gắn signal cho các nút chính =====
         self.btnRefresh.clicked.connect(self.refresh_ports)
@@ -108,6 +286,61 @@ class PSWKitWindow(QMainWindow):
         # ===== Help / API =====
         self.btnHelp.clicked.connect(self.show_help)
 
+        # ===== Menu Tools (các công cụ không có sẵn trong .ui) =====
+        self.menuTools = self.menuBar().addMenu("Tools")
+        self.actionCapture = self.menuTools.addAction("ADC Capture (CAP)...")
+        self.actionCapture.triggered.connect(self.start_adc_capture)
+        self.actionTrigger = self.menuTools.addAction("Trigger Capture (TRIG)...")
+        self.actionTrigger.triggered.connect(self.start_trigger_capture)
+        self.actionEvents = self.menuTools.addAction("Sensor Events")
+        self.actionEvents.triggered.connect(self.show_event_log)
+        self.actionCounters = self.menuTools.addAction("Pulse Counters (CNT)")
+        self.actionCounters.triggered.connect(self.show_counter_panel)
+        self.actionDelta = self.menuTools.addAction("Delta STATUS (DELTA)...")
+        self.actionDelta.triggered.connect(self.configure_delta_status)
+        self.actionOled = self.menuTools.addAction("OLED Composer (FB)")
+        self.actionOled.triggered.connect(self.show_oled_composer)
+        self.actionRs485 = self.menuTools.addAction("RS485 Console")
+        self.actionRs485.triggered.connect(self.show_rs485_console)
+        self.actionModbus = self.menuTools.addAction("Modbus RTU Master")
+        self.actionModbus.triggered.connect(self.show_modbus_panel)
+        self.actionSniffer = self.menuTools.addAction("RS485 Bus Analyzer")
+        self.actionSniffer.triggered.connect(self.show_sniffer_panel)
+        self.actionRecord = self.menuTools.addAction("Record Telemetry...")
+        self.actionRecord.setCheckable(True)
+        self.actionRecord.toggled.connect(self.set_recording)
+        self.actionOpenRecord = self.menuTools.addAction("Open Recording...")
+        self.actionOpenRecord.triggered.connect(self.open_recording)
+        self.actionCloseRecord = self.menuTools.addAction("Close Recording (Live)")
+        self.actionCloseRecord.triggered.connect(self.close_recording)
+        self.actionCloseRecord.setEnabled(False)
+        self.actionRawCapture = self.menuTools.addAction("Capture Serial Bytes...")
+        self.actionRawCapture.setCheckable(True)
+        self.actionRawCapture.toggled.connect(self.set_serial_capture)
+        self.actionReplay = self.menuTools.addAction("Replay Capture...")
+        self.actionReplay.triggered.connect(self.replay_capture)
+        self.actionHud = self.menuTools.addAction("Performance HUD")
+        self.actionHud.setCheckable(True)
+        self.actionHud.toggled.connect(self.set_hud_visible)
+
+        self.hud_label = QLabel()
+        self.hud_label.setVisible(False)
+        self.statusBar().addPermanentWidget(self.hud_label)
+        self.hud_timer = QTimer()
+        self.hud_timer.setInterval(1000)
+        self.hud_timer.timeout.connect(self.hud_tick)
+
+        # Watchdog event loop: __main__ bật sau khi app.exec_() chạy (không tính lúc dựng
+        # cửa sổ là treo); bench.py / script nhúng cửa sổ thì để tắt
+        self.stall_watchdog = stall_watchdog.StallWatchdog(STALL_THRESHOLD_MS / 1000, STALL_LOG)
+        self.stall_timer = QTimer()
+        self.stall_timer.setTimerType(Qt.PreciseTimer)
+        self.stall_timer.setInterval(int(stall_watchdog.HEARTBEAT_S * 1000))
+        self.stall_timer.timeout.connect(self.stall_heartbeat)
+        self.actionStall = self.menuTools.addAction("Stall Watchdog")
+        self.actionStall.setCheckable(True)
+        self.actionStall.toggled.connect(self.set_stall_watchdog)
+
         # ===== About / Version =====
         # self.btnAbout.clicked.connect(self.show_about_message)
 
@@ -165,12 +398,54 @@ class PSWKitWindow(QMainWindow):
         layout.addWidget(self.plot)
 
         self.plot.setLabel("left", "ADC1 Value")
-        self.plot.setLabel("bottom", "Samples")
+        self.plot.setLabel("bottom", "Time", units="s")
         self.plot.showGrid(x=True, y=True)
+        self.plot_t = []
         self.plot_data = []
+        self.plot_min = []
+        self.plot_max = []
+        self.plot_t_ads = []
+        self.plot_data_ads = []
         self.max_points = 200
 
-        self.curve = self.plot.plot([], [])
+        # Trục thời gian theo t=<micros> của FW (không theo thời điểm PC nhận)
+        self.device_clock = DeviceClock()
+        # Frame STATUS bị mất, phát hiện từ khoảng trống timestamp
+        self.dropped_frames = 0
+
+        legend = self.plot.addLegend()
+        self.curve = self.plot.plot([], [], name="ADC1")
+        # Dải min/max của ADC1 trong mỗi chu kỳ READ (FW lấy mẫu theo timer)
+        self.curve_min = self.plot.plot([], [], pen=pg.mkPen((100, 100, 255, 80)))
+        self.curve_max = self.plot.plot([], [], pen=pg.mkPen((100, 100, 255, 80)))
+        self.plot.addItem(
+            pg.FillBetweenItem(self.curve_min, self.curve_max, brush=(100, 100, 255, 50))
+        )
+        # ADS A0 (cache trong FW, đi kèm STATUS / ADS STREAM): ±32767 nên vẽ trên
+        # ViewBox riêng (trục phải, chung trục X), không đè autoscale của ADC1 (0..4095)
+        plot_item = self.plot.getPlotItem()
+        self.ads_view = pg.ViewBox()
+        plot_item.showAxis("right")
+        plot_item.scene().addItem(self.ads_view)
+        plot_item.getAxis("right").linkToView(self.ads_view)
+        plot_item.getAxis("right").setLabel("ADS A0")
+        self.ads_view.setXLink(plot_item)
+        plot_item.getViewBox().sigResized.connect(self.sync_ads_view)
+        self.curve_ads = pg.PlotDataItem([], [], pen="y")
+        self.ads_view.addItem(self.curve_ads)
+        legend.addItem(self.curve_ads, "ADS A0")
+
+        # Đếm số lần vẽ lại plot cho Performance HUD (FPS)
+        self.plot.viewport().installEventFilter(self)
+
+        # Xem lại phiên đã ghi trên cùng plot (memmap); khác None = đang xem lịch sử
+        self.history = None
+        self.history_t0 = 0.0
+        self.plot.getViewBox().sigXRangeChanged.connect(self.history_view_changed)
+        # Pyramid dựng trong thread nền (phiên mới / chưa có lod_*.npz): kiểm tra xong chưa
+        self.history_timer = QTimer()
+        self.history_timer.setInterval(250)
+        self.history_timer.timeout.connect(self.history_pyramid_tick)
 
         # ===== Khởi tạo ban đầu =====
         self.refresh_ports()
@@ -239,22 +514,167 @@ class PSWKitWindow(QMainWindow):
     # ------------------------------------------------------------------
     # Plot ADC (Realtime)
     # ------------------------------------------------------------------
-    def update_adc_plot(self, new_value: int):
+    def frame_time(self, fields: dict) -> float:
+        """Thời điểm của frame (giây): t=<micros> của FW, FW cũ thì dùng đồng hồ PC."""
+        if "t" in fields:
+            return self.device_clock.seconds(int(fields["t"]))
+        return time.monotonic()
+
+    def sync_ads_view(self):
+        """Giữ ViewBox ADS trùng khung với ViewBox chính khi plot đổi kích thước."""
+        main = self.plot.getViewBox()
+        self.ads_view.setGeometry(main.sceneBoundingRect())
+        self.ads_view.linkedViewChanged(main, self.ads_view.XAxis)
+
+    def clear_plot(self):
+        for lst in (self.plot_t, self.plot_data, self.plot_min, self.plot_max,
+                    self.plot_t_ads, self.plot_data_ads):
+            lst.clear()
+        if self.history is None:
+            for c in (self.curve, self.curve_min, self.curve_max, self.curve_ads):
+                c.setData([], [])
+        self.device_clock.reset()
+        self.dropped_frames = 0
+        self.plot.setTitle(None)
+
+    def update_adc_plot(self, t: float, new_value: int, vmin=None, vmax=None):
+        """
+        t: thời điểm frame (giây); new_value: mean ADC1;
+        vmin / vmax: min / max trong chu kỳ (nếu FW có gửi).
+        """
+        if self.history is not None:
+            return              # plot đang hiện phiên đã ghi
+        self.plot_t.append(t)
         self.plot_data.append(new_value)
+        self.plot_min.append(new_value if vmin is None else vmin)
+        self.plot_max.append(new_value if vmax is None else vmax)
         if len(self.plot_data) > self.max_points:
+            self.plot_t = self.plot_t[-self.max_points:]
             self.plot_data = self.plot_data[-self.max_points:]
+            self.plot_min = self.plot_min[-self.max_points:]
+            self.plot_max = self.plot_max[-self.max_points:]
+
+        self.curve.setData(self.plot_t, self.plot_data)
+        self.curve_min.setData(self.plot_t, self.plot_min)
+        self.curve_max.setData(self.plot_t, self.plot_max)
+        self.update_timing_stats()
 
-        x = list(range(len(self.plot_data)))
-        self.curve.setData(x, self.plot_data)
+    def update_timing_stats(self):
+        """
+        Jitter của chu kỳ STATUS (theo timestamp FW) và đếm frame bị mất:
+        khoảng cách > 1.5 lần trung vị → coi như mất round(dt / trung vị) - 1 frame.
+        Chế độ DELTA: FW bỏ qua chu kỳ không có kênh nào vượt deadband, khoảng trống
+        là bình thường → không đếm mất frame.
+        """
+        if len(self.plot_t) < 6:
+            return
+
+        dt = np.diff(self.plot_t) * 1000.0          # ms
+        if self.delta_args:
+            lost = "DELTA"
+        else:
+            median = float(np.median(dt[:-1]))
+            if median > 0 and dt[-1] > 1.5 * median:
+                self.dropped_frames += int(round(dt[-1] / median)) - 1
+            lost = f"mất {self.dropped_frames} frame"
+
+        self.plot.setTitle(
+            f"Δt {dt.mean():.1f} ms ± {dt.std():.1f} "
+            f"(min {dt.min():.1f} / max {dt.max():.1f}) · {lost}",
+            size="9pt",
+        )
+
+    def update_ads_plot(self, t: float, new_value: int):
+        if self.history is not None:
+            return
+        self.plot_t_ads.append(t)
+        self.plot_data_ads.append(new_value)
+        if len(self.plot_data_ads) > self.max_points:
+            self.plot_t_ads = self.plot_t_ads[-self.max_points:]
+            self.plot_data_ads = self.plot_data_ads[-self.max_points:]
+
+        self.curve_ads.setData(self.plot_t_ads, self.plot_data_ads)
+
+    def update_ads_labels(self, t: float, values):
+        """Cập nhật labelADS0..labelADS3 (nếu UI có) và đường ADS A0 trên plot."""
+        for i, val in enumerate(values):
+            lbl = getattr(self, f"labelADS{i}", None)
+            if lbl is not None:
+                lbl.setText(str(val))
+        if values:
+            self.update_ads_plot(t, values[0])
+
+    # ------------------------------------------------------------------
+    # Capture tốc độ cao (CAP → khối BIN)
+    # ------------------------------------------------------------------
+    def start_adc_capture(self):
+        """Hỏi CH / N / RATE rồi gửi CAP <ch> <n> <rate>."""
+        text, ok = QInputDialog.getText(
+            self, "ADC Capture", "CH N RATE  (VD: 1 4096 20000):", text=self.last_cap_args
+        )
+        if not ok or not text.strip():
+            return
+        self.last_cap_args = text.strip()
+        self.send_cmd(f"CAP {self.last_cap_args}")
+
+    def start_trigger_capture(self):
+        """Hỏi tham số trigger rồi gửi TRIG <ch> <level> <R|F> <pre%> <n> <rate>."""
+        text, ok = QInputDialog.getText(
+            self, "Trigger Capture",
+            "CH LEVEL EDGE(R/F) PRE% N RATE  (VD: 1 2000 F 20 4096 20000)\n"
+            "Gửi 'OFF' để hủy trigger đang chờ:",
+            text=self.last_trig_args,
+        )
+        if not ok or not text.strip():
+            return
+        if text.strip().upper() != "OFF":
+            self.last_trig_args = text.strip()
+        self.send_cmd(f"TRIG {text.strip()}")
+
+    def show_capture(self, samples, rate: int, title: str, pre: int = 0, level=None):
+        """
+        Vẽ capture trong cửa sổ riêng, trục X là thời gian thật.
+        pre: chỉ số mẫu trigger (t = 0 tại đó); level: vẽ đường mức trigger.
+        """
+        if self.capture_plot is None:
+            self.capture_plot = pg.PlotWidget()
+            self.capture_plot.setWindowIcon(QIcon(resource_path("psw.ico")))
+            self.capture_plot.resize(900, 400)
+            self.capture_plot.setLabel("left", "ADC Value")
+            self.capture_plot.setLabel("bottom", "Time", units="s")
+            self.capture_plot.showGrid(x=True, y=True)
+            self.capture_curve = self.capture_plot.plot([], [])
+
+            dash = pg.mkPen("r", style=Qt.DashLine)
+            self.capture_trig_line = pg.InfiniteLine(angle=90, pen=dash)
+            self.capture_level_line = pg.InfiniteLine(angle=0, pen=dash)
+            self.capture_plot.addItem(self.capture_trig_line)
+            self.capture_plot.addItem(self.capture_level_line)
+
+        t = (np.arange(len(samples)) - pre) / float(rate)
+        self.capture_curve.setData(t, samples)
+
+        # Đường trigger (t = 0) và mức LEVEL chỉ hiện với capture TRIG
+        self.capture_trig_line.setVisible(level is not None)
+        self.capture_level_line.setVisible(level is not None)
+        if level is not None:
+            self.capture_trig_line.setValue(0)
+            self.capture_level_line.setValue(level)
+        self.capture_plot.setWindowTitle(title)
+        self.capture_plot.show()
+        self.capture_plot.raise_()
 
     # ------------------------------------------------------------------
     # Điều khiển Relay
     
     # ------------------------------------------------------------------
     def toggle_relay(self, idx: int, btn):
+        state = "OFF" if self.relay_state[idx] else "ON"
+        # Lệnh bị bỏ (command_lock / mất kết nối) → giữ nguyên trạng thái, không chờ ACK
+        if not self.send_cmd(f"R{idx} {state}"):
+            return
         self.relay_state[idx] = not self.relay_state[idx]
-        state = "ON" if self.relay_state[idx] else "OFF"
-        self.send_cmd(f"R{idx} {state}")
+        self.expect_ack(f"R{idx}={state}")
         btn.setText(f"R{idx} {state}")
         self.update_relay_label(idx, self.relay_state[idx])
 
@@ -484,11 +904,25 @@ class PSWKitWindow(QMainWindow):
             self.auto_timer.stop()
             self.checkAutoRead.setChecked(False)
 
+            # Trả cổng USB của board về 115200 để lần connect sau bắt tay được
+            if self.link_baud != 115200:
+                self.send_system_cmd("RS485 SNIFF OFF")
+                self.send_system_cmd("LINK 115200")
+                self.serial_manager.flush()
+            self.link_baud = 115200
+            self.sniff_after_link = False
+            self.sniffer_panel.set_running(False)
+
             self.serial_manager.disconnect()
             self.btnConnect.setText("Connect")
             self.log("Disconnected.")
             self.update_conn_label(False)
             self.handshake_ok = False
+            self.pending_acks.clear()
+            self.evt_last_t.clear()
+            self.reset_status_model()
+            self.oled_fb = None
+            self.clear_plot()
 
             # Reset SIO khi disconnect cho đồng bộ UI
             for i in range(1, 7):
@@ -505,21 +939,22 @@ class PSWKitWindow(QMainWindow):
         # ------------------------------------------------------------------
     # Gửi lệnh xuống ESP32
     # ------------------------------------------------------------------
-    def send_cmd(self, cmd: str):
+    def send_cmd(self, cmd: str) -> bool:
         """
         Gửi lệnh xuống ESP32 thông qua SerialManager.
         Dùng command_lock để tránh spam nhiều lệnh cùng lúc,
         nhưng KHÔNG disable / enable toàn bộ UI nữa (tránh nhấp nháy).
+        Trả về True nếu lệnh thực sự đã được gửi.
         """
         if not self.serial_manager.is_connected():
             self.log("Not connected.")
-            return
+            return False
 
         # Nếu đang khóa lệnh (vừa mới gửi xong) thì bỏ qua
         if self.command_lock:
             # Có thể log hoặc im lặng, tùy bạn
             # self.log("Command busy, please wait...")
-            return
+            return False
 
         self.command_lock = True
 
@@ -530,15 +965,89 @@ class PSWKitWindow(QMainWindow):
             self.log(f"Send error: {e}")
             # Mở khóa ngay nếu lỗi
             self.command_lock = False
+            return False
         else:
             # Mở khóa sau một khoảng ngắn để tránh spam click quá nhanh
             QTimer.singleShot(120, self._release_command_lock)
+            return True
 
     
     def _release_command_lock(self):
         """Được gọi bởi QTimer.singleShot để mở khóa gửi lệnh."""
         self.command_lock = False
 
+    # ------------------------------------------------------------------
+    # Đồng bộ trạng thái output với firmware (STATE / ACK)
+    # ------------------------------------------------------------------
+    def send_system_cmd(self, cmd: str):
+        """
+        Gửi lệnh hệ thống (STATE, EVT ON, ...) do dashboard tự phát.
+        Không đi qua command_lock: các lệnh này không được phép bị bỏ.
+        """
+        if not self.serial_manager.is_connected():
+            return
+        try:
+            self.serial_manager.send_line(cmd)
+            self.log(f">>> {cmd}")
+        except Exception as e:
+            self.log(f"Send error: {e}")
+
+    def request_state_sync(self):
+        """Gửi STATE để đọc trạng thái thật của Relay / SIO / LED / RGB."""
+        self.send_system_cmd("STATE")
+
+    def expect_ack(self, token: str):
+        """
+        Ghi nhận 1 ACK cần chờ (VD: "R1=ON" cho OK;R1=ON;).
+        Nếu hết ACK_TIMEOUT_MS mà chưa có → đồng bộ lại bằng STATE.
+        """
+        if not self.serial_manager.is_connected():
+            return
+        self.pending_acks[token] = self.pending_acks.get(token, 0) + 1
+        QTimer.singleShot(ACK_TIMEOUT_MS, lambda t=token: self._check_ack(t))
+
+    def _check_ack(self, token: str):
+        """Được gọi khi hết thời gian chờ ACK của token."""
+        count = self.pending_acks.get(token, 0)
+        if count <= 0:
+            return
+        if count == 1:
+            del self.pending_acks[token]
+        else:
+            self.pending_acks[token] = count - 1
+        self.log(f"ACK missing: {token} → resync STATE")
+        self.request_state_sync()
+
+    def apply_state(self, relay_mask: int, sio_mask: int, led: bool, rgb):
+        """Cập nhật relay_state / sio_state / LED / RGB và UI theo frame STATE."""
+        for idx in self.relay_state:
+            on = bool(relay_mask & (1 << (idx - 1)))
+            self.relay_state[idx] = on
+            btn = self.relay_buttons.get(idx)
+            if btn is not None:
+                btn.setText(f"R{idx} {'ON' if on else 'OFF'}")
+            self.update_relay_label(idx, on)
+
+        for idx in self.sio_state:
+            on = bool(sio_mask & (1 << (idx - 1)))
+            self.sio_state[idx] = on
+            cb = getattr(self, f"checkSIO{idx}", None)
+            if cb is not None:
+                # Chặn signal để không gửi lại lệnh SIOx xuống board
+                cb.blockSignals(True)
+                cb.setChecked(on)
+                cb.blockSignals(False)
+
+        self.led_on = led
+
+        if rgb is not None:
+            for s, v in zip((self.sliderR, self.sliderG, self.sliderB), rgb):
+                if isinstance(s, QSlider):
+                    s.blockSignals(True)
+                    s.setValue(v)
+                    s.blockSignals(False)
+            self.update_rgb_labels()
+
     # ------------------------------------------------------------------
     # Callback nhận từng dòng serial từ SerialManager
     # ------------------------------------------------------------------
@@ -553,8 +1062,57 @@ class PSWKitWindow(QMainWindow):
             self.handle_serial_disconnect()
             return
 
-        self.log(f"<<< {line}")
+        t0 = time.perf_counter()
+        # EVT / CNT / ACK RS485 đi vào cửa sổ riêng, không làm ngập log chính
+        if not line.startswith(("EVT;", "CNT;", "OK;RS485_TX=")):
+            self.log(f"<<< {line}")
         self.parse_line(line)
+        if line.startswith(("STATUS;", "DST;")):
+            self.hud_status_batch += 1
+        self.hud_handle_s += time.perf_counter() - t0
+        self.hud_handled += 1
+
+    def handle_serial_bulk(self, header: dict, payload: bytes):
+        """
+        Được SerialManager gọi cho mỗi khối BIN;... đã nhận đủ và đúng CRC.
+        header: các trường K=V của dòng BIN;...
+        """
+        kind = header.get("TYPE", "")
+
+        # RS485 có thể về liên tục → chỉ hiện trong console riêng
+        if kind == "RS485":
+            self.rs485_console.append_frame(
+                "RX", payload, int(header.get("t", "0")), int(header.get("OVF", "0"))
+            )
+            self.modbus_panel.feed(payload)
+            return
+        if kind == "SNIFF":
+            self.sniffer_panel.feed(payload, header)
+            return
+
+        self.log(f"<<< BIN {kind} ({len(payload)} bytes)")
+
+        try:
+            if kind == "CAP":
+                samples = np.frombuffer(payload, dtype="<u2")
+                rate = int(header.get("RATE", "1"))
+                self.show_capture(
+                    samples, rate, f"Capture ADC{header.get('CH', '?')} – {len(samples)} mẫu @ {rate} Hz"
+                )
+            elif kind == "TRIG":
+                samples = np.frombuffer(payload, dtype="<u2")
+                rate = int(header.get("RATE", "1"))
+                edge = "rising" if header.get("EDGE") == "R" else "falling"
+                level = int(header.get("LEVEL", "0"))
+                self.show_capture(
+                    samples, rate,
+                    f"Trigger ADC{header.get('CH', '?')} – {edge} @ {level}, "
+                    f"{len(samples)} mẫu @ {rate} Hz",
+                    pre=int(header.get("PRE", "0")),
+                    level=level,
+                )
+        except Exception as e:
+            self.log(f"Parse BIN {kind} error: {e}")
 
     # ------------------------------------------------------------------
     # Đọc Serial (poll từ SerialManager)
@@ -562,6 +1120,10 @@ class PSWKitWindow(QMainWindow):
     def read_serial(self):
         """Hàm này được timer gọi mỗi 100ms để đọc dữ liệu serial."""
         self.serial_manager.poll()
+        # Nhiều STATUS trong 1 lần đọc: plot / label chỉ kịp hiện frame cuối
+        if self.hud_status_batch > 1:
+            self.hud_coalesced += self.hud_status_batch - 1
+        self.hud_status_batch = 0
 
 
     # ------------------------------------------------------------------
@@ -623,7 +1185,112 @@ class PSWKitWindow(QMainWindow):
             if not self.handshake_ok:
                 self.handshake_ok = True
                 self.send_cmd("BUZ")   # gọi buzzer trên board lần đầu
+                # Sau connect / reconnect: đọc trạng thái output thật từ board
+                self.request_state_sync()
+                # Bật sự kiện Sensor (FW đẩy EVT;... ngay khi có cạnh)
+                self.send_system_cmd("EVT ON")
+                # Cửa sổ CNT đang mở từ trước khi connect → bật lại stream
+                if self.counter_panel.isVisible():
+                    self.set_counter_stream(True)
+                # Đang dùng DELTA → bật lại (FW có thể vừa reset), frame kế tiếp là keyframe
+                if self.delta_args:
+                    self.send_system_cmd(f"DELTA {self.delta_args}")
+
+            return
+
+        # OK;LINK=921600;  FW đã đổi tốc độ cổng USB → PC đổi theo
+        if line.startswith("OK;LINK="):
+            try:
+                self.link_baud = int(parse_fields(line)["LINK"])
+                self.serial_manager.set_baudrate(self.link_baud)
+                self.log(f"USB link → {self.link_baud} baud")
+            except Exception as e:
+                self.log(f"Parse LINK error: {e}")
+            if self.sniff_after_link:
+                self.sniff_after_link = False
+                self.send_system_cmd("RS485 SNIFF ON")
+            return
+
+        # FB lỗi (CRC / timeout) → không còn biết màn hình, lần sau gửi lại cả khung
+        if line.startswith(("ERR;FB_", "ERR;BAD_FB;")):
+            self.oled_fb = None
+            return
+
+        # ACK: OK;R1=ON; / OK;SIO2=OFF; / OK;LED=ON; ...
+        if line.startswith("OK;"):
+            parts = [p for p in line.split(";") if p]
+            if len(parts) > 1:
+                token = parts[1]
+                count = self.pending_acks.get(token, 0)
+                if count == 1:
+                    del self.pending_acks[token]
+                elif count > 1:
+                    self.pending_acks[token] = count - 1
+            return
+
+        # STATE;R=000F;SIO=05;LED=1;RGB=r,g,b;
+        if line.startswith("STATE;"):
+            try:
+                relay_mask = 0
+                sio_mask = 0
+                led = False
+                rgb = None
+                for p in line.split(";"):
+                    if p.startswith("R="):
+                        relay_mask = int(p[2:], 16)
+                    elif p.startswith("SIO="):
+                        sio_mask = int(p[4:], 16)
+                    elif p.startswith("LED="):
+                        led = p[4:] == "1"
+                    elif p.startswith("RGB="):
+                        rgb = [int(x) for x in p[4:].split(",")]
+
+                self.pending_acks.clear()
+                self.apply_state(relay_mask, sio_mask, led, rgb)
+            except Exception as e:
+                self.log(f"Parse STATE error: {e}")
+            return
+
+        # EVT;S3=1;t=<micros>;  hoặc  EVT;OVF=n;
+        if line.startswith("EVT;"):
+            try:
+                self.handle_sensor_event(line)
+            except Exception as e:
+                self.log(f"Parse EVT error: {e}")
+            return
+
+        # CNT;C=c1,c2,..;F=f1,f2,..;t=<micros>;
+        if line.startswith("CNT;"):
+            try:
+                fields = parse_fields(line)
+                counts = [int(x) for x in fields.get("C", "").split(",") if x != ""]
+                freqs = [float(x) for x in fields.get("F", "").split(",") if x != ""]
+                # Cùng DeviceClock với STATUS: không gãy trục khi micros() tràn / kit reset
+                self.counter_panel.update_counters(counts, freqs, self.frame_time(fields))
+            except Exception as e:
+                self.log(f"Parse CNT error: {e}")
+            return
 
+        # RS485;BAUD=9600;FMT=8N1;GAP=4010;RX=..;TX=..;OVF=..;
+        if line.startswith("RS485;"):
+            self.rs485_console.update_status(parse_fields(line))
+            return
+
+        # PERF;N=..;LAST=..;AVG=..;MAX=..;  (µs, thời gian xử lý lệnh trong FW)
+        if line.startswith("PERF;"):
+            try:
+                for p in line.split(";")[1:]:
+                    if "=" in p:
+                        k, v = p.split("=", 1)
+                        self.fw_perf[k] = int(v)
+                self.statusBar().showMessage(
+                    f"FW cmd time: last {self.fw_perf.get('LAST', 0)} µs, "
+                    f"avg {self.fw_perf.get('AVG', 0)} µs, "
+                    f"max {self.fw_perf.get('MAX', 0)} µs "
+                    f"({self.fw_perf.get('N', 0)} cmds)"
+                )
+            except Exception as e:
+                self.log(f"Parse PERF error: {e}")
             return
 
 
@@ -631,8 +1298,13 @@ class PSWKitWindow(QMainWindow):
         if line.startswith("STATUS;"):
             try:
                 parts = line.split(";")
+                t = self.frame_time(parse_fields(line))
                 adc_vals = None
+                min_vals = None
+                max_vals = None
+                n_samples = None
                 s_vals = None
+                ads_vals = None
 
                 for p in parts:
                     if p.startswith("ADC="):
@@ -643,60 +1315,495 @@ class PSWKitWindow(QMainWindow):
                         s_str = p[2:]
                         if s_str:
                             s_vals = [int(x) for x in s_str.split(",") if x != ""]
-
-                # Cập nhật ADC (4 kênh)
+                    elif p.startswith("SM="):
+                        # Dạng gọn (READ M): bitmask hex, bit0 = S1
+                        mask = int(p[3:], 16)
+                        s_vals = [(mask >> i) & 1 for i in range(16)]
+                    elif p.startswith("ADS="):
+                        ads_vals = [int(x) for x in p[4:].split(",") if x != ""]
+                    elif p.startswith("MIN="):
+                        min_vals = [int(x) for x in p[4:].split(",") if x != ""]
+                    elif p.startswith("MAX="):
+                        max_vals = [int(x) for x in p[4:].split(",") if x != ""]
+                    elif p.startswith("N="):
+                        n_samples = int(p[2:])
+
+                # Keyframe: thay toàn bộ model (kênh không có trong frame giữ nguyên)
                 if adc_vals:
-                    if len(adc_vals) > 0:
-                        self.labelADC1.setText(str(adc_vals[0]))
-                    if len(adc_vals) > 1:
-                        self.labelADC2.setText(str(adc_vals[1]))
-                    if len(adc_vals) > 2:
-                        self.labelADC3.setText(str(adc_vals[2]))
-                    if len(adc_vals) > 3:
-                        self.labelADC4.setText(str(adc_vals[3]))
-                    self.update_adc_plot(adc_vals[0])
-
-                # Cập nhật Sensor (tối đa 16 kênh)
+                    self.status_model["ADC"] = adc_vals
                 if s_vals:
-                    for i, val in enumerate(s_vals, start=1):
-                        lbl = getattr(self, f"labelS{i}", None)
-                        if lbl is not None:
-                            lbl.setText(str(val))
+                    self.status_model["S"] = s_vals
+                if ads_vals:
+                    self.status_model["ADS"] = ads_vals
+
+                self.apply_status(t, adc_vals, s_vals, ads_vals, min_vals, max_vals, n_samples)
+                self.record_status(t, REC_STATUS)
 
             except Exception as e:
                 self.log(f"Parse STATUS error: {e}")
 
-        # ADS;A0=xxxx;A1=yyyy;
+        # DST;ADC1=2010;S3=1;ADS0=12345;t=<micros>;  (chỉ kênh thay đổi, DELTA mode)
+        elif line.startswith("DST;"):
+            try:
+                fields = parse_fields(line)
+                if self.merge_status_delta(fields):
+                    self.record_status(self.frame_time(fields), REC_DST)
+            except Exception as e:
+                self.log(f"Parse DST error: {e}")
+
+        # ADS;A0=xxxx;A1=yyyy;A2=zzzz;A3=wwww;t=<micros>;
         elif line.startswith("ADS;"):
             try:
-                parts = line.split(";")
-                a0_val = None
-                a1_val = None
-                for p in parts:
-                    if p.startswith("A0="):
-                        a0_val = int(p[3:])
-                    elif p.startswith("A1="):
-                        a1_val = int(p[3:])
-
-                if a0_val is not None:
-                    self.labelADS0.setText(str(a0_val))
-                if a1_val is not None:
-                    self.labelADS1.setText(str(a1_val))
+                fields = parse_fields(line)
+
+                # A0, A1, ... liên tiếp (FW cũ chỉ có A0/A1)
+                ads_vals = []
+                while f"A{len(ads_vals)}" in fields:
+                    ads_vals.append(int(fields[f"A{len(ads_vals)}"]))
+
+                t = self.frame_time(fields)
+                self.update_ads_labels(t, ads_vals)
+                if ads_vals:
+                    self.status_model["ADS"] = ads_vals
+                    self.record_status(t, REC_ADS)
             except Exception as e:
                 self.log(f"Parse ADS error: {e}")
 
+    def apply_status(self, t: float, adc_vals, s_vals, ads_vals,
+                     min_vals=None, max_vals=None, n_samples=None):
+        """Đưa giá trị STATUS (keyframe hoặc model sau khi merge DST) lên label / plot."""
+        # Cập nhật ADC (4 kênh): ADC = mean, tooltip = min / max / số mẫu
+        if adc_vals:
+            for i, val in enumerate(adc_vals[:4]):
+                lbl = getattr(self, f"labelADC{i + 1}")
+                lbl.setText(str(val))
+                if min_vals and max_vals and i < len(min_vals) and i < len(max_vals):
+                    lbl.setToolTip(
+                        f"mean {val}  min {min_vals[i]}  max {max_vals[i]}  "
+                        f"(p-p {max_vals[i] - min_vals[i]}, {n_samples} mẫu)"
+                    )
+                else:
+                    lbl.setToolTip("")
+
+            if min_vals and max_vals:
+                self.update_adc_plot(t, adc_vals[0], min_vals[0], max_vals[0])
+            else:
+                self.update_adc_plot(t, adc_vals[0])
+
+        # Cập nhật Sensor (tối đa 16 kênh)
+        if s_vals:
+            for i, val in enumerate(s_vals, start=1):
+                lbl = getattr(self, f"labelS{i}", None)
+                if lbl is not None:
+                    lbl.setText(str(val))
+
+        # ADS A0..A3 (giá trị cache trong FW)
+        if ads_vals:
+            self.update_ads_labels(t, ads_vals)
+
+    def merge_status_delta(self, fields: dict) -> bool:
+        """
+        Gộp DST;... vào status_model rồi cập nhật UI.
+        Kênh không có trong DST = không đổi quá deadband → giữ giá trị cũ.
+        Chưa có keyframe (model rỗng) thì bỏ qua, chờ STATUS; kế tiếp (trả về False).
+        """
+        model = self.status_model
+        if not model["ADC"]:
+            return False
+
+        for key, val in fields.items():
+            for name, base in (("ADC", 1), ("ADS", 0), ("S", 1)):
+                if key.startswith(name) and key[len(name):].isdigit():
+                    idx = int(key[len(name):]) - base
+                    lst = model[name]
+                    if idx >= len(lst):
+                        lst.extend([0] * (idx + 1 - len(lst)))
+                    lst[idx] = int(val)
+                    break
+
+        self.apply_status(self.frame_time(fields), model["ADC"], model["S"], model["ADS"])
+        return True
+
+    def reset_status_model(self):
+        for lst in self.status_model.values():
+            lst.clear()
+
+    # ------------------------------------------------------------------
+    # Ghi telemetry (Tools → Record Telemetry)
+    # ------------------------------------------------------------------
+    def record_status(self, t: float, kind: int):
+        """1 dòng = model STATUS hiện tại. Chỉ chép vào chunk RAM, I/O ở thread ghi."""
+        if not self.recorder.active:
+            return
+        model = self.status_model
+        adc = (model["ADC"] + [0] * 4)[:4]
+        ads = (model["ADS"] + [0] * 4)[:4]
+        mask = 0
+        for i, v in enumerate(model["S"][:16]):
+            if v:
+                mask |= 1 << i
+        # host_t đơn điệu (search / trục X khi xem lại); giờ thực = mốc "clock" trong session.json
+        self.recorder.append((t, time.monotonic(), kind, *adc, mask, *ads))
+
+    def set_recording(self, on: bool):
+        if on == self.recorder.active:
+            return
+        if on:
+            root = QFileDialog.getExistingDirectory(self, "Thư mục ghi telemetry", self.rec_root)
+            if not root:
+                self.actionRecord.setChecked(False)
+                return
+            self.rec_root = root
+            try:
+                path = self.recorder.start(root, info={
+                    "port": self.comboPort.currentText(),
+                    "board": self.comboBox.currentText(),
+                })
+            except OSError as e:
+                self.log(f"Record start failed: {e}")
+                self.actionRecord.setChecked(False)
+                return
+            self.rec_timer.start()
+            self.log(f"Recording telemetry → {path}")
+        else:
+            self.rec_timer.stop()
+            self.recorder.stop()
+            self.log(
+                f"Recording stopped: {self.recorder.rows} dòng, "
+                f"{self.recorder.segments} segment, mất {self.recorder.dropped} "
+                f"→ {self.recorder.session_dir}"
+            )
+            self.statusBar().clearMessage()
+
+    def recorder_tick(self):
+        rec = self.recorder
+        rec.flush()
+        if rec.error:
+            self.log(f"Record error: {rec.error}")
+            self.actionRecord.setChecked(False)
+            return
+        self.statusBar().showMessage(
+            f"REC {rec.rows} dòng · {rec.segments} segment · mất {rec.dropped}"
+        )
+
+    def open_recording(self):
+        """Chọn thư mục phiên (có session.json) rồi hiện lên plot chính, zoom toàn phiên."""
+        path = QFileDialog.getExistingDirectory(self, "Mở phiên telemetry", self.rec_root)
+        if not path:
+            return
+        try:
+            session = telemetry_recorder.RecordedSession(path)
+        except (OSError, ValueError, KeyError) as e:
+            self.log(f"Open recording failed: {e}")
+            return
+        if not session.rows:
+            self.log(f"Recording {path} is empty.")
+            return
+
+        self.history = session
+        # Nạp lod_*.npz nếu có; thiếu thì dựng nền, trong lúc đó vẽ bản strided
+        session.start_pyramids(("adc1", "ads0"))
+        if session.pyramids_building:
+            self.log(f"Đang dựng pyramid min/max cho {os.path.basename(path)} (xem trước strided)...")
+            self.history_timer.start()
+        self.history_t0 = float(session.column("host_t", 0, 1)[0])
+        t_end = float(session.column("host_t", session.rows - 1)[0]) - self.history_t0
+        self.actionCloseRecord.setEnabled(True)
+        self.curve_min.setData([], [])
+        self.curve_max.setData([], [])
+        started = time.strftime("%Y-%m-%d %H:%M:%S",
+                                time.localtime(session.wall_time(self.history_t0)))
+        self.plot.setTitle(
+            f"{os.path.basename(path)} · {started} · {session.rows} dòng · {t_end / 3600:.2f} h",
+            size="9pt",
+        )
+        self.plot.enableAutoRange(y=True)
+        self.ads_view.enableAutoRange(y=True)
+        self.plot.setXRange(0, max(t_end, 1e-3), padding=0)
+        self.history_view_changed()
+
+    def close_recording(self):
+        """Quay lại plot realtime."""
+        if self.history is None:
+            return
+        self.history = None
+        self.history_timer.stop()
+        self.actionCloseRecord.setEnabled(False)
+        self.clear_plot()
+        self.plot.enableAutoRange()
+        self.ads_view.enableAutoRange(y=True)
+
+    def history_view_changed(self, *_args):
+        """
+        Khung nhìn X đổi → chọn mức min/max pyramid theo số dòng đang thấy / bề rộng plot.
+        Mức thô: mỗi khối vẽ thành đoạn đứng min→max nên không mất đỉnh nhọn khi zoom ra.
+        """
+        session = self.history
+        if session is None:
+            return
+        x0, x1 = self.plot.getViewBox().viewRange()[0]
+        i0 = max(0, session.search("host_t", self.history_t0 + x0) - 1)
+        i1 = min(session.rows, session.search("host_t", self.history_t0 + x1) + 1)
+        if i1 <= i0:
+            return
+        width = max(100, int(self.plot.getViewBox().width()))
+
+        for curve, name in ((self.curve, "adc1"), (self.curve_ads, "ads0")):
+            pyr = session.pyramid(name, build=False)
+            if pyr is None:
+                t, v = session.strided(name, i0, i1, width)
+                curve.setData(t - self.history_t0, v)
+                continue
+            t, lo, hi, level = pyr.query(i0, i1, width)
+            t = t - self.history_t0
+            if level == 0:
+                curve.setData(t, lo)
+            else:
+                curve.setData(np.repeat(t, 2), np.column_stack((lo, hi)).ravel())
+
+    def history_pyramid_tick(self):
+        """Thread dựng pyramid xong → vẽ lại khung nhìn hiện tại bằng min/max."""
+        session = self.history
+        if session is None or session.pyramids_building:
+            return
+        self.history_timer.stop()
+        if session.pyramid_error is not None:
+            self.log(f"Pyramid build failed: {session.pyramid_error}")
+            return
+        self.log("Pyramid min/max sẵn sàng.")
+        self.history_view_changed()
+
+    # ------------------------------------------------------------------
+    # Ghi / phát lại byte thô trên link (serial_capture)
+    # ------------------------------------------------------------------
+    def set_serial_capture(self, on: bool):
+        mgr = self.serial_manager
+        if on == (mgr.capture is not None):
+            return
+        if on:
+            path, _ = QFileDialog.getSaveFileName(
+                self, "Capture serial", time.strftime("link_%Y%m%d_%H%M%S.cap"),
+                "Serial capture (*.cap)",
+            )
+            if not path:
+                self.actionRawCapture.setChecked(False)
+                return
+            try:
+                mgr.capture = serial_capture.CaptureWriter(path)
+            except OSError as e:
+                self.log(f"Capture failed: {e}")
+                self.actionRawCapture.setChecked(False)
+                return
+            self.log(f"Capturing serial bytes → {path}")
+        else:
+            cap, mgr.capture = mgr.capture, None
+            cap.close()
+            self.log(f"Capture stopped: RX {cap.bytes[serial_capture.RX]} byte, "
+                     f"TX {cap.bytes[serial_capture.TX]} byte → {cap.path}")
+
+    def replay_capture(self):
+        """Mở file .cap và 'connect' tới nó như 1 cổng COM (qua SerialManager / parse_line)."""
+        path, _ = QFileDialog.getOpenFileName(self, "Replay capture", "", "Serial capture (*.cap)")
+        if not path:
+            return
+        speed, ok = QInputDialog.getDouble(
+            self, "Replay capture", "Tốc độ (1 = thời gian gốc, 0 = nhanh nhất):", 1.0, 0.0, 100.0, 1
+        )
+        if not ok:
+            return
+        # click() (không phải setChecked) để chạy đúng toggle_connect như người dùng bấm
+        if self.btnConnect.isChecked():
+            self.btnConnect.click()
+
+        port = f"{serial_capture.REPLAY_PREFIX}{path}@{speed:g}"
+        if self.comboPort.findText(port) < 0:
+            self.comboPort.addItem(port)
+        self.comboPort.setCurrentText(port)
+        self.btnConnect.click()
+
+    # ------------------------------------------------------------------
+    # Performance HUD (Tools → Performance HUD)
+    # ------------------------------------------------------------------
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint and obj is self.plot.viewport():
+            self.hud_paints += 1
+        return super().eventFilter(obj, event)
+
+    def hud_snapshot(self) -> tuple:
+        mgr = self.serial_manager
+        return (time.monotonic(), mgr.rx_bytes, mgr.tx_bytes, mgr.rx_lines,
+                self.hud_handle_s, self.hud_handled, self.hud_paints)
+
+    def set_hud_visible(self, on: bool):
+        self.hud_label.setVisible(on)
+        if on:
+            self.hud_last = self.hud_snapshot()
+            self.hud_label.setText("HUD: đang đo...")
+            self.hud_timer.start()
+        else:
+            self.hud_timer.stop()
+
+    def hud_tick(self):
+        """Tốc độ = chênh lệch bộ đếm giữa 2 lần tick (1 s)."""
+        now = self.hud_snapshot()
+        t0, rx0, tx0, lines0, handle0, handled0, paints0 = self.hud_last
+        t1, rx1, tx1, lines1, handle1, handled1, paints1 = now
+        self.hud_last = now
+        dt = max(t1 - t0, 1e-6)
+        n = handled1 - handled0
+        per_line = (handle1 - handle0) / n * 1e6 if n else 0.0
+
+        mgr = self.serial_manager
+        tx_buf = 0
+        if mgr.is_connected():
+            try:
+                tx_buf = mgr.ser.out_waiting
+            except Exception:
+                pass
+
+        self.hud_label.setText(
+            f"RX {(rx1 - rx0) / dt / 1024:.1f} kB/s · TX {(tx1 - tx0) / dt / 1024:.1f} kB/s · "
+            f"{(lines1 - lines0) / dt:.0f} dòng/s · {per_line:.0f} µs/dòng · "
+            f"plot {(paints1 - paints0) / dt:.0f} fps · "
+            f"ACK chờ {len(self.pending_acks)} · TX buf {tx_buf} B · "
+            f"gộp {self.hud_coalesced} · mất STATUS {self.dropped_frames} / "
+            f"CRC {mgr.bulk_errors} / tràn {mgr.rx_overflow} B · "
+            f"treo {self.stall_watchdog.stalls} (max {self.stall_watchdog.worst_s * 1000:.0f} ms)"
+        )
+
+    # ------------------------------------------------------------------
+    # Watchdog event loop (Tools → Stall Watchdog)
+    # ------------------------------------------------------------------
+    def set_stall_watchdog(self, on: bool):
+        if on:
+            self.stall_watchdog.start()
+            self.stall_timer.start()
+        else:
+            self.stall_timer.stop()
+            self.stall_watchdog.stop()
+
+    def stall_heartbeat(self):
+        self.stall_watchdog.beat()
+        for report in self.stall_watchdog.pop_reports():
+            self.log(f"⚠ GUI treo {report.duration_s * 1000:.0f} ms tại {report.where} "
+                     f"(stack đầy đủ: {STALL_LOG})")
+
+    def closeEvent(self, event):
+        # Ghi nốt chunk cuối + header .npy trước khi thoát
+        self.recorder.stop()
+        self.set_stall_watchdog(False)
+        if self.serial_manager.capture is not None:
+            self.serial_manager.capture.close()
+        super().closeEvent(event)
+
+    def configure_delta_status(self):
+        """Hỏi deadband / chu kỳ keyframe rồi gửi DELTA <deadband> <keyframe_ms> (OFF = tắt)."""
+        text, ok = QInputDialog.getText(
+            self, "Delta STATUS",
+            "DEADBAND KEYFRAME_MS  (VD: 8 2000)\n"
+            "Chỉ gửi kênh thay đổi quá deadband, STATUS đầy đủ mỗi KEYFRAME_MS.\n"
+            "Gửi 'OFF' để luôn nhận STATUS đầy đủ:",
+            text=self.delta_args or "8 2000",
+        )
+        if not ok or not text.strip():
+            return
+        arg = text.strip()
+        # Chỉ nhớ chế độ khi lệnh thực sự đi (reconnect sẽ gửi lại delta_args)
+        if self.send_cmd(f"DELTA {arg}"):
+            self.delta_args = None if arg.upper() == "OFF" else arg
+
+    # ------------------------------------------------------------------
+    # Sự kiện Sensor (EVT)
+    # ------------------------------------------------------------------
+    def handle_sensor_event(self, line: str):
+        """Cập nhật labelS* và ghi log sự kiện (kèm thời gian từ cạnh trước)."""
+        fields = parse_fields(line)
+
+        if "OVF" in fields:
+            self.event_log.appendPlainText(f"!! mất {fields['OVF']} sự kiện (hàng đợi FW đầy)")
+            return
+
+        t_us = int(fields.get("t", "0"))
+        for key, val in fields.items():
+            if not (key.startswith("S") and key[1:].isdigit()):
+                continue
+            idx = int(key[1:])
+
+            lbl = getattr(self, f"labelS{idx}", None)
+            if lbl is not None:
+                lbl.setText(val)
+
+            # micros() 32 bit tràn sau ~71 phút → tính chênh lệch theo modulo
+            prev = self.evt_last_t.get(idx)
+            self.evt_last_t[idx] = t_us
+            dt = "" if prev is None else f"  (+{((t_us - prev) & 0xFFFFFFFF) / 1000:.3f} ms)"
+            edge = "↑" if val == "1" else "↓"
+            self.event_log.appendPlainText(f"{t_us / 1e6:12.6f} s  S{idx} {edge}{dt}")
+
+    def show_event_log(self):
+        self.event_log.show()
+        self.event_log.raise_()
+
+    # ------------------------------------------------------------------
+    # Bộ đếm xung (CNT)
+    # ------------------------------------------------------------------
+    def show_counter_panel(self):
+        self.counter_panel.show()
+        self.counter_panel.raise_()
+
+    def set_counter_stream(self, on: bool):
+        """CounterPanel mở → FW stream CNT mỗi 200 ms; đóng → tắt stream."""
+        self.send_system_cmd(f"CNT STREAM {CounterPanel.STREAM_MS if on else 0}")
+
     # ------------------------------------------------------------------
     # Gửi text cho OLED
     # ------------------------------------------------------------------
     def send_oled1(self):
         text = self.editOled1.text()
         cmd = f"OL1 {text}"
-        self.send_cmd(cmd)
+        if self.send_cmd(cmd):
+            self.oled_fb = None      # FW vẽ lại dòng chữ lên framebuffer
 
     def send_oled2(self):
         text = self.editOled2.text()
         cmd = f"OL2 {text}"
-        self.send_cmd(cmd)
+        if self.send_cmd(cmd):
+            self.oled_fb = None
+
+    # ------------------------------------------------------------------
+    # Framebuffer OLED (FB)
+    # ------------------------------------------------------------------
+    def show_oled_composer(self):
+        self.oled_composer.show()
+        self.oled_composer.raise_()
+
+    def send_oled_fb(self, fb: np.ndarray, full: bool = False) -> int:
+        """
+        Gửi FB <col> <page> <w> <pages> <crc> + dữ liệu, chỉ vùng khác với khung trước.
+        Trả về số byte dữ liệu đã gửi (0 = không có gì thay đổi / chưa kết nối).
+        """
+        if not self.serial_manager.is_connected():
+            self.log("Not connected.")
+            return 0
+
+        rect = fb_dirty_rect(None if full else self.oled_fb, fb)
+        if rect is None:
+            return 0
+        page, col, pages, w = rect
+        payload = fb[page:page + pages, col:col + w].tobytes()
+        header = f"FB {col} {page} {w} {pages} {binascii.crc_hqx(payload, 0xFFFF):04X}"
+
+        try:
+            self.serial_manager.send_line(header)
+            self.serial_manager.send_bytes(payload)
+        except Exception as e:
+            self.log(f"Send error: {e}")
+            self.oled_fb = None
+            return 0
+
+        self.log(f">>> {header} (+{len(payload)} byte)")
+        self.oled_fb = fb.copy()
+        return len(payload)
 
     # ------------------------------------------------------------------
     # Đọc ADS
@@ -723,8 +1830,72 @@ class PSWKitWindow(QMainWindow):
             return
 
         cmd = text_widget.text().strip()
-        if cmd:
-            self.send_cmd( cmd)   # gửi thẳng xuống board, FW sẽ xử lý RS485
+        if not cmd:
+            return
+        # Cùng định dạng (HEX / ASCII) với ô nhập của RS485 Console
+        data = self.rs485_console.encode_input(cmd)
+        if data is None:
+            self.log(f"RS485: dữ liệu HEX không hợp lệ: {cmd}")
+            return
+        self.send_rs485(data)
+
+    # ------------------------------------------------------------------
+    # RS485 passthrough (UART2 của kit)
+    # ------------------------------------------------------------------
+    def show_rs485_console(self):
+        self.rs485_console.show()
+        self.rs485_console.raise_()
+        self.send_system_cmd("RS485")      # đọc cấu hình + bộ đếm hiện tại
+
+    def send_rs485(self, data: bytes) -> bool:
+        """
+        Phát data lên bus RS485 (RS485 TX <hex>). Không qua command_lock:
+        các frame gửi liên tiếp (poll Modbus...) không được phép bị bỏ.
+        """
+        if not self.serial_manager.is_connected():
+            self.log("Not connected.")
+            return False
+        if not data or len(data) > Rs485Console.FRAME_MAX:
+            self.log(f"RS485: frame phải dài 1..{Rs485Console.FRAME_MAX} byte")
+            return False
+        try:
+            self.serial_manager.send_line(f"RS485 TX {data.hex().upper()}")
+        except Exception as e:
+            self.log(f"Send error: {e}")
+            return False
+        self.rs485_console.append_frame("TX", data)
+        return True
+
+    def configure_rs485(self, baud: int, fmt: str):
+        self.send_system_cmd(f"RS485 CFG {baud} {fmt}")
+
+    def show_modbus_panel(self):
+        self.modbus_panel.show()
+        self.modbus_panel.raise_()
+
+    def show_sniffer_panel(self):
+        self.sniffer_panel.show()
+        self.sniffer_panel.raise_()
+
+    def set_rs485_sniff(self, on: bool):
+        """
+        Bật: LINK SNIFF_LINK_BAUD trước (bus 115200 bão hòa không vừa cổng USB 115200),
+        RS485 SNIFF ON được gửi khi nhận OK;LINK=. Tắt: SNIFF OFF rồi trả link về 115200.
+        """
+        if not self.serial_manager.is_connected():
+            self.log("Not connected.")
+            return
+        if on:
+            if self.link_baud == SnifferPanel.LINK_BAUD:
+                self.send_system_cmd("RS485 SNIFF ON")
+            else:
+                self.sniff_after_link = True
+                self.send_system_cmd(f"LINK {SnifferPanel.LINK_BAUD}")
+        else:
+            self.sniff_after_link = False
+            self.send_system_cmd("RS485 SNIFF OFF")
+            if self.link_baud != 115200:
+                self.send_system_cmd("LINK 115200")
 
     # ------------------------------------------------------------------
     # Điều khiển I/O SPARE
@@ -734,9 +1905,17 @@ class PSWKitWindow(QMainWindow):
         state: 0 = unchecked (OFF), 2 = checked (ON)
         """
         on = (state != 0)
-        self.sio_state[idx] = on
         cmd = f"SIO{idx} {'ON' if on else 'OFF'}"
-        self.send_cmd(cmd)
+        if not self.send_cmd(cmd):
+            # Lệnh bị bỏ → trả checkbox về trạng thái cũ (chặn signal để không gửi lại)
+            cb = getattr(self, f"checkSIO{idx}", None)
+            if cb is not None:
+                cb.blockSignals(True)
+                cb.setChecked(self.sio_state[idx])
+                cb.blockSignals(False)
+            return
+        self.sio_state[idx] = on
+        self.expect_ack(f"SIO{idx}={'ON' if on else 'OFF'}")
 
     # ------------------------------------------------------------------
     # Help / API
@@ -751,8 +1930,40 @@ class PSWKitWindow(QMainWindow):
             "  PING            → PONG\n"
             "  INFO            → 'B16M;FW=1.0'\n\n"
             "Đọc trạng thái:\n"
-            "  READ            → STATUS;ADC=A1,A2,A3,A4;S=S1..S16;\n"
-            "  ADS             → ADS;A0=xxxx;A1=yyyy;\n\n"
+            "  READ            → STATUS;ADC=A1,A2,A3,A4;MIN=..;MAX=..;N=n;S=S1..S16;ADS=A0..A3;t=µs;\n"
+            "                    (ADC = mean các mẫu theo timer từ lần READ trước)\n"
+            "  SAMPLE <hz>     → tần số lấy mẫu ADC nội (0 = tắt, max 5000)\n"
+            "  CAP <ch> <n> <rate> → capture N mẫu ADC<ch> (I2S/DMA, 1k–100k Hz)\n"
+            "                    → BIN;TYPE=CAP;...;LEN=..;CRC=..; + LEN byte U16LE\n"
+            "  TRIG <ch> <level> <R|F> <pre%> <n> <rate>\n"
+            "                  → chờ cạnh lên/xuống qua level rồi gửi BIN;TYPE=TRIG;...\n"
+            "  TRIG OFF        → hủy trigger đang chờ\n"
+            "  EVT ON / OFF    → FW tự gửi EVT;S3=1;t=<micros>; khi Sensor đổi mức\n"
+            "  CNT             → CNT;C=c1,..,c4;F=f1,..,f4;t=..; (đếm xung PCNT S1..S4)\n"
+            "  CNT RESET | CNT GATE <ms> | CNT STREAM <ms>\n"
+            "  READ M          → STATUS;ADC=A1,A2,A3,A4;SM=FFFF; (sensor bitmask)\n"
+            "  READ STREAM <ms>→ tự gửi STATUS mỗi <ms> (0 = tắt)\n"
+            "  DELTA <db> <ms> → chỉ gửi kênh thay đổi quá deadband <db>:\n"
+            "                    DST;ADC1=..;S3=1;ADS0=..;t=µs; + STATUS đầy đủ mỗi <ms>\n"
+            "  DELTA OFF       → luôn gửi STATUS đầy đủ\n"
+            "  FB <col> <page> <w> <pages> <crc> + w*pages byte\n"
+            "                  → ghi vùng framebuffer OLED (byte = 8 pixel dọc, CRC-16 hex)\n"
+            "                    → OK;FB=<len>; | ERR;FB_CRC; | ERR;FB_TIMEOUT;\n"
+            "  RS485           → RS485;BAUD=..;FMT=8N1;GAP=µs;RX=..;TX=..;OVF=..;\n"
+            "  RS485 CFG <baud> [8N1|8E1|8O1|8N2] [gap_us]\n"
+            "  RS485 TX <hex>  → phát lên bus (DE bật khi phát), OK;RS485_TX=n; | ERR;RS485_BUSY;\n"
+            "                    RX: BIN;TYPE=RS485;t=µs;LEN=..;CRC=..; + LEN byte\n"
+            "  RS485 SNIFF ON|OFF → ghi mọi burst kèm thời gian: BIN;TYPE=SNIFF;BAUD=..;t=..;\n"
+            "                    payload = [u32 t_us][u16 len][data] ...\n"
+            "  LINK <baud>     → đổi tốc độ cổng USB (115200/230400/460800/921600)\n"
+            "  ADS             → ADS;A0=..;A1=..;A2=..;A3=..; (cache, trả về ngay)\n"
+            "  ADS RATE <sps>  → 8/16/32/64/128/250/475/860\n"
+            "  ADS GAIN <g>    → 2/3, 1, 2, 4, 8, 16\n"
+            "  ADS STREAM <ms> → tự gửi ADS mỗi <ms> (0 = tắt)\n"
+            "  STATE           → STATE;R=000F;SIO=05;LED=1;RGB=r,g,b;\n"
+            "                    (R/SIO: bitmask hex, bit0 = R1/SIO1)\n"
+            "  PERF            → PERF;N=..;LAST=..;AVG=..;MAX=..; (µs)\n"
+            "  PERF RESET      → xóa bộ đếm thời gian xử lý lệnh\n\n"
             "Relay (16 kênh: R1..R16):\n"
             "  R1 ON / R1 OFF\n"
             "  R2 ON / R2 OFF\n"
@@ -780,7 +1991,7 @@ class PSWKitWindow(QMainWindow):
             "Gợi ý test bằng Docklight / terminal:\n"
             "  - Gửi: PING\\r\\n  → nhận: PONG\n"
             "  - Gửi: READ\\r\\n  → nhận: STATUS;...\n"
-            "  - Gửi: ADS\\r\\n   → nhận: ADS;A0=...;A1=...;\n"
+            "  - Gửi: ADS\\r\\n   → nhận: ADS;A0=...;A1=...;A2=...;A3=...;\n"
         )
 
         QMessageBox.information(self, "Help – Serial API", text)
@@ -812,18 +2023,669 @@ class PSWKitWindow(QMainWindow):
 
     def show_about_message(self):
         QMessageBox.information(self, "About", "Ver 7.\nDec-25\nPIC. songhung.tr")
+
+
+class CounterPanel(QWidget):
+    """
+    Cửa sổ bộ đếm xung PCNT: số xung + tần số từng kênh và đồ thị tần số.
+    on_visible(True/False) được gọi khi cửa sổ mở / đóng để bật / tắt stream.
+    """
+    STREAM_MS = 200
+    MAX_POINTS = 600
+
+    def __init__(self, on_visible=None, parent=None):
+        super().__init__(parent)
+        self.on_visible = on_visible
+        self.setWindowTitle("Pulse Counters")
+        self.setWindowIcon(QIcon(resource_path("psw.ico")))
+        self.resize(700, 450)
+
+        layout = QVBoxLayout(self)
+        grid = QGridLayout()
+        layout.addLayout(grid)
+        grid.addWidget(QLabel("Kênh"), 0, 0)
+        grid.addWidget(QLabel("Số xung"), 0, 1)
+        grid.addWidget(QLabel("Tần số (Hz)"), 0, 2)
+
+        self.count_labels = []
+        self.freq_labels = []
+        for i in range(4):
+            grid.addWidget(QLabel(f"S{i + 1}"), i + 1, 0)
+            c = QLabel("-")
+            f = QLabel("-")
+            grid.addWidget(c, i + 1, 1)
+            grid.addWidget(f, i + 1, 2)
+            self.count_labels.append(c)
+            self.freq_labels.append(f)
+
+        self.plot = pg.PlotWidget()
+        self.plot.setLabel("left", "Tần số", units="Hz")
+        self.plot.setLabel("bottom", "Time", units="s")
+        self.plot.showGrid(x=True, y=True)
+        self.plot.addLegend()
+        layout.addWidget(self.plot)
+
+        self.t_data = []
+        self.f_data = [[] for _ in range(4)]
+        self.curves = [
+            self.plot.plot([], [], pen=pg.intColor(i, 4), name=f"S{i + 1}") for i in range(4)
+        ]
+
+    def update_counters(self, counts, freqs, t: float):
+        for i, c in enumerate(counts[:4]):
+            self.count_labels[i].setText(str(c))
+        for i, f in enumerate(freqs[:4]):
+            self.freq_labels[i].setText(f"{f:.2f}")
+
+        if not freqs or not self.isVisible():
+            return
+
+        self.t_data.append(t)
+        for i in range(4):
+            self.f_data[i].append(freqs[i] if i < len(freqs) else 0.0)
+        if len(self.t_data) > self.MAX_POINTS:
+            self.t_data = self.t_data[-self.MAX_POINTS:]
+            self.f_data = [d[-self.MAX_POINTS:] for d in self.f_data]
+
+        for i, curve in enumerate(self.curves):
+            curve.setData(self.t_data, self.f_data[i])
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.on_visible is not None:
+            self.on_visible(True)
+
+    def closeEvent(self, event):
+        if self.on_visible is not None:
+            self.on_visible(False)
+        super().closeEvent(event)
+
+
+class OledComposer(QWidget):
+    """
+    Soạn nội dung OLED 128x64 bằng QImage (text, ảnh, PASS / FAIL) và xem trước.
+    Mỗi khung mới được đưa cho on_frame(fb, full) → cửa sổ chính gửi FB phần thay đổi.
+    """
+    PREVIEW_SCALE = 3
+
+    def __init__(self, on_frame=None, parent=None):
+        super().__init__(parent)
+        self.on_frame = on_frame
+        self.setWindowTitle("OLED Composer")
+        self.setWindowIcon(QIcon(resource_path("psw.ico")))
+
+        layout = QVBoxLayout(self)
+
+        self.preview = QLabel()
+        self.preview.setFixedSize(OLED_WIDTH * self.PREVIEW_SCALE, OLED_HEIGHT * self.PREVIEW_SCALE)
+        self.preview.setStyleSheet("background: black; border: 1px solid gray;")
+        layout.addWidget(self.preview, alignment=Qt.AlignCenter)
+
+        self.edit_text = QLineEdit()
+        self.edit_text.setPlaceholderText("Text (Enter để gửi, \\n = xuống dòng)")
+        self.edit_text.returnPressed.connect(self.render_text)
+        layout.addWidget(self.edit_text)
+
+        buttons = QHBoxLayout()
+        layout.addLayout(buttons)
+        for title, slot in (
+            ("Text", self.render_text),
+            ("PASS", lambda: self.render_result(True)),
+            ("FAIL", lambda: self.render_result(False)),
+            ("Image...", self.load_image),
+            ("Clear", self.clear),
+            ("Send full", lambda: self.emit_frame(full=True)),
+        ):
+            btn = QPushButton(title)
+            btn.clicked.connect(slot)
+            buttons.addWidget(btn)
+
+        self.info = QLabel("-")
+        layout.addWidget(self.info)
+
+        self.image = self.new_image()
+        self.update_preview()
+
+    @staticmethod
+    def new_image() -> QImage:
+        img = QImage(OLED_WIDTH, OLED_HEIGHT, QImage.Format_Grayscale8)
+        img.fill(0)
+        return img
+
+    @staticmethod
+    def mono_font(size: int, bold: bool = False) -> QFont:
+        # Không khử răng cưa: OLED chỉ có 1 bit / pixel
+        font = QFont("Arial", size)
+        font.setBold(bold)
+        font.setStyleStrategy(QFont.NoAntialias)
+        return font
+
+    def render_text(self):
+        img = self.new_image()
+        text = self.edit_text.text().replace("\\n", "\n")
+        lines = max(1, text.count("\n") + 1)
+        painter = QPainter(img)
+        painter.setPen(QColor(255, 255, 255))
+        painter.setFont(self.mono_font(max(8, min(24, 48 // lines))))
+        painter.drawText(img.rect(), Qt.AlignCenter | Qt.TextWordWrap, text)
+        painter.end()
+        self.set_image(img)
+
+    def render_result(self, passed: bool):
+        img = self.new_image()
+        painter = QPainter(img)
+        painter.setPen(QPen(QColor(255, 255, 255), 6))
+        if passed:
+            painter.drawPolyline(QPoint(8, 32), QPoint(22, 48), QPoint(50, 14))
+        else:
+            painter.drawLine(10, 12, 50, 52)
+            painter.drawLine(50, 12, 10, 52)
+        painter.setFont(self.mono_font(20, bold=True))
+        painter.drawText(58, 0, OLED_WIDTH - 58, OLED_HEIGHT, Qt.AlignCenter,
+                         "PASS" if passed else "FAIL")
+        painter.end()
+        self.set_image(img)
+
+    def load_image(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Chọn ảnh", "", "Images (*.png *.bmp *.jpg *.jpeg *.gif)"
+        )
+        if not path:
+            return
+        src = QImage(path)
+        if src.isNull():
+            self.info.setText(f"Không đọc được ảnh: {path}")
+            return
+
+        # Co về 128x64 giữ tỉ lệ, đặt giữa nền đen, rồi dither xuống 1 bit
+        src = src.scaled(OLED_WIDTH, OLED_HEIGHT, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        img = self.new_image()
+        painter = QPainter(img)
+        painter.drawImage((OLED_WIDTH - src.width()) // 2, (OLED_HEIGHT - src.height()) // 2, src)
+        painter.end()
+        self.set_image(img.convertToFormat(QImage.Format_Mono, Qt.DiffuseDither))
+
+    def clear(self):
+        self.set_image(self.new_image())
+
+    def set_image(self, img: QImage):
+        self.image = img.convertToFormat(QImage.Format_Grayscale8)
+        self.update_preview()
+        self.emit_frame()
+
+    def update_preview(self):
+        self.preview.setPixmap(QPixmap.fromImage(self.image).scaled(
+            self.preview.size(), Qt.KeepAspectRatio, Qt.FastTransformation))
+
+    def emit_frame(self, full: bool = False):
+        if self.on_frame is None:
+            return
+        sent = self.on_frame(qimage_to_fb(self.image), full)
+        if sent:
+            self.info.setText(f"Đã gửi {sent} / {OLED_WIDTH * OLED_PAGES} byte")
+        else:
+            self.info.setText("Không có thay đổi (hoặc chưa kết nối)")
+
+
+class Rs485Console(QWidget):
+    """
+    Console RS485: từng frame TX / RX dạng HEX, ASCII hoặc cả hai, kèm khoảng
+    cách giữa các frame RX theo đồng hồ FW. Giữ MAX_FRAMES frame gần nhất để
+    đổi kiểu hiển thị mà không mất dữ liệu.
+    on_send(bytes) → phát lên bus; on_config(baud, fmt) → RS485 CFG.
+    """
+    FRAME_MAX = 256
+    MAX_FRAMES = 5000
+    BAUDS = (1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600)
+    FORMATS = ("8N1", "8E1", "8O1", "8N2")
+
+    def __init__(self, on_send=None, on_config=None, parent=None):
+        super().__init__(parent)
+        self.on_send = on_send
+        self.on_config = on_config
+        self.setWindowTitle("RS485 Console")
+        self.setWindowIcon(QIcon(resource_path("psw.ico")))
+        self.resize(760, 520)
+
+        self.frames = collections.deque(maxlen=self.MAX_FRAMES)  # (dir, data, t_s, gap_ms)
+        self.clock = DeviceClock()
+        self.last_rx_t = None
+        self.last_ovf = 0
+
+        layout = QVBoxLayout(self)
+
+        cfg = QHBoxLayout()
+        layout.addLayout(cfg)
+        self.combo_baud = QComboBox()
+        self.combo_baud.addItems([str(b) for b in self.BAUDS])
+        self.combo_baud.setCurrentText("9600")
+        self.combo_fmt = QComboBox()
+        self.combo_fmt.addItems(self.FORMATS)
+        btn_apply = QPushButton("Apply")
+        btn_apply.clicked.connect(self.apply_config)
+        self.combo_view = QComboBox()
+        self.combo_view.addItems(["HEX", "ASCII", "HEX + ASCII"])
+        self.combo_view.setCurrentText("HEX + ASCII")
+        self.combo_view.currentTextChanged.connect(self.rerender)
+        btn_clear = QPushButton("Clear")
+        btn_clear.clicked.connect(self.clear)
+        for w in (QLabel("Baud"), self.combo_baud, self.combo_fmt, btn_apply,
+                  QLabel("Hiển thị"), self.combo_view, btn_clear):
+            cfg.addWidget(w)
+        cfg.addStretch(1)
+
+        self.view = QPlainTextEdit()
+        self.view.setReadOnly(True)
+        self.view.setMaximumBlockCount(self.MAX_FRAMES)
+        self.view.setFont(QFont("Consolas", 9))
+        layout.addWidget(self.view)
+
+        send = QHBoxLayout()
+        layout.addLayout(send)
+        self.edit_tx = QLineEdit()
+        self.edit_tx.setPlaceholderText("HEX: 01 03 00 00 00 02 C4 0B   |   ASCII: text")
+        self.edit_tx.returnPressed.connect(self.send_input)
+        self.combo_tx = QComboBox()
+        self.combo_tx.addItems(["HEX", "ASCII"])
+        self.check_crlf = QCheckBox("+CR/LF")
+        btn_send = QPushButton("Send")
+        btn_send.clicked.connect(self.send_input)
+        for w in (self.edit_tx, self.combo_tx, self.check_crlf, btn_send):
+            send.addWidget(w)
+
+        self.info = QLabel("-")
+        layout.addWidget(self.info)
+
+    # ----- Gửi -----
+    def encode_input(self, text: str):
+        """Text ô nhập → bytes theo chế độ HEX / ASCII; HEX sai định dạng → None."""
+        if self.combo_tx.currentText() == "HEX":
+            try:
+                data = bytes.fromhex(text.replace(",", " "))
+            except ValueError:
+                return None
+        else:
+            data = text.encode("latin-1", errors="replace")
+        if self.check_crlf.isChecked():
+            data += b"\r\n"
+        return data
+
+    def send_input(self):
+        text = self.edit_tx.text().strip()
+        if not text or self.on_send is None:
+            return
+        data = self.encode_input(text)
+        if data is None:
+            self.info.setText(f"HEX không hợp lệ: {text}")
+            return
+        self.on_send(data)
+
+    def apply_config(self):
+        if self.on_config is not None:
+            self.on_config(int(self.combo_baud.currentText()), self.combo_fmt.currentText())
+        # Cấu hình mới → khung thời gian RX cũ không còn so sánh được
+        self.last_rx_t = None
+
+    # ----- Nhận / hiển thị -----
+    def append_frame(self, direction: str, data: bytes, t_us=None, ovf: int = 0):
+        t = gap_ms = None
+        if t_us is not None:
+            t = self.clock.seconds(t_us)
+            if self.last_rx_t is not None:
+                gap_ms = (t - self.last_rx_t) * 1e3
+            self.last_rx_t = t
+
+        if ovf > self.last_ovf:
+            self.view.appendPlainText(f"!! FW bỏ {ovf - self.last_ovf} byte RS485 (PC đọc không kịp)")
+            self.last_ovf = ovf
+
+        frame = (direction, bytes(data), t, gap_ms)
+        self.frames.append(frame)
+        # Đang ẩn (VD chỉ chạy Modbus poll): chỉ giữ frame, vẽ lại khi mở cửa sổ
+        if self.isVisible():
+            self.view.appendPlainText(self.format_frame(frame))
+
+    def format_frame(self, frame) -> str:
+        direction, data, t, gap_ms = frame
+        stamp = f"{t:10.4f}" if t is not None else " " * 10
+        gap = f"+{gap_ms:8.1f} ms" if gap_ms is not None else " " * 12
+        mode = self.combo_view.currentText()
+        parts = []
+        if mode != "ASCII":
+            parts.append(data.hex(" ").upper())
+        if mode != "HEX":
+            parts.append("".join(chr(b) if 32 <= b < 127 else "." for b in data))
+        return f"{stamp} {gap} {direction} {len(data):3d}B  " + "  |  ".join(parts)
+
+    def rerender(self, *_):
+        self.view.setPlainText("\n".join(self.format_frame(f) for f in self.frames))
+        self.view.moveCursor(QTextCursor.End)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.rerender()
+
+    def clear(self):
+        self.frames.clear()
+        self.view.clear()
+        self.clock.reset()
+        self.last_rx_t = None
+
+    def update_status(self, fields: dict):
+        if "BAUD" in fields:
+            self.combo_baud.setCurrentText(fields["BAUD"])
+        if "FMT" in fields:
+            self.combo_fmt.setCurrentText(fields["FMT"])
+        self.last_ovf = max(self.last_ovf, int(fields.get("OVF", "0")))
+        self.info.setText(
+            f"FW: RX {fields.get('RX', '?')} B, TX {fields.get('TX', '?')} B, "
+            f"mất {fields.get('OVF', '0')} B, gap {fields.get('GAP', '?')} µs"
+        )
+
+
+class ModbusPanel(QWidget):
+    """
+    Modbus RTU master: nạp register map (JSON), poll đa tần số qua RS485 của kit
+    (hoặc ModbusSlaveSim khi tick "Slave giả lập") và hiện bảng giá trị live.
+    """
+    POLL_MS = 5          # nhịp gọi master.poll (timeout / lịch poll)
+    TABLE_MS = 200       # làm mới bảng (không vẽ lại mỗi response)
+    COLUMNS = ("Name", "Unit", "Func", "Addr", "Type", "Period (ms)", "Value", "Age (ms)", "Errors")
+
+    def __init__(self, send_rs485=None, parent=None):
+        super().__init__(parent)
+        self.send_rs485 = send_rs485
+        self.setWindowTitle("Modbus RTU Master")
+        self.setWindowIcon(QIcon(resource_path("psw.ico")))
+        self.resize(820, 480)
+
+        self.sim = modbus_rtu.ModbusSlaveSim(unit=1)
+        self.master = modbus_rtu.ModbusMaster(self._send_frame)
+        self.regs = []
+
+        layout = QVBoxLayout(self)
+        bar = QHBoxLayout()
+        layout.addLayout(bar)
+        btn_load = QPushButton("Load map...")
+        btn_load.clicked.connect(self.load_map)
+        self.btn_run = QPushButton("Start")
+        self.btn_run.setCheckable(True)
+        self.btn_run.toggled.connect(self.set_running)
+        btn_write = QPushButton("Write...")
+        btn_write.clicked.connect(self.write_register)
+        self.check_sim = QCheckBox("Slave giả lập")
+        self.check_sim.setToolTip("Không gửi ra RS485: request được trả lời bởi ModbusSlaveSim (unit 1)")
+        for w in (btn_load, self.btn_run, btn_write, self.check_sim):
+            bar.addWidget(w)
+        bar.addStretch(1)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        self.info = QLabel("-")
+        layout.addWidget(self.info)
+
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(self.POLL_MS)
+        self.poll_timer.timeout.connect(lambda: self.master.poll(time.monotonic()))
+        self.table_timer = QTimer(self)
+        self.table_timer.setInterval(self.TABLE_MS)
+        self.table_timer.timeout.connect(self.refresh_table)
+
+        self.set_registers(modbus_rtu.demo_register_map())
+
+    def set_registers(self, regs):
+        self.regs = regs
+        self.master.set_registers(regs)
+        self.master.reset_stats()
+        self.table.setRowCount(len(regs))
+        for row, r in enumerate(regs):
+            for col, text in enumerate((r.name, r.unit, r.func, r.addr, r.type, r.period_ms)):
+                self.table.setItem(row, col, QTableWidgetItem(str(text)))
+            for col in range(6, len(self.COLUMNS)):
+                self.table.setItem(row, col, QTableWidgetItem("-"))
+        self.info.setText(f"{len(regs)} điểm → {len(self.master.blocks)} request / vòng poll")
+
+    def load_map(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Register map", "", "JSON (*.json)")
+        if not path:
+            return
+        try:
+            self.set_registers(modbus_rtu.load_register_map(path))
+        except Exception as e:
+            QMessageBox.warning(self, "Register map", f"Không đọc được {path}:\n{e}")
+
+    def set_running(self, on: bool):
+        self.btn_run.setText("Stop" if on else "Start")
+        if on:
+            self.master.set_registers(self.regs)     # lịch poll bắt đầu lại từ bây giờ
+            self.poll_timer.start()
+            self.table_timer.start()
+        else:
+            self.poll_timer.stop()
+            self.table_timer.stop()
+            self.refresh_table()
+
+    def write_register(self):
+        text, ok = QInputDialog.getText(self, "Modbus write (06)", "UNIT ADDR VALUE  (VD: 1 0 1234):")
+        if not ok or not text.strip():
+            return
+        try:
+            unit, addr, value = (int(x, 0) for x in text.split())
+        except ValueError:
+            self.info.setText(f"Sai định dạng: {text}")
+            return
+        self.master.write_register(unit, addr, value)
+        if not self.poll_timer.isActive():
+            self.master.poll(time.monotonic())
+
+    def _send_frame(self, frame: bytes):
+        if self.check_sim.isChecked():
+            reply = self.sim.handle(frame)
+            if reply is not None:
+                # Trả lời ở lượt event loop sau, giống dữ liệu đến từ serial
+                QTimer.singleShot(0, lambda: self.master.feed(reply))
+            return
+        if self.send_rs485 is not None:
+            self.send_rs485(frame)
+
+    def feed(self, data: bytes):
+        """Frame RX từ kit (BIN;TYPE=RS485;)."""
+        if not self.check_sim.isChecked():
+            self.master.feed(data)
+
+    def refresh_table(self):
+        now = time.monotonic()
+        for row, r in enumerate(self.regs):
+            value = "-" if r.value is None else (f"{r.value:.4g}" if isinstance(r.value, float) else str(r.value))
+            age = "-" if r.updated is None else f"{(now - r.updated) * 1000:.0f}"
+            for col, text in ((6, value), (7, age), (8, str(r.errors))):
+                self.table.item(row, col).setText(text)
+
+        st = self.master.stats
+        self.info.setText(
+            f"{len(self.regs)} điểm / {len(self.master.blocks)} request  |  "
+            f"req {st['req']}  ok {st['ok']}  timeout {st['timeout']}  "
+            f"CRC {st['crc']}  exception {st['exception']}"
+        )
+
+    def closeEvent(self, event):
+        self.btn_run.setChecked(False)
+        super().closeEvent(event)
+
+
+class SnifferPanel(QWidget):
+    """
+    RS485 Bus Analyzer: nhận khối SNIFF, ghép frame theo khoảng lặng, giải mã
+    Modbus / RAW, hiện khoảng cách giữa frame và % chiếm bus theo thời gian.
+    Việc nhận (feed) chỉ ghi ring + ghép frame; vẽ UI theo REFRESH_MS.
+    """
+    LINK_BAUD = 921600
+    REFRESH_MS = 200
+    MAX_LINES = 5000
+    UTIL_POINTS = 600       # 2 phút lịch sử % chiếm bus với REFRESH_MS = 200
+
+    def __init__(self, on_run=None, parent=None):
+        super().__init__(parent)
+        self.on_run = on_run
+        self.setWindowTitle("RS485 Bus Analyzer")
+        self.setWindowIcon(QIcon(resource_path("psw.ico")))
+        self.resize(900, 600)
+
+        self.analyzer = rs485_sniffer.BusAnalyzer()
+        self.t0_us = None
+
+        layout = QVBoxLayout(self)
+        bar = QHBoxLayout()
+        layout.addLayout(bar)
+        self.btn_run = QPushButton("Start")
+        self.btn_run.setCheckable(True)
+        self.btn_run.toggled.connect(self._on_toggled)
+        btn_save = QPushButton("Save...")
+        btn_save.clicked.connect(self.save_capture)
+        btn_clear = QPushButton("Clear")
+        btn_clear.clicked.connect(self.clear)
+        for w in (self.btn_run, btn_save, btn_clear):
+            bar.addWidget(w)
+        self.info = QLabel("-")
+        bar.addWidget(self.info, 1)
+
+        self.view = QPlainTextEdit()
+        self.view.setReadOnly(True)
+        self.view.setMaximumBlockCount(self.MAX_LINES)
+        self.view.setFont(QFont("Consolas", 9))
+        layout.addWidget(self.view, 3)
+
+        self.plot = pg.PlotWidget()
+        self.plot.setLabel("left", "Bus", units="%")
+        self.plot.setLabel("bottom", "Time", units="s")
+        self.plot.setYRange(0, 100)
+        self.plot.showGrid(x=True, y=True)
+        layout.addWidget(self.plot, 1)
+        self.util_t = collections.deque(maxlen=self.UTIL_POINTS)
+        self.util_v = collections.deque(maxlen=self.UTIL_POINTS)
+        self.util_curve = self.plot.plot([], [], pen="c")
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(self.REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def _on_toggled(self, on: bool):
+        self.btn_run.setText("Stop" if on else "Start")
+        if on:
+            self.refresh_timer.start()
+        else:
+            self.refresh_timer.stop()
+            self.refresh()
+        if self.on_run is not None:
+            self.on_run(on)
+
+    def set_running(self, on: bool):
+        """Đổi trạng thái nút mà không gửi lệnh (VD khi disconnect)."""
+        self.btn_run.blockSignals(True)
+        self.btn_run.setChecked(on)
+        self.btn_run.blockSignals(False)
+        self.btn_run.setText("Stop" if on else "Start")
+        if not on:
+            self.refresh_timer.stop()
+
+    def feed(self, payload: bytes, header: dict):
+        self.analyzer.feed_payload(
+            payload,
+            baud=int(header.get("BAUD", "0")) or None,
+            ovf=int(header.get("OVF", "0")),
+            t_us=int(header["t"]) if "t" in header else None,
+        )
+
+    def refresh(self):
+        a = self.analyzer
+        frames, a.frames = a.frames, []
+        if frames:
+            if self.t0_us is None:
+                self.t0_us = frames[0][0]
+            lines = []
+            for t_start, t_end, gap, data in frames:
+                gap_txt = f"{gap / 1000:9.2f}" if gap is not None else " " * 9
+                hex_txt = data[:24].hex(" ").upper() + (" …" if len(data) > 24 else "")
+                lines.append(
+                    f"{(t_start - self.t0_us) / 1e6:11.4f} s  gap {gap_txt} ms  {len(data):4d}B  "
+                    f"{rs485_sniffer.describe_frame(data):44s} {hex_txt}"
+                )
+            self.view.appendPlainText("\n".join(lines))
+
+        util = a.utilization() * 100
+        if a.now_us is not None and self.t0_us is not None:
+            self.util_t.append((a.now_us - self.t0_us) / 1e6)
+            self.util_v.append(util)
+            self.util_curve.setData(list(self.util_t), list(self.util_v))
+        self.info.setText(
+            f"{a.baud} baud  |  {a.total_frames} frame, {a.total_bytes} byte  |  "
+            f"bus {util:.1f} %  |  FW mất {a.overflow} byte"
+        )
+
+    def save_capture(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Lưu capture RS485", f"rs485_{self.analyzer.baud}.bin", "Sniff capture (*.bin)"
+        )
+        if path:
+            with open(path, "wb") as f:
+                f.write(self.analyzer.ring.to_bytes())
+
+    def clear(self):
+        self.analyzer.reset()
+        self.t0_us = None
+        self.view.clear()
+        self.util_t.clear()
+        self.util_v.clear()
+        self.util_curve.setData([], [])
+
+    def closeEvent(self, event):
+        if self.btn_run.isChecked():
+            self.btn_run.setChecked(False)
+        super().closeEvent(event)
+
+
 class SerialManager:
     """
     Lớp chuyên quản lý Serial: connect / disconnect / send / poll.
     Dùng callback để trả dữ liệu từng dòng về cho UI.
     """
-    def __init__(self, line_callback=None):
+    # Giới hạn buffer nhận khi không thấy '\n' (rác / mất đồng bộ)
+    MAX_RX_BUFFER = 64 * 1024
+
+    def __init__(self, line_callback=None, bulk_callback=None):
         self.ser = None
         self.line_callback = line_callback
+        # bulk_callback(header: dict, payload: bytes) cho khối BIN;...;LEN=n;
+        self.bulk_callback = bulk_callback
+
+        # serial_capture.CaptureWriter khi đang ghi byte thô (Tools → Capture Serial Bytes)
+        self.capture = None
+
+        # Bộ đếm cho Performance HUD (chỉ cộng số nguyên, để bật luôn được)
+        self.rx_bytes = 0
+        self.tx_bytes = 0
+        self.rx_lines = 0
+        self.rx_overflow = 0             # byte bỏ khi buffer nhận tràn (không thấy '\n')
+        self.bulk_errors = 0             # khối BIN sai CRC
+
+        # Byte đã nhận nhưng chưa tách xong dòng / khối BIN
+        self._rx = bytearray()
+        self._bulk_header = None
+        self._bulk_len = 0
+
+    def _reset_rx(self):
+        self._rx.clear()
+        self._bulk_header = None
+        self._bulk_len = 0
 
     def list_ports(self):
-        """Trả về danh sách tên cổng COM (string)."""
-        return [p.device for p in serial.tools.list_ports.comports()]
+        """Trả về danh sách tên cổng COM (string), kèm kit giả lập đang chạy (nếu có)."""
+        ports = [p.device for p in serial.tools.list_ports.comports()]
+        return ports + sorted(p for p in glob.glob(EMULATOR_PORT_GLOB) if os.path.exists(p))
 
     def is_connected(self) -> bool:
         return self.ser is not None and self.ser.is_open
@@ -840,8 +2702,14 @@ class SerialManager:
                 pass
             self.ser = None
 
+        self._reset_rx()
         try:
-            self.ser = serial.Serial(port, baudrate, timeout=timeout)
+            if port.startswith(serial_capture.REPLAY_PREFIX):
+                # "replay:<file.cap>[@speed]" → phát lại file capture thay cho cổng thật
+                path, speed = serial_capture.parse_replay_port(port)
+                self.ser = serial_capture.ReplaySerial(path, speed)
+            else:
+                self.ser = serial.Serial(port, baudrate, timeout=timeout)
             return True, None
         except Exception as e:
             self.ser = None
@@ -849,6 +2717,7 @@ class SerialManager:
 
     def disconnect(self):
         """Đóng cổng serial nếu đang mở."""
+        self._reset_rx()
         if self.ser is not None:
             try:
                 self.ser.close()
@@ -865,31 +2734,49 @@ class SerialManager:
             raise RuntimeError("Not connected")
         line = (cmd + "\n").encode("utf-8")
         self.ser.write(line)
+        self.tx_bytes += len(line)
+        if self.capture is not None:
+            self.capture.write(serial_capture.TX, line)
+
+    def set_baudrate(self, baud: int):
+        """Đổi tốc độ cổng đang mở (sau OK;LINK=...)."""
+        if self.is_connected():
+            self.ser.baudrate = baud
+
+    def flush(self):
+        """Chờ dữ liệu đã ghi ra hết cổng (VD trước khi đóng)."""
+        if self.is_connected():
+            try:
+                self.ser.flush()
+            except Exception:
+                pass
+
+    def send_bytes(self, data: bytes):
+        """Gửi dữ liệu nhị phân thô (sau header FB ...). Ném RuntimeError nếu chưa kết nối."""
+        if not self.is_connected():
+            raise RuntimeError("Not connected")
+        self.ser.write(data)
+        self.tx_bytes += len(data)
+        if self.capture is not None:
+            self.capture.write(serial_capture.TX, data)
 
     def poll(self):
         """
         Đọc tất cả dữ liệu đang có trong buffer và gọi line_callback
-        cho từng dòng (đã decode, strip).
+        cho từng dòng (đã decode, strip), bulk_callback cho từng khối BIN.
         """
         if not self.is_connected():
             return
 
         try:
-            while self.ser.in_waiting > 0:
-                raw = self.ser.readline()
-                if not raw:
-                    break
-
-                try:
-                    line = raw.decode("utf-8", errors="ignore").strip()
-                except UnicodeDecodeError:
-                    continue
-
-                if not line:
-                    continue
-
-                if self.line_callback is not None:
-                    self.line_callback(line)
+            waiting = self.ser.in_waiting
+            if waiting > 0:
+                data = self.ser.read(waiting)
+                self.rx_bytes += len(data)
+                if self.capture is not None:
+                    self.capture.write(serial_capture.RX, data)
+                self._rx.extend(data)
+            self._drain_rx()
         except Exception as e:
             # Báo cho UI biết là có lỗi serial,
             # và coi như đã bị mất kết nối.
@@ -899,10 +2786,74 @@ class SerialManager:
             # Đóng cổng luôn cho chắc
             self.disconnect()
 
+    def _drain_rx(self):
+        """Tách self._rx thành các dòng text và khối BIN (header + LEN byte)."""
+        while True:
+            # Đang chờ đủ dữ liệu của 1 khối BIN
+            if self._bulk_header is not None:
+                if len(self._rx) < self._bulk_len:
+                    return
+                payload = bytes(self._rx[:self._bulk_len])
+                del self._rx[:self._bulk_len]
+                header = self._bulk_header
+                self._bulk_header = None
+                self._deliver_bulk(header, payload)
+                continue
+
+            idx = self._rx.find(b"\n")
+            if idx < 0:
+                if len(self._rx) > self.MAX_RX_BUFFER:
+                    self.rx_overflow += len(self._rx)
+                    self._rx.clear()
+                return
+
+            raw = bytes(self._rx[:idx])
+            del self._rx[:idx + 1]
+
+            line = raw.decode("utf-8", errors="ignore").strip()
+            if not line:
+                continue
+
+            # BIN;...;LEN=n;CRC=xxxx;  → n byte nhị phân theo ngay sau
+            if line.startswith("BIN;"):
+                header = parse_fields(line)
+                try:
+                    self._bulk_len = int(header.get("LEN", ""))
+                except ValueError:
+                    self._bulk_len = -1
+                if self._bulk_len >= 0:
+                    self._bulk_header = header
+                    continue
+
+            self.rx_lines += 1
+            if self.line_callback is not None:
+                self.line_callback(line)
+
+    def _deliver_bulk(self, header: dict, payload: bytes):
+        """Kiểm tra CRC-16/CCITT (init 0xFFFF) rồi chuyển khối BIN cho UI."""
+        crc = header.get("CRC")
+        if crc is not None:
+            try:
+                expected = int(crc, 16)
+            except ValueError:
+                expected = -1
+            if binascii.crc_hqx(payload, 0xFFFF) != expected:
+                self.bulk_errors += 1
+                if self.line_callback is not None:
+                    self.line_callback(
+                        f"!BULK_ERROR: CRC mismatch TYPE={header.get('TYPE', '')} LEN={len(payload)}"
+                    )
+                return
+
+        if self.bulk_callback is not None:
+            self.bulk_callback(header, payload)
+
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     win = PSWKitWindow()
     win.setWindowTitle("ESP32 KIT Tester (Dashboard)")
     win.show()
+    # Bật sẵn để bắt được cả những lần treo operator báo lại
+    QTimer.singleShot(0, lambda: win.actionStall.setChecked(True))
     sys.exit(app.exec_())